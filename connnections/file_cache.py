@@ -0,0 +1,141 @@
+import hashlib
+import io
+import mmap
+import os
+import threading
+import uuid
+from typing import BinaryIO, Optional
+
+
+class DriveFileCache:
+    """A size bounded on-disk cache for files downloaded from google drive.
+    Entries are keyed by the drive file id plus the md5Checksum/modifiedTime of the
+    file, so an entry can only be hit while the file on drive is unchanged.
+    When the cache grows past max_bytes the least recently read entries are removed.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        Args:
+            cache_dir (str): Directory the cached file bodies are stored in
+            max_bytes (int): Size the cache is trimmed down to after every write
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def cache_key(file_id: str, metadata: dict) -> str:
+        """Builds the cache key of a file from its drive metadata.
+
+        Args:
+            file_id (str): The alphanumeric id of the file
+            metadata (dict): Drive metadata containing md5Checksum and/or modifiedTime
+
+        Returns:
+            str: key that is unique to this version of the file
+        """
+        version = metadata.get("md5Checksum") or metadata.get("modifiedTime", "")
+        return f"{file_id}-{hashlib.sha1(version.encode()).hexdigest()[:16]}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def temp_path(self, key: str) -> str:
+        """Path a new entry is written to before being committed into the cache.
+
+        Args:
+            key (str): key as generated by cache_key
+
+        Returns:
+            str: temporary path unique to this write
+        """
+        return f"{self._path(key)}.{uuid.uuid4().hex}.tmp"
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """Opens a cached file as a read only memory map so the OS pages it in lazily
+        instead of copying it into python memory.
+
+        Args:
+            key (str): key as generated by cache_key
+
+        Returns:
+            Optional[BinaryIO]: file like object of the cached body, None on a cache miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cached_file:
+                # touching the entry marks it as recently used for eviction
+                os.utime(path)
+                if not os.fstat(cached_file.fileno()).st_size:
+                    return io.BytesIO()
+                return mmap.mmap(  # type: ignore
+                    cached_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        """Stores a downloaded file body, replacing older versions of the same file.
+
+        Args:
+            key (str): key as generated by cache_key
+            data (bytes): The raw file body
+        """
+        temp_path = self.temp_path(key)
+        with open(temp_path, "wb") as temp_file:
+            temp_file.write(data)
+        self.commit(key, temp_path)
+
+    def commit(self, key: str, temp_path: str) -> None:
+        """Atomically moves a fully written temporary file into the cache and
+        trims the cache back down to max_bytes.
+
+        Args:
+            key (str): key as generated by cache_key
+            temp_path (str): path of the fully written file body
+        """
+        os.replace(temp_path, self._path(key))
+        file_id = key.rsplit("-", 1)[0]
+        # the lock only covers this instance, other instances and processes (the
+        # pipelines, the dashboard) share cache_dir and may remove an entry first
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if (
+                    entry.name != key
+                    and entry.name.rsplit("-", 1)[0] == file_id
+                    and not entry.name.endswith(".tmp")
+                ):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+            self.evict()
+
+    def _get_entry_stats(self) -> list[tuple[str, os.stat_result]]:
+        entry_stats = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                entry_stats.append((entry.path, entry.stat()))
+            except FileNotFoundError:
+                # removed by another instance since the directory was listed
+                continue
+        return entry_stats
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in max_bytes"""
+        entries_by_age = sorted(
+            self._get_entry_stats(), key=lambda path_stat: path_stat[1].st_mtime
+        )
+        total_bytes = sum(stat.st_size for _, stat in entries_by_age)
+        for path, stat in entries_by_age:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total_bytes -= stat.st_size
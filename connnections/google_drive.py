@@ -1,16 +1,25 @@
 import io
+import json
+import mmap
 import os.path
-from typing import Optional, TypedDict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Literal, Optional, TypedDict
 
+import httplib2
 import streamlit as st
 from google.auth.transport.requests import Request
 from google.oauth2 import service_account
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from googleapiclient.http import HttpRequest, MediaIoBaseDownload, MediaIoBaseUpload
 
+from connnections.file_cache import DriveFileCache
+from connnections.streams import DriveDownloadStream, IterableMediaUpload
 from connnections.utilities import check_if_ec2
 
 
@@ -19,6 +28,17 @@ class GoogleDriveFileListTypedDict(TypedDict):
     name: str  # human name of the file as saved by user
 
 
+class GoogleDriveFileMetadataTypedDict(GoogleDriveFileListTypedDict, total=False):
+    md5Checksum: str  # md5 of the file contents, missing for google docs
+    modifiedTime: str  # RFC 3339 timestamp of the last modification
+    size: str  # size of the file contents in bytes
+
+
+# how a DriveService was authorized, "authorized_user" with the token json or
+# "service_account" with the path of the key file, see DriveService.__init__
+WorkerCredentials = tuple[Literal["authorized_user", "service_account"], str]
+
+
 @st.cache_resource
 class DriveService:
     """A Class created to make it easier to call different methods of the google drive API
@@ -35,14 +55,39 @@ class DriveService:
     ]
     secrets_dir = ".secrets/"
     token_dir = f"{secrets_dir}token.json"
+    # downloaded files are kept here and revalidated against drive metadata
+    cache_dir = ".cache/drive/"
+    cache_max_bytes = 10 * 1024**3
+    # bytes downloaded per request when streaming, bounds memory used by open_file
+    stream_chunksize = 8 * 1024**2
+    # large files can be split into byte ranges that are downloaded concurrently
+    ranged_download_chunksize = 32 * 1024**2
+    ranged_download_max_workers = 8
+    ranged_download_num_retries = 3
+    upload_chunksize = 8 * 1024**2
+    upload_num_retries = 5
+    metadata_fields = "id, name, md5Checksum, modifiedTime, size"
+    # set by the authorization, lets worker processes connect without logging in
+    worker_credentials: WorkerCredentials
 
-    def __init__(self):
+    def __init__(self, worker_credentials: Optional[WorkerCredentials] = None):
         """Uses OAuth2 to handle connections and credentials
         reference documenation: https://developers.google.com/drive/api/quickstart/python
         https://google-auth-oauthlib.readthedocs.io/en/latest/reference/google_auth_oauthlib.flow.html
+
+        Args:
+            worker_credentials (Optional[WorkerCredentials], optional): the
+            worker_credentials of the DriveService of a parent process.  Worker
+            processes are authorized with them instead of probing for ec2 and running
+            the login flow. Defaults to authorizing this process.
         """
         print("initializng client")
-        if (ec2 := check_if_ec2()) and os.path.exists(self.token_dir):
+        # httplib2 connections are not thread safe so every thread gets its own
+        self._thread_local = threading.local()
+        self.file_cache = DriveFileCache(self.cache_dir, self.cache_max_bytes)
+        if worker_credentials is not None:
+            self.worker_credentials_call(worker_credentials)
+        elif (ec2 := check_if_ec2()) and os.path.exists(self.token_dir):
             try:
                 self.oob_method()
             except Exception as e:
@@ -74,6 +119,8 @@ class DriveService:
             with open("token.json", "w") as token:
                 token.write(creds.to_json())
 
+        self.creds = creds
+        self.worker_credentials = ("authorized_user", creds.to_json())
         self.service = build("drive", "v3", credentials=creds)
 
     def service_account_call(self):
@@ -83,8 +130,23 @@ class DriveService:
         credentials = service_account.Credentials.from_service_account_file(
             json_keyfile, scopes=["https://www.googleapis.com/auth/drive"]
         )
+        self.creds = credentials
+        self.worker_credentials = ("service_account", json_keyfile)
         self.service = build("drive", "v3", credentials=credentials)
 
+    def worker_credentials_call(self, worker_credentials: WorkerCredentials):
+        kind, credentials_info = worker_credentials
+        if kind == "service_account":
+            self.creds = service_account.Credentials.from_service_account_file(
+                credentials_info, scopes=["https://www.googleapis.com/auth/drive"]
+            )
+        else:
+            self.creds = Credentials.from_authorized_user_info(
+                json.loads(credentials_info), self.scopes
+            )
+        self.worker_credentials = worker_credentials
+        self.service = build("drive", "v3", credentials=self.creds)
+
     def oob_method(self):
         self.creds = None
         # The file token.json stores the user's access and refresh tokens, and is
@@ -112,8 +174,22 @@ class DriveService:
                 # Save the credentials for the next run
                 with open(self.token_dir, "w") as token:
                     token.write(flow.credentials.to_json())
+        self.worker_credentials = ("authorized_user", self.creds.to_json())
         self.service = build("drive", "v3", credentials=self.creds)
 
+    def _get_thread_http(self) -> AuthorizedHttp:
+        """Returns an authorized http connection owned by the calling thread so that
+        downloads can run concurrently from a thread pool.
+
+        Returns:
+            AuthorizedHttp: http object authorized with the service credentials
+        """
+        http = getattr(self._thread_local, "http", None)
+        if http is None:
+            http = AuthorizedHttp(self.creds, http=httplib2.Http())
+            self._thread_local.http = http
+        return http
+
     def list_files(self, **kwargs) -> Optional[list[GoogleDriveFileListTypedDict]]:
         """
         Lists files in drive.  Pass in arguments as specified in
@@ -155,7 +231,39 @@ class DriveService:
             # TODO(developer) - Handle errors from drive API.
             print(f"An error occurred: {error} using the following arguments {kwargs}")
 
-    def get_file(self, file_id: str, shared_drive: bool = True, **kwargs) -> bytes:
+    def get_file_metadata(
+        self, file_id: str, shared_drive: bool = True
+    ) -> GoogleDriveFileMetadataTypedDict:
+        """Gets the metadata of a file without downloading its contents.
+
+        Args:
+            file_id (str): The alphanumeric id for each file
+            shared_drive (bool, optional): Whether to include all drives associated
+            with the account. Defaults to True.
+
+        Raises:
+            ValueError: Incase of error
+
+        Returns:
+            GoogleDriveFileMetadataTypedDict: id, name, md5Checksum, modifiedTime and size
+        """
+        try:
+            return (
+                self.service.files()
+                .get(
+                    fileId=file_id,
+                    supportsAllDrives=shared_drive,
+                    fields=self.metadata_fields,
+                )
+                .execute(http=self._get_thread_http())
+            )
+        except HttpError as error:
+            print(f"An error occurred: {error}")
+            raise ValueError(f"Unable to proceed due to error {error}")
+
+    def get_file(
+        self, file_id: str, shared_drive: bool = True, use_cache: bool = True, **kwargs
+    ) -> bytes:
         """Downloads a file based on the file_id passed in.  You can get the file id
         by right clicking the file clicking share and getting the id from the end of the url.
         More documentation can be found here:
@@ -165,6 +273,8 @@ class DriveService:
             file_id (str): The alphanumeric id for each file
             shared_drive (bool, optional): Whether to include all drives associated
             with the account. Defaults to True.
+            use_cache (bool, optional): Whether to serve unchanged files from the local
+            disk cache, costing one metadata call instead of a download. Defaults to True.
 
         Raises:
             ValueError: Incase of error
@@ -172,6 +282,191 @@ class DriveService:
         Returns:
             bytes: The raw format of the downloaded file.  Use BytesIO to help decrypt.
         """
+        cache_key = None
+        if use_cache and not kwargs:
+            cache_key = self.file_cache.cache_key(
+                file_id, self.get_file_metadata(file_id, shared_drive)
+            )
+            if (cached_file := self.file_cache.open(cache_key)) is not None:
+                print(f"Using cached copy of {file_id}")
+                with cached_file:
+                    return cached_file.read()
+        file = self._download_file(file_id, shared_drive, **kwargs)
+        if cache_key is not None:
+            self.file_cache.put(cache_key, file)
+        return file
+
+    def open_file(
+        self, file_id: str, shared_drive: bool = True, use_cache: bool = True, **kwargs
+    ) -> BinaryIO:
+        """Streaming variant of get_file.  Returns a readable file object that downloads
+        the file in chunks of stream_chunksize as it is read, so reading it with
+        pd.read_csv(chunksize=...) never holds the whole file in memory.
+        Files already in the local disk cache are memory mapped instead, and a fully
+        read download is added to the cache.
+
+        Args:
+            file_id (str): The alphanumeric id for each file
+            shared_drive (bool, optional): Whether to include all drives associated
+            with the account. Defaults to True.
+            use_cache (bool, optional): Whether to serve unchanged files from the local
+            disk cache. Defaults to True.
+
+        Returns:
+            BinaryIO: file like object containing the file contents
+        """
+        file_cache, cache_key = None, ""
+        if use_cache and not kwargs:
+            cache_key = self.file_cache.cache_key(
+                file_id, self.get_file_metadata(file_id, shared_drive)
+            )
+            if (cached_file := self.file_cache.open(cache_key)) is not None:
+                print(f"Using cached copy of {file_id}")
+                return cached_file
+            file_cache = self.file_cache
+        request = self.service.files().get_media(
+            fileId=file_id, supportsAllDrives=shared_drive, **kwargs
+        )
+        # the stream can be read from any thread so it gets a connection of its own
+        request.http = AuthorizedHttp(self.creds, http=httplib2.Http())
+        return io.BufferedReader(
+            DriveDownloadStream(
+                file_id,
+                request,
+                chunksize=self.stream_chunksize,
+                file_cache=file_cache,
+                cache_key=cache_key,
+            ),
+            buffer_size=io.DEFAULT_BUFFER_SIZE * 64,
+        )
+
+    def open_file_ranged(
+        self,
+        file_id: str,
+        shared_drive: bool = True,
+        use_cache: bool = True,
+        chunksize: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        num_retries: Optional[int] = None,
+    ) -> BinaryIO:
+        """Variant of open_file for large files.  The file is split into byte ranges of
+        chunksize which are downloaded concurrently and written in place, as a single
+        drive stream is too slow for the large view files.
+
+        Args:
+            file_id (str): The alphanumeric id for each file
+            shared_drive (bool, optional): Whether to include all drives associated
+            with the account. Defaults to True.
+            use_cache (bool, optional): Whether to serve unchanged files from the local
+            disk cache and store the download there. Defaults to True.
+            chunksize (Optional[int], optional): bytes per range.
+            Defaults to ranged_download_chunksize.
+            max_workers (Optional[int], optional): ranges downloaded at the same time.
+            Defaults to ranged_download_max_workers.
+            num_retries (Optional[int], optional): retries per range before giving up.
+            Defaults to ranged_download_num_retries.
+
+        Raises:
+            ValueError: Incase a range could not be downloaded
+
+        Returns:
+            BinaryIO: file like object containing the file contents
+        """
+        chunksize = chunksize or self.ranged_download_chunksize
+        max_workers = max_workers or self.ranged_download_max_workers
+        num_retries = (
+            self.ranged_download_num_retries if num_retries is None else num_retries
+        )
+        metadata = self.get_file_metadata(file_id, shared_drive)
+        cache_key = self.file_cache.cache_key(file_id, metadata)
+        if use_cache and (cached_file := self.file_cache.open(cache_key)) is not None:
+            print(f"Using cached copy of {file_id}")
+            return cached_file
+        size = int(metadata.get("size", 0))
+        if not size:
+            return self.open_file(file_id, shared_drive, use_cache)
+
+        uri = (
+            self.service.files()
+            .get_media(fileId=file_id, supportsAllDrives=shared_drive)
+            .uri
+        )
+        ranges = [
+            (start, min(start + chunksize, size) - 1)
+            for start in range(0, size, chunksize)
+        ]
+        temp_path = self.file_cache.temp_path(cache_key)
+        if use_cache:
+            # ranges are written straight into the future cache entry
+            with open(temp_path, "w+b") as temp_file:
+                temp_file.truncate(size)
+                body = mmap.mmap(temp_file.fileno(), size)
+        else:
+            body = mmap.mmap(-1, size)
+
+        def _download_range(byte_range: tuple[int, int]) -> None:
+            start, end = byte_range
+            body[start : end + 1] = self._download_range(
+                file_id, uri, start, end, num_retries
+            )
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for range_count, _ in enumerate(
+                    executor.map(_download_range, ranges), start=1
+                ):
+                    print(
+                        f"Downloaded {file_id} "
+                        f"{int(range_count / len(ranges) * 100)}%."
+                    )
+        except BaseException:
+            # a failed or interrupted download, ie KeyboardInterrupt, must not leave the
+            # partial file behind
+            body.close()
+            if use_cache:
+                os.remove(temp_path)
+            raise
+        if not use_cache:
+            return body  # type: ignore
+        body.flush()
+        body.close()
+        self.file_cache.commit(cache_key, temp_path)
+        return self.file_cache.open(cache_key)  # type: ignore
+
+    def _download_range(
+        self, file_id: str, uri: str, start: int, end: int, num_retries: int
+    ) -> bytes:
+        """Downloads the bytes start to end (inclusive) of a file, retrying with
+        exponential backoff on transport errors and unexpected responses.
+
+        Raises:
+            ValueError: When the range still failed after num_retries
+
+        Returns:
+            bytes: The requested range of the file
+        """
+        error = None
+        for attempt in range(num_retries + 1):
+            if attempt:
+                time.sleep(2**attempt)
+            try:
+                response, content = self._get_thread_http().request(
+                    uri, "GET", headers={"range": f"bytes={start}-{end}"}
+                )
+            except (httplib2.HttpLib2Error, OSError) as transport_error:
+                error = transport_error
+                continue
+            if response.status in [200, 206] and len(content) == end - start + 1:
+                return content
+            error = f"status {response.status} with {len(content)} bytes"
+        print(f"An error occurred: {error}")
+        raise ValueError(
+            f"Unable to download bytes {start}-{end} of {file_id} due to error {error}"
+        )
+
+    def _download_file(
+        self, file_id: str, shared_drive: bool = True, **kwargs
+    ) -> bytes:
         query_dict = {
             "fileId": file_id,
             "supportsAllDrives": shared_drive,
@@ -181,6 +476,7 @@ class DriveService:
         file = io.BytesIO()
         try:
             request = self.service.files().get_media(**query_dict)
+            request.http = self._get_thread_http()
             downloader = MediaIoBaseDownload(file, request)
             done = False
             while done is False:
@@ -199,33 +495,62 @@ class DriveService:
         file,
         mimetype: str = "application/octet-stream",
         file_id: str = "",
+        resumable: bool = True,
+        chunksize: Optional[int] = None,
     ) -> Optional[str]:
+        """Uploads a new file to folder_id, or replaces the contents of file_id.
+        Uploads are resumable and sent in chunks: an interrupted chunk is resumed from the
+        last offset drive acknowledged instead of restarting the upload.
+
+        Args:
+            filename (str): Name of the file on drive
+            folder_id (str): Folder the new file is created in
+            file (BinaryIO | Iterable[bytes]): Either a file object or an iterable of bytes,
+            such as a generator writing a csv incrementally, which is never held in memory
+            as a whole.
+            mimetype (str, optional): Defaults to "application/octet-stream".
+            file_id (str, optional): When passed the file's contents are replaced.
+            resumable (bool, optional): Whether to use a chunked resumable upload,
+            only file objects can be uploaded in one request. Defaults to True.
+            chunksize (Optional[int], optional): bytes per request, a multiple of 256KB.
+            Defaults to upload_chunksize.
+
+        Returns:
+            Optional[str]: Id of the uploaded file, None if the upload failed
+        """
+        chunksize = chunksize or self.upload_chunksize
         try:
             file_metadata = {"name": filename, "parents": [folder_id]}
             # pylint: disable=maybe-no-member
-            media = MediaIoBaseUpload(file, mimetype=mimetype)
+            if hasattr(file, "read"):
+                media = MediaIoBaseUpload(
+                    file, mimetype=mimetype, chunksize=chunksize, resumable=resumable
+                )
+            else:
+                media = IterableMediaUpload(
+                    file, mimetype=mimetype, chunksize=chunksize
+                )
             if not file_id:
-                media = (
-                    self.service.files()
-                    .create(
-                        body=file_metadata,
-                        media_body=media,
-                        media_mime_type=mimetype,
-                    )
-                    .execute()
+                request = self.service.files().create(
+                    body=file_metadata,
+                    media_body=media,
+                    media_mime_type=mimetype,
                 )
-                print(f'File ID: {media.get("id")}')
             else:
-                media = (
-                    self.service.files()
-                    .update(
-                        fileId=file_id,
-                        # body = file_metadata,
-                        media_body=media,
-                        media_mime_type=mimetype,
-                    )
-                    .execute()
+                request = self.service.files().update(
+                    fileId=file_id,
+                    # body = file_metadata,
+                    media_body=media,
+                    media_mime_type=mimetype,
                 )
+            media = (
+                self._execute_resumable_upload(request, filename)
+                if media.resumable()
+                else request.execute()
+            )
+            if not file_id:
+                print(f'File ID: {media.get("id")}')
+            else:
                 print(f'Update File ID: {media.get("id")} with new contents')
 
         except HttpError as error:
@@ -235,9 +560,67 @@ class DriveService:
 
         return media.get("id")
 
+    def _execute_resumable_upload(self, request: HttpRequest, filename: str) -> dict:
+        """Sends a resumable upload chunk by chunk.  Transient failures are retried with
+        exponential backoff, after which the upload continues from the offset drive
+        reports as received.
+
+        Raises:
+            HttpError: When drive rejects the upload or retries are exhausted
+
+        Returns:
+            dict: The created or updated file resource
+        """
+        response = None
+        failures = 0
+        while response is None:
+            try:
+                status, response = request.next_chunk(
+                    http=self._get_thread_http(), num_retries=self.upload_num_retries
+                )
+            except (HttpError, httplib2.HttpLib2Error, OSError) as error:
+                failures += 1
+                if failures > self.upload_num_retries or (
+                    isinstance(error, HttpError)
+                    and error.resp.status < 500
+                    and error.resp.status != 429
+                ):
+                    raise
+                print(f"Upload of {filename} interrupted by {error}, resuming")
+                time.sleep(2**failures)
+                continue
+            failures = 0
+            if status:
+                print(f"Uploaded {filename} {status.resumable_progress} bytes.")
+        return response
+
+    def trash_file(self, file_id: str, shared_drive: bool = True) -> bool:
+        """Moves a file to the trash, drive deletes it for good after 30 days.
+
+        Args:
+            file_id (str): The alphanumeric id for each file
+            shared_drive (bool, optional): Whether to include all drives associated
+            with the account. Defaults to True.
+
+        Returns:
+            bool: Whether the file was trashed
+        """
+        try:
+            self.service.files().update(
+                fileId=file_id,
+                body={"trashed": True},
+                supportsAllDrives=shared_drive,
+            ).execute(http=self._get_thread_http())
+        except HttpError as error:
+            print(f"An error occurred: {error}")
+            return False
+        print(f"Trashed File ID: {file_id}")
+        return True
+
     def list_files_in_shared_drive_folder(
         self,
         folder_id: str,
+        fields: str = "nextPageToken, files(id, name)",
     ) -> list:
         return (
             self.list_files(
@@ -246,6 +629,7 @@ class DriveService:
                     "includeItemsFromAllDrives": True,
                     "q": f"'{folder_id}' in parents and trashed = false",
                     "pageSize": 1000,
+                    "fields": fields,
                 }
             )
             or []
@@ -0,0 +1,215 @@
+import io
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import BinaryIO, Optional
+
+import streamlit as st
+
+from connnections.google_drive import (
+    GoogleDriveFileMetadataTypedDict,
+    WorkerCredentials,
+)
+
+
+class _ThrottledReader(io.RawIOBase):
+    """Wraps a file and sleeps on every read so reads never exceed bytes_per_second"""
+
+    def __init__(self, file: BinaryIO, bytes_per_second: float):
+        self._file = file
+        self._bytes_per_second = bytes_per_second
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:  # type: ignore
+        size = self._file.readinto(buffer)  # type: ignore
+        if size:
+            time.sleep(size / self._bytes_per_second)
+        return size
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+@st.cache_resource
+class LocalDriveService:
+    """Stand in for DriveService backed by a local directory, used to run and profile the
+    pipelines offline.  Every drive folder is a sub directory of root_dir named after the
+    folder id, every file is stored under its file id.  File names default to the file id
+    and are otherwise kept in a .names.json file of the folder.
+    Latency, bandwidth and error rates can be configured to reproduce the cost of drive I/O.
+    """
+
+    names_file = ".names.json"
+    # worker processes open the same directory through the environment variables
+    worker_credentials: Optional[WorkerCredentials] = None
+
+    def __init__(
+        self,
+        root_dir: str,
+        latency: float = 0.0,
+        bandwidth: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            root_dir (str): Directory containing one sub directory per drive folder
+            latency (float, optional): Seconds added to every call. Defaults to 0.0.
+            bandwidth (float, optional): Bytes per second downloads and uploads are
+            limited to, 0 means unlimited. Defaults to 0.0.
+            error_rate (float, optional): Probability between 0 and 1 of a download or
+            upload failing the way a drive call would. Defaults to 0.0.
+            seed (Optional[int], optional): Seed of the injected errors. Defaults to None.
+        """
+        print(f"initializing local drive in {root_dir}")
+        self.root_dir = root_dir
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _simulate_call(self, action: str, file_id: str) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise ValueError(
+                f"Unable to proceed due to simulated error {action} {file_id}"
+            )
+
+    def _simulate_transfer(self, size: int) -> None:
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+    def _get_path(self, file_id: str) -> str:
+        for folder in os.scandir(self.root_dir):
+            path = os.path.join(folder.path, file_id)
+            if folder.is_dir() and os.path.isfile(path):
+                return path
+        raise ValueError(f"Unable to proceed due to error file {file_id} not found")
+
+    def _read_names(self, folder_path: str) -> dict[str, str]:
+        try:
+            with open(os.path.join(folder_path, self.names_file)) as names:
+                return json.load(names)
+        except FileNotFoundError:
+            return {}
+
+    def _get_metadata(self, path: str) -> GoogleDriveFileMetadataTypedDict:
+        file_id = os.path.basename(path)
+        stat = os.stat(path)
+        return {
+            "id": file_id,
+            "name": self._read_names(os.path.dirname(path)).get(file_id, file_id),
+            "modifiedTime": datetime.fromtimestamp(
+                stat.st_mtime, tz=timezone.utc
+            ).isoformat(timespec="microseconds"),
+            "size": str(stat.st_size),
+        }
+
+    def list_files_in_shared_drive_folder(
+        self, folder_id: str, fields: str = ""
+    ) -> list[GoogleDriveFileMetadataTypedDict]:
+        if self.latency:
+            time.sleep(self.latency)
+        folder_path = os.path.join(self.root_dir, folder_id)
+        if not os.path.isdir(folder_path):
+            return []
+        return [
+            self._get_metadata(entry.path)
+            for entry in sorted(os.scandir(folder_path), key=lambda entry: entry.name)
+            if entry.is_file()
+            and not entry.name.startswith(".")
+            and not entry.name.endswith(".tmp")
+        ]
+
+    def get_file_metadata(
+        self, file_id: str, shared_drive: bool = True
+    ) -> GoogleDriveFileMetadataTypedDict:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._get_metadata(self._get_path(file_id))
+
+    def get_file(self, file_id: str, shared_drive: bool = True, **kwargs) -> bytes:
+        self._simulate_call("downloading", file_id)
+        with open(self._get_path(file_id), "rb") as file:
+            contents = file.read()
+        self._simulate_transfer(len(contents))
+        return contents
+
+    def open_file(self, file_id: str, shared_drive: bool = True, **kwargs) -> BinaryIO:
+        self._simulate_call("downloading", file_id)
+        file = open(self._get_path(file_id), "rb")
+        if not self.bandwidth:
+            return file
+        return io.BufferedReader(_ThrottledReader(file, self.bandwidth))
+
+    def open_file_ranged(
+        self, file_id: str, shared_drive: bool = True, **kwargs
+    ) -> BinaryIO:
+        return self.open_file(file_id, shared_drive)
+
+    def upload_file(
+        self,
+        filename: str,
+        folder_id: str,
+        file,
+        mimetype: str = "application/octet-stream",
+        file_id: str = "",
+        **kwargs,
+    ) -> Optional[str]:
+        try:
+            self._simulate_call("uploading", file_id or filename)
+            path = (
+                self._get_path(file_id)
+                if file_id
+                else os.path.join(self.root_dir, folder_id, uuid.uuid4().hex)
+            )
+        except ValueError as error:
+            print(f"An error occurred: {error}")
+            return None
+        folder_path = os.path.dirname(path)
+        os.makedirs(folder_path, exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as temp_file:
+            if hasattr(file, "read"):
+                shutil.copyfileobj(file, temp_file)
+            else:
+                for chunk in file:
+                    temp_file.write(chunk)
+            size = temp_file.tell()
+        self._simulate_transfer(size)
+        os.replace(temp_path, path)
+        if not file_id:
+            with self._lock:
+                names = self._read_names(folder_path)
+                names[os.path.basename(path)] = filename
+                with open(
+                    os.path.join(folder_path, self.names_file), "w"
+                ) as names_file:
+                    json.dump(names, names_file)
+            print(f"File ID: {os.path.basename(path)}")
+        else:
+            print(f"Update File ID: {file_id} with new contents")
+        return os.path.basename(path)
+
+    def trash_file(self, file_id: str, shared_drive: bool = True) -> bool:
+        try:
+            self._simulate_call("trashing", file_id)
+            os.remove(self._get_path(file_id))
+        except ValueError as error:
+            print(f"An error occurred: {error}")
+            return False
+        print(f"Trashed File ID: {file_id}")
+        return True
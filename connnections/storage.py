@@ -0,0 +1,82 @@
+import os
+from typing import BinaryIO, Optional, Protocol
+
+from connnections.google_drive import (
+    DriveService,
+    GoogleDriveFileListTypedDict,
+    GoogleDriveFileMetadataTypedDict,
+    WorkerCredentials,
+)
+from connnections.local_drive import LocalDriveService
+
+
+class DriveBackend(Protocol):
+    """The storage calls the data pipelines and dashboard rely on.  Implemented by
+    DriveService for google drive and LocalDriveService for a local directory."""
+
+    # passed to get_drive_service by worker processes, see DriveService.__init__
+    worker_credentials: Optional[WorkerCredentials]
+
+    def list_files_in_shared_drive_folder(
+        self, folder_id: str, fields: str = ...
+    ) -> list[GoogleDriveFileListTypedDict]:
+        ...
+
+    def get_file_metadata(
+        self, file_id: str, shared_drive: bool = True
+    ) -> GoogleDriveFileMetadataTypedDict:
+        ...
+
+    def get_file(self, file_id: str, shared_drive: bool = True, **kwargs) -> bytes:
+        ...
+
+    def open_file(self, file_id: str, shared_drive: bool = True, **kwargs) -> BinaryIO:
+        ...
+
+    def open_file_ranged(
+        self, file_id: str, shared_drive: bool = True, **kwargs
+    ) -> BinaryIO:
+        ...
+
+    def upload_file(
+        self,
+        filename: str,
+        folder_id: str,
+        file,
+        mimetype: str = "application/octet-stream",
+        file_id: str = "",
+    ) -> Optional[str]:
+        ...
+
+    def trash_file(self, file_id: str, shared_drive: bool = True) -> bool:
+        ...
+
+
+def get_drive_service(
+    worker_credentials: Optional[WorkerCredentials] = None,
+) -> DriveBackend:
+    """Returns the storage backend selected through environment variables.
+    NYCSBUS_STORAGE_BACKEND=local swaps google drive for a local directory, configured by
+    NYCSBUS_LOCAL_DRIVE_DIR, NYCSBUS_LOCAL_DRIVE_LATENCY (seconds per call),
+    NYCSBUS_LOCAL_DRIVE_BANDWIDTH (bytes per second), NYCSBUS_LOCAL_DRIVE_ERROR_RATE
+    and NYCSBUS_LOCAL_DRIVE_SEED.
+
+    Args:
+        worker_credentials (Optional[WorkerCredentials], optional): worker_credentials
+        of the backend of the parent process, for worker processes. Defaults to None.
+
+    Returns:
+        DriveBackend: DriveService unless the local backend is selected
+    """
+    if os.environ.get("NYCSBUS_STORAGE_BACKEND", "google") != "local":
+        if worker_credentials is not None:
+            return DriveService(worker_credentials)
+        return DriveService()
+    seed = os.environ.get("NYCSBUS_LOCAL_DRIVE_SEED")
+    return LocalDriveService(
+        os.environ.get("NYCSBUS_LOCAL_DRIVE_DIR", ".local_drive/"),
+        latency=float(os.environ.get("NYCSBUS_LOCAL_DRIVE_LATENCY", 0)),
+        bandwidth=float(os.environ.get("NYCSBUS_LOCAL_DRIVE_BANDWIDTH", 0)),
+        error_rate=float(os.environ.get("NYCSBUS_LOCAL_DRIVE_ERROR_RATE", 0)),
+        seed=int(seed) if seed is not None else None,
+    )
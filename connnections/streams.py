@@ -0,0 +1,162 @@
+import io
+import os
+from typing import Iterable, Optional
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, MediaIoBaseDownload, MediaUpload
+
+from connnections.file_cache import DriveFileCache
+
+
+class _DownloadSink:
+    """Receives the chunks written by MediaIoBaseDownload and optionally copies them
+    into a file so the download can be added to the disk cache once finished."""
+
+    def __init__(self, tee: Optional[io.BufferedWriter] = None):
+        self.buffer = b""
+        self.tee = tee
+
+    def write(self, data: bytes) -> int:
+        self.buffer = data
+        if self.tee is not None:
+            self.tee.write(data)
+        return len(data)
+
+
+class DriveDownloadStream(io.RawIOBase):
+    """Read only file object over a google drive download.  Every time the buffered chunk
+    has been consumed the next chunk is downloaded, so only one chunk of the file is held
+    in memory at a time.  Wrap it in io.BufferedReader before handing it to pandas.
+    """
+
+    def __init__(
+        self,
+        file_id: str,
+        request: HttpRequest,
+        chunksize: int,
+        file_cache: Optional[DriveFileCache] = None,
+        cache_key: str = "",
+        num_retries: int = 3,
+    ):
+        """
+        Args:
+            file_id (str): The alphanumeric id of the file, used for logging
+            request (HttpRequest): get_media request of the file being downloaded
+            chunksize (int): How many bytes are downloaded per request
+            file_cache (Optional[DriveFileCache], optional): When passed the downloaded
+            bytes are also written to the cache and committed under cache_key once
+            the whole file was read. Defaults to None.
+            cache_key (str, optional): key as generated by DriveFileCache.cache_key
+            num_retries (int, optional): retries per chunk on transient errors. Defaults to 3.
+        """
+        self._file_id = file_id
+        self._file_cache = file_cache
+        self._cache_key = cache_key
+        # path of the cache entry being written, cleared once it is committed
+        self._temp_path = ""
+        self._sink = _DownloadSink()
+        self._downloader = MediaIoBaseDownload(self._sink, request, chunksize=chunksize)
+        self._num_retries = num_retries
+        self._offset = 0
+        self._done = False
+        if file_cache is not None:
+            self._temp_path = file_cache.temp_path(cache_key)
+            self._sink.tee = open(self._temp_path, "wb")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:  # type: ignore
+        while self._offset >= len(self._sink.buffer) and not self._done:
+            self._offset = 0
+            try:
+                status, self._done = self._downloader.next_chunk(
+                    num_retries=self._num_retries
+                )
+            except HttpError as error:
+                print(f"An error occurred: {error}")
+                self.close()
+                raise ValueError(f"Unable to proceed due to error {error}")
+            print(f"Downloaded {self._file_id} {int(status.progress() * 100)}%.")
+            if self._done:
+                self._commit_to_cache()
+        size = min(len(buffer), len(self._sink.buffer) - self._offset)
+        buffer[:size] = self._sink.buffer[self._offset : self._offset + size]
+        self._offset += size
+        return size
+
+    def _commit_to_cache(self):
+        if self._sink.tee is None or self._file_cache is None:
+            return
+        self._sink.tee.close()
+        self._sink.tee = None
+        self._file_cache.commit(self._cache_key, self._temp_path)
+        self._temp_path = ""
+
+    def close(self):
+        # a partially read or abandoned download is never added to the cache, its
+        # temporary file is removed unless it was committed
+        if self._sink.tee is not None:
+            self._sink.tee.close()
+            self._sink.tee = None
+        if self._temp_path and os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+        self._temp_path = ""
+        super().close()
+
+
+class IterableMediaUpload(MediaUpload):
+    """Resumable upload of the bytes yielded by an iterable, for example a generator
+    rendering a dataframe to csv a slice at a time.  Only the bytes drive has not
+    acknowledged yet are buffered, which is what allows an interrupted upload to be
+    resumed from the last acknowledged offset without holding the whole file.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], mimetype: str, chunksize: int):
+        """
+        Args:
+            chunks (Iterable[bytes]): The file contents, in pieces of any size
+            mimetype (str): Mime type of the uploaded file
+            chunksize (int): bytes sent per request, must be a multiple of 256KB
+        """
+        self._chunks = iter(chunks)
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+        self._buffer = bytearray()
+        self._buffer_start = 0
+        self._next_begin = 0
+        self._exhausted = False
+
+    def chunksize(self) -> int:
+        return self._chunksize
+
+    def mimetype(self) -> str:
+        return self._mimetype
+
+    def resumable(self) -> bool:
+        return True
+
+    def has_stream(self) -> bool:
+        return False
+
+    def size(self) -> Optional[int]:
+        # reading one chunk ahead tells whether the next chunk is the last one,
+        # which drive needs to know to finish an upload of unknown size
+        self._fill(self._next_begin + self._chunksize + 1)
+        return self._buffer_start + len(self._buffer) if self._exhausted else None
+
+    def getbytes(self, begin: int, length: int) -> bytes:
+        if begin < self._buffer_start:
+            raise ValueError(f"Bytes from {begin} were already uploaded and discarded")
+        del self._buffer[: begin - self._buffer_start]
+        self._buffer_start = begin
+        self._fill(begin + length + 1)
+        self._next_begin = begin + length
+        return bytes(self._buffer[:length])
+
+    def _fill(self, end: int):
+        while not self._exhausted and self._buffer_start + len(self._buffer) < end:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                self._exhausted = True
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 # https://drive.google.com/drive/u/2/folders/1rewZIceeVQMDDhnBw2_xLBZGJ-f5oJFU
 BATTERY_RAW_DATA_FOLDER = "1rewZIceeVQMDDhnBw2_xLBZGJ-f5oJFU"
 # https://drive.google.com/drive/u/0/folders/14SsAEseb_3GBEHp0Ucpq6tupTDYsDKeF
@@ -15,3 +18,58 @@ BREAKDOWN_RAW_DATA_FOLDER = "1_Uwxn6WJCRaVFx_TcHLgKOnAs3kJ3Kma"
 BUS_BREAKDOWN_VIEW = "1Ri403cK_Wyu9zIc7cpymD_MpMYAUwEpf"
 BUS_BREAKDOWN_SNAPSHOT_FOLDER = "1UcA0W8308nMXmUroKVlBl-7EAxXqB-tA"
 BREAKDOWN_VIEW_FOLDER = "1RQDn156K79wf8jzZirJsP1VzLhF_2Wv7"
+
+# number of files downloaded from drive at the same time by the ingestion pipelines
+DRIVE_DOWNLOAD_MAX_WORKERS = 8
+
+# names of the manifests tracking which raw files were already ingested
+BATTERY_INGESTION_MANIFEST = "battery_ingestion_manifest.json"
+RPM_INGESTION_MANIFEST = "rpm_ingestion_manifest.json"
+BREAKDOWN_INGESTION_MANIFEST = "breakdown_ingestion_manifest.json"
+
+# keywords of every breakdown description already extracted, saved in the breakdown
+# view folder.  Bump the version when the keyword extraction changes
+BREAKDOWN_KEYWORD_MEMO = "breakdown_keywords_v1.parquet"
+# descriptions sent to a keyword extraction process at a time
+KEYWORD_BATCH_SIZE = 500
+
+# parquet copies of the views, looked up by name in the view folders
+BATTERY_VIEW_DATA_PARQUET = "battery_view_data.parquet"
+RPM_VIEW_DATA_PARQUET = "rpm_view_data.parquet"
+BUS_BREAKDOWN_VIEW_PARQUET = "bus_breakdown_view.parquet"
+VIEW_PARQUET_ROW_GROUP_SIZE = 250_000
+
+# the view snapshots store the rows added/removed by every change, with a full copy of
+# the view every SNAPSHOT_FULL_BASE_EVERY changes
+SNAPSHOT_FULL_BASE_EVERY = 30
+
+# memory a parsed chunk of a raw csv may use, the rows per chunk are derived from it
+CSV_CHUNK_MEMORY_BUDGET = 64 * 1024**2
+
+# processes parsing the raw csvs, 1 parses them in the pipeline's own process.  Worker
+# processes are opt in, ie os.cpu_count(), they are authorized with the credentials of
+# the pipeline, see create_parse_executor
+PARSE_PROCESSES = 1
+
+# the out of core rpm view is built in partitions of about this many raw files, shuffles
+# are spilled to DASK_SPILL_DIRECTORY on the local disk instead of being held in memory
+OUT_OF_CORE_FILES_PER_PARTITION = 3
+# the partitions are uploaded as segments of the view of at least this many rows, see
+# upload_metrics_view_segments
+OUT_OF_CORE_SEGMENT_ROWS = 5_000_000
+DASK_SPILL_DIRECTORY = os.path.join(tempfile.gettempdir(), "nycsbus_dask")
+
+# fractions of the rows kept by the deterministic hash samples, see data/sampling.py.
+# The seeds differ so the dashboard sample of the rpm view is independent of the rows
+# sampled when it was ingested
+DASHBOARD_SAMPLE_FRACTION = 0.7
+DASHBOARD_SAMPLE_SEED = 0
+RPM_INGESTION_SAMPLE_FRACTION = 0.45
+RPM_INGESTION_SAMPLE_SEED = 1
+
+# most points of a series sent to the browser by the dashboard line charts
+CHART_MAX_POINTS = 2_000
+
+# seconds between two polls of the drive metadata of the views by the dashboard, views
+# which changed are reloaded in the background, see shared_datasets.py
+DASHBOARD_REFRESH_INTERVAL = 5 * 60
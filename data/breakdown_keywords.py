@@ -0,0 +1,227 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from connnections.storage import DriveBackend, get_drive_service
+from data.CONSTANTS import (
+    BREAKDOWN_KEYWORD_MEMO,
+    BREAKDOWN_VIEW_FOLDER,
+    KEYWORD_BATCH_SIZE,
+    PARSE_PROCESSES,
+)
+from data.parquet_views import read_parquet_file, upload_parquet_file
+from data.utilities import chunk_list, find_file_id_by_name
+
+# spellings the keyword extraction would otherwise split or miss
+DESCRIPTION_REPLACEMENTS = {"over heated": "overheated", "wasnt": "wasn't"}
+
+# the Rake instance of this process, see _get_rake
+_rake = None
+
+
+def normalize_description(description: str) -> str:
+    """Lowercases a breakdown description and collapses its whitespace, descriptions
+    which only differ by case or spacing share their keywords.
+
+    Args:
+        description (str): description of a breakdown as reported
+
+    Returns:
+        str: the description keywords are extracted from and memoized by
+    """
+    description = " ".join(description.lower().split())
+    for replace, replacement in DESCRIPTION_REPLACEMENTS.items():
+        description = description.replace(replace, replacement)
+    return description
+
+
+def _get_rake():
+    # the nltk corpora are downloaded once per process, the first time a keyword is
+    # extracted in it
+    global _rake
+    if _rake is None:
+        import nltk
+        from rake_nltk import Rake
+
+        nltk.download("stopwords", quiet=True)
+        nltk.download("punkt", quiet=True)
+        _rake = Rake(
+            min_length=1,
+            max_length=4,
+            language="english",
+            include_repeated_phrases=False,
+            stopwords={
+                "will not start",
+                "ignition broke",
+                "vandalized",
+                "shift gears",
+                "driver" "door",
+            },
+        )
+    return _rake
+
+
+def extract_keywords(normalized_description: str) -> str:
+    """
+    Args:
+        normalized_description (str): from normalize_description
+
+    Returns:
+        str: the highest ranked RAKE phrase of the description, empty if it has none
+    """
+    import contractions
+
+    rake = _get_rake()
+    rake.extract_keywords_from_text(contractions.fix(normalized_description))
+    ranked_phrases = rake.get_ranked_phrases()
+    return ranked_phrases[0] if len(ranked_phrases) else ""
+
+
+def _extract_keywords_batch(normalized_descriptions: list[str]) -> list[str]:
+    # runs in a worker process of extract_keywords_in_processes
+    return [extract_keywords(description) for description in normalized_descriptions]
+
+
+def extract_keywords_in_processes(
+    normalized_descriptions: list[str],
+    processes: int = PARSE_PROCESSES,
+    batch_size: int = KEYWORD_BATCH_SIZE,
+) -> list[str]:
+    """Extracts the keywords of descriptions in batches sent to a pool of processes,
+    RAKE is pure python and would otherwise be bound to a single core by the GIL.
+    A single batch is extracted in this process.
+
+    Args:
+        normalized_descriptions (list[str]): from normalize_description
+        processes (int, optional): Number of worker processes.
+        Defaults to PARSE_PROCESSES.
+        batch_size (int, optional): Descriptions sent to a worker at a time.
+        Defaults to KEYWORD_BATCH_SIZE.
+
+    Returns:
+        list[str]: the keywords of every description, in the same order
+    """
+    batches = chunk_list(normalized_descriptions, batch_size)
+    if processes <= 1 or len(batches) <= 1:
+        return _extract_keywords_batch(normalized_descriptions)
+    # spawned like the csv parsing workers, see parse_csvs_in_processes
+    with ProcessPoolExecutor(
+        max_workers=min(processes, len(batches)),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        return [
+            keywords
+            for batch_keywords in executor.map(_extract_keywords_batch, batches)
+            for keywords in batch_keywords
+        ]
+
+
+class KeywordMemo:
+    """Keywords of every normalized breakdown description seen so far.  Descriptions
+    repeat a lot, so keywords are only extracted for the descriptions not in the memo
+    and the memo is saved next to the breakdown view for the next runs.
+    """
+
+    def __init__(self, keywords: Optional[dict[str, str]] = None):
+        """
+        Args:
+            keywords (Optional[dict[str, str]], optional): keywords by normalized
+            description. Defaults to an empty memo.
+        """
+        self.keywords = {} if keywords is None else keywords
+        self.changed = False
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def get_keywords(
+        self, descriptions: pd.Series, processes: int = PARSE_PROCESSES
+    ) -> np.ndarray:
+        """Looks up the keywords of every description, extracting and memoizing the
+        keywords of the normalized descriptions which are not in the memo yet.
+
+        Args:
+            descriptions (pd.Series): breakdown descriptions
+            processes (int, optional): see extract_keywords_in_processes.
+            Defaults to PARSE_PROCESSES.
+
+        Returns:
+            np.ndarray: keywords per description
+        """
+        codes, unique_descriptions = pd.factorize(descriptions.astype(str))
+        normalized = [
+            normalize_description(description) for description in unique_descriptions
+        ]
+        missing = [
+            description
+            for description in dict.fromkeys(normalized)
+            if description not in self.keywords
+        ]
+        if missing:
+            print(
+                f"Extracting the keywords of {len(missing)} of"
+                f" {len(normalized)} distinct descriptions"
+            )
+            self.keywords.update(
+                zip(missing, extract_keywords_in_processes(missing, processes))
+            )
+            self.changed = True
+        unique_keywords = np.array(
+            [self.keywords[description] for description in normalized], dtype=object
+        )
+        return unique_keywords[codes]
+
+
+def load_keyword_memo(
+    drive_service: Optional[DriveBackend] = None,
+) -> tuple[Optional[str], KeywordMemo]:
+    """
+    Returns:
+        tuple[Optional[str], KeywordMemo]: id of the memo file (None when it does not
+        exist yet) and the memo
+    """
+    drive_service = drive_service or get_drive_service()
+    memo_id = find_file_id_by_name(
+        BREAKDOWN_VIEW_FOLDER, BREAKDOWN_KEYWORD_MEMO, drive_service
+    )
+    if memo_id is None:
+        return None, KeywordMemo()
+    memo_df = read_parquet_file(memo_id, drive_service=drive_service)
+    return memo_id, KeywordMemo(dict(zip(memo_df["description"], memo_df["keywords"])))
+
+
+def save_keyword_memo(
+    keyword_memo: KeywordMemo,
+    memo_id: Optional[str] = None,
+    drive_service: Optional[DriveBackend] = None,
+) -> Optional[str]:
+    """Saves the memo when keywords were added to it
+
+    Args:
+        keyword_memo (KeywordMemo): the memo
+        memo_id (Optional[str], optional): id of the memo file when it already exists
+
+    Returns:
+        Optional[str]: id of the memo file
+    """
+    if not keyword_memo.changed:
+        return memo_id
+    drive_service = drive_service or get_drive_service()
+    memo_id = upload_parquet_file(
+        pd.DataFrame(
+            {
+                "description": list(keyword_memo.keywords),
+                "keywords": list(keyword_memo.keywords.values()),
+            }
+        ),
+        BREAKDOWN_KEYWORD_MEMO,
+        BREAKDOWN_VIEW_FOLDER,
+        sort_by=["description"],
+        drive_service=drive_service,
+        file_id=memo_id or "",
+    )
+    keyword_memo.changed = False
+    return memo_id
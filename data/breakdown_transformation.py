@@ -1,165 +1,407 @@
-from io import StringIO
-from typing import Union
+from typing import Optional, Union
 
+import numpy as np
 import pandas as pd
-import pytz
 from pandas.io.parsers.readers import TextFileReader
 
-from connnections.google_drive import DriveService
-from data.CONSTANTS import BREAKDOWN_VIEW_FOLDER, BUS_BREAKDOWN_SNAPSHOT_FOLDER
-from data.reference_data import get_geotab_mappings_dataframe
-from data.utilities import get_csv_from_drive_as_dataframe, get_raw_data_file_ids
+from connnections.storage import get_drive_service
+from data.breakdown_keywords import KeywordMemo, load_keyword_memo, save_keyword_memo
+from data.CONSTANTS import (
+    BREAKDOWN_VIEW_FOLDER,
+    BUS_BREAKDOWN_SNAPSHOT_FOLDER,
+    DRIVE_DOWNLOAD_MAX_WORKERS,
+    PARSE_PROCESSES,
+)
+from data.chunking import ColumnBuffers, iter_planned_chunks
+from data.parallel_parsing import parse_csvs_from_drive
+from data.parquet_views import (
+    append_parquet_view_segment,
+    parquet_view_has_column,
+    read_parquet_view,
+    replace_parquet_view_segments,
+)
+from data.reference_data import get_geotab_mapping
+from data.row_hash_index import (
+    RowHashIndex,
+    load_row_hash_index,
+    save_row_hash_index,
+)
+from data.timestamps import (
+    EST_TZ,
+    to_epoch_seconds,
+    upgrade_legacy_breakdown_view,
+)
+from data.utilities import (
+    dataframe_to_csv_chunks,
+    get_csv_from_drive_as_dataframe,
+    get_raw_data_file_ids,
+)
+from data.view_snapshots import save_view_snapshot
 
+# columns identifying a breakdown, the keywords are derived from the description
+BREAKDOWN_ROW_COLUMNS = ["description", "reportedAt", "Bus #"]
 
-def generate_dataframe_for_breakdown_data(breakdown_folder_id: str) -> pd.DataFrame:
+
+def generate_dataframe_for_breakdown_data(
+    breakdown_folder_id: str,
+    max_workers: int = DRIVE_DOWNLOAD_MAX_WORKERS,
+    breakdown_file_id_list: Optional[list[str]] = None,
+    processes: int = PARSE_PROCESSES,
+) -> pd.DataFrame:
     """As currently all the raw files are split into smaller csvs
-    this generates a singular large dataframe containing all the files
+    this generates a singular large dataframe containing all the files.
+    The files are downloaded concurrently and formatted as each download finishes.
+
+    Args:
+        breakdown_folder_id (str): Folder containing the raw breakdown csvs
+        max_workers (int, optional): How many files are downloaded at the same time.
+        Defaults to DRIVE_DOWNLOAD_MAX_WORKERS.
+        breakdown_file_id_list (Optional[list[str]], optional): Only process these files
+        of the folder. Defaults to every file in the folder.
+        processes (int, optional): Processes the files are formatted in, see
+        parse_csvs_from_drive. Defaults to PARSE_PROCESSES.
 
     Returns:
         pd.DataFrame: Raw breakdown data across all geotab devices
     """
-    drive_service = DriveService()
-    breakdown_file_id_list = get_raw_data_file_ids(breakdown_folder_id, drive_service)
+    drive_service = get_drive_service()
+    if breakdown_file_id_list is None:
+        breakdown_file_id_list = get_raw_data_file_ids(
+            breakdown_folder_id, drive_service
+        )
     giant_breakdown_data_csv_df = pd.concat(
-        format_breakdown_df(
-            get_csv_from_drive_as_dataframe(
-                file, drive_service, {"dtype": str, "chunksize": 2000}
-            )  # type: ignore
+        parse_csvs_from_drive(
+            breakdown_file_id_list,
+            format_breakdown_df,
+            {"dtype": str, "iterator": True},
+            drive_service,
+            max_workers=max_workers,
+            processes=processes,
         )
-        for file in breakdown_file_id_list
     )
     return giant_breakdown_data_csv_df
 
 
 def format_breakdown_df(chunks: TextFileReader) -> pd.DataFrame:
     """
-    Gets chunks from the read_csv when data is passed down with chunksize
+    Gets chunks from the read_csv when data is passed down with iterator=True
 
     chunks (TextFileReader): Chunks to process breakdown data in dataframes of x size at a time to make
-    reading more memory efficient
+    reading more memory efficient, the size is planned from CSV_CHUNK_MEMORY_BUDGET
 
     Returns:
         pd.DataFrame: breakdown data reformatted to have better types per columns and a utc datetime
     """
-    breakdown_total_df = pd.concat(
-        parse_breakdown_data(breakdown_raw_df)
-        if len(breakdown_raw_df)
-        else pd.DataFrame()
-        for breakdown_raw_df in chunks
-    )
-    return breakdown_total_df.drop_duplicates(keep="first")
+    breakdown_buffers = ColumnBuffers()
+    for breakdown_raw_df in iter_planned_chunks(chunks):
+        if len(breakdown_raw_df):
+            breakdown_buffers.append(parse_breakdown_data(breakdown_raw_df))
+    return breakdown_buffers.to_dataframe()
 
 
 def parse_breakdown_data(breakdown_raw_df: pd.DataFrame) -> pd.DataFrame:
-    est_tz = pytz.timezone("US/Eastern")
     breakdown_raw_df = breakdown_raw_df[["geotab", "description", "reported_at"]]
-    breakdown_raw_df = breakdown_raw_df.rename(columns={"reported_at": "estReportedAt"})
+    breakdown_raw_df = breakdown_raw_df.rename(columns={"reported_at": "reportedAt"})
     try:
-        breakdown_raw_df["estReportedAt"] = pd.to_datetime(
-            breakdown_raw_df["estReportedAt"],
-            format="%Y-%m-%dT%H:%M:%S",
-            utc=False,
-        ).astype(pd.DatetimeTZDtype(tz=est_tz))
+        reported_at = pd.to_datetime(
+            breakdown_raw_df["reportedAt"], format="%Y-%m-%dT%H:%M:%S"
+        )
     except ValueError:
-        breakdown_raw_df["estReportedAt"] = pd.to_datetime(
-            breakdown_raw_df["estReportedAt"],
-            format="mixed",
-            utc=False,
-        ).astype(pd.DatetimeTZDtype(tz=est_tz))
-    breakdown_raw_df["reportedAt"] = breakdown_raw_df["estReportedAt"].dt.tz_convert(
-        "UTC"
+        reported_at = pd.to_datetime(breakdown_raw_df["reportedAt"], format="mixed")
+    # breakdowns without a parsable report time can not be placed on the timeline
+    unparsed = reported_at.isna().sum()
+    if unparsed:
+        print(f"Dropping {unparsed} breakdowns without a valid reported_at")
+    # breakdowns are reported in US/Eastern time, the views only keep epoch seconds
+    reported_at = reported_at.dropna().dt.tz_localize(
+        EST_TZ,
+        ambiguous=np.zeros(len(reported_at) - unparsed, dtype=bool),
+        nonexistent="shift_forward",
     )
-    breakdown_raw_df["reportedAt"] = breakdown_raw_df["reportedAt"].dt.strftime(
-        "%Y-%m-%d %H:%M:%S%z"
+    return breakdown_raw_df.loc[reported_at.index].assign(
+        reportedAt=to_epoch_seconds(reported_at)
     )
-    breakdown_raw_df["estReportedAt"] = breakdown_raw_df["estReportedAt"].dt.strftime(
-        "%Y-%m-%d %H:%M:%S%z"
-    )
-
-    return breakdown_raw_df
 
 
 def generate_breakdown_view_data(
     breakdown_data_df: pd.DataFrame,
+    keyword_memo: Optional[KeywordMemo] = None,
+    processes: int = PARSE_PROCESSES,
 ) -> pd.DataFrame:
     """Gets the breakdown data such as  battery voltage data
     including the bus # associated with the geotab.
     Includes formatting and such.
+    The keywords of every description are extracted here once, only for the
+    descriptions the keyword memo has not seen yet, see KeywordMemo.
+
+    Args:
+        breakdown_data_df (pd.DataFrame): from generate_dataframe_for_breakdown_data
+        keyword_memo (Optional[KeywordMemo], optional): keywords already extracted.
+        Defaults to loading and saving the memo of the breakdown view.
+        processes (int, optional): Processes the new keywords are extracted in, see
+        extract_keywords_in_processes. Defaults to PARSE_PROCESSES.
 
     Returns:
-        pd.DataFrame: Battery voltage data including the geotab mappings
+        pd.DataFrame: Breakdown data including the geotab mappings and keywords
     """
-    geotab_df = get_geotab_mappings_dataframe()
-    breakdown_data_df = breakdown_data_df.merge(
-        geotab_df, left_on=["geotab"], right_on=["Geotab Device"]
+    drive_service = get_drive_service()
+    memo_id = None
+    save_memo = keyword_memo is None
+    if keyword_memo is None:
+        memo_id, keyword_memo = load_keyword_memo(drive_service)
+    buses = get_geotab_mapping().get_buses(breakdown_data_df["geotab"])
+    mapped = buses.notna().to_numpy()
+    descriptions = breakdown_data_df["description"][mapped]
+    breakdown_df = pd.DataFrame(
+        {
+            "description": descriptions.to_numpy(),
+            "reportedAt": breakdown_data_df["reportedAt"].to_numpy()[mapped],
+            "Bus #": buses.array[mapped],
+            "keywords": keyword_memo.get_keywords(descriptions, processes),
+        }
     )
-    return breakdown_data_df[
-        ["description", "reportedAt", "estReportedAt", "Bus #"]
-    ].drop_duplicates(keep="first")
+    if save_memo:
+        save_keyword_memo(keyword_memo, memo_id, drive_service)
+    return breakdown_df
 
 
-def upload_breakdown_view_data(
-    file_id: str, file_name: str, breakdown_df: pd.DataFrame
-):
-    """Gets the existing breakdown view file appends the new data to it and uploads the result.
-    It also compares the dataframe created to the current view dataframe.  If the data is different
-    then a snapshot of the view data is saved in the View Data/breakdown Snapshot folder
+def add_missing_keywords(
+    view_df: pd.DataFrame,
+    keyword_memo: KeywordMemo,
+    processes: int = PARSE_PROCESSES,
+) -> pd.DataFrame:
+    """Fills the keywords of the rows of a breakdown view which have none, ie the rows
+    ingested before the pipeline extracted keywords.
 
     Args:
-        file_id (str): The alphanumeric code id of the metric view file
-        file_name (str): The filename of the metric view file
-        breakdown_df (pd.DataFrame): The data being uploaded
+        view_df (pd.DataFrame): rows of the breakdown view, with or without keywords
+        keyword_memo (KeywordMemo): see generate_breakdown_view_data
+        processes (int, optional): see generate_breakdown_view_data.
+        Defaults to PARSE_PROCESSES.
+
+    Returns:
+        pd.DataFrame: the rows, all with keywords
     """
-    drive_service = DriveService()
-    current_view_breakdown_df = pd.DataFrame(
-        get_csv_from_drive_as_dataframe(
-            file_id,
-            drive_service=drive_service,
-            pandas_read_csv_kwargs={"dtype": "sring[pyarrow]"},
+    if "keywords" not in view_df:
+        view_df = view_df.assign(keywords=pd.Series(None, view_df.index, object))
+    missing = view_df["keywords"].isna().to_numpy()
+    if missing.any():
+        keywords = view_df["keywords"].to_numpy(dtype=object, copy=True)
+        keywords[missing] = keyword_memo.get_keywords(
+            view_df["description"][missing], processes
         )
+        view_df = view_df.assign(keywords=keywords)
+    return view_df
+
+
+def backfill_breakdown_view_keywords(
+    parquet_view_name: str,
+    keyword_memo: KeywordMemo,
+    processes: int = PARSE_PROCESSES,
+) -> bool:
+    """Adds the keywords to the segmented breakdown view when some of its segments
+    were written before the pipeline extracted keywords.  The view is rewritten as a
+    single segment, once, the rows themselves are unchanged so its row hash index and
+    rollups still hold.
+
+    Args:
+        parquet_view_name (str): Name of the segmented parquet view
+        keyword_memo (KeywordMemo): see generate_breakdown_view_data
+        processes (int, optional): see generate_breakdown_view_data.
+        Defaults to PARSE_PROCESSES.
+
+    Returns:
+        bool: the view was rewritten
+    """
+    drive_service = get_drive_service()
+    if parquet_view_has_column(
+        parquet_view_name, BREAKDOWN_VIEW_FOLDER, "keywords", drive_service
+    ):
+        return False
+    view_df = read_parquet_view(
+        parquet_view_name,
+        BREAKDOWN_VIEW_FOLDER,
+        normalize=upgrade_legacy_breakdown_view,
+        drive_service=drive_service,
     )
-    breakdown_df = (
-        pd.concat([current_view_breakdown_df, breakdown_df])
-        .sort_values(by=["reportedAt", "Bus #"])
-        .drop_duplicates(keep="first")
-        .reset_index(drop=True)
+    print(f"Adding the keywords of {len(view_df)} rows of {parquet_view_name}")
+    replace_parquet_view_segments(
+        add_missing_keywords(view_df, keyword_memo, processes),
+        parquet_view_name,
+        BREAKDOWN_VIEW_FOLDER,
+        sort_by=["Bus #", "reportedAt"],
+        drive_service=drive_service,
     )
+    return True
 
-    if not current_view_breakdown_df.equals(breakdown_df):
-        from datetime import datetime
 
-        current_view_breakdown_df_rowcount = len(current_view_breakdown_df)
-        del current_view_breakdown_df
-        breakdown_df_len = len(breakdown_df)
-        breakdown_df = StringIO(
-            breakdown_df.to_csv(index=False).encode("ascii", "ignore").strip().decode()
-        )  # type:ignore
-
-        snapshot_file_name = (
-            f"{file_name.split('.csv')[0]}"
-            f"_{datetime.now().strftime('%Y-%m-%d %H:%M')}.csv"
-        )
-        print(
-            f"old dataframe {current_view_breakdown_df_rowcount} rows."
-            f"New dataframe {breakdown_df_len} rows"
+def upload_breakdown_view_data(
+    file_id: str,
+    file_name: str,
+    breakdown_df: pd.DataFrame,
+    overwrite: bool = False,
+    parquet_view_name: Optional[str] = None,
+    row_hash_index: Optional[RowHashIndex] = None,
+    keyword_memo: Optional[KeywordMemo] = None,
+) -> pd.DataFrame:
+    """Gets the existing breakdown view file appends the new data to it and uploads the result.
+    Rows already in the view are dropped through the RowHashIndex of the view, which is the
+    only place the breakdown pipeline deduplicates.  The rows added are saved as a snapshot
+    in the View Data/breakdown Snapshot folder, see save_view_snapshot
+
+    When parquet_view_name is passed the view is segmented instead: the new data is uploaded
+    as a new parquet segment of the view and the csv view is left untouched.
+
+    Args:
+        file_id (str): The alphanumeric code id of the metric view file
+        file_name (str): The filename of the metric view file
+        breakdown_df (pd.DataFrame): The data being uploaded
+        overwrite (bool, optional): Replace the view with breakdown_df instead of adding
+        to it. Defaults to False.
+        parquet_view_name (Optional[str], optional): Name of the segmented parquet view,
+        sorted by Bus # and reportedAt. Defaults to None.
+        row_hash_index (Optional[RowHashIndex], optional): The index of the view, see
+        upload_metrics_view_data. Defaults to loading and saving the index.
+        keyword_memo (Optional[KeywordMemo], optional): Fills the keywords of the rows of
+        the csv view which have none, see add_missing_keywords.  The segmented view is
+        backfilled by backfill_breakdown_view_keywords. Defaults to loading and saving
+        the memo when the csv view has rows without keywords.
+
+    Returns:
+        pd.DataFrame: the rows added to the view, without the rows it already held
+    """
+    drive_service = get_drive_service()
+    snapshot_name = file_name.split(".csv")[0]
+    view_file_name = parquet_view_name or file_name
+    row_hash_index_id = None
+    save_index = row_hash_index is None
+    if parquet_view_name is not None:
+        if row_hash_index is None:
+            row_hash_index_id, row_hash_index = load_row_hash_index(
+                parquet_view_name,
+                BREAKDOWN_VIEW_FOLDER,
+                get_view_df=lambda: read_parquet_view(
+                    parquet_view_name,
+                    BREAKDOWN_VIEW_FOLDER,
+                    normalize=upgrade_legacy_breakdown_view,
+                    drive_service=drive_service,
+                ),
+                drive_service=drive_service,
+                columns=BREAKDOWN_ROW_COLUMNS,
+            )
+        if overwrite:
+            row_hash_index.clear()
+        added_df = row_hash_index.drop_seen_rows(breakdown_df, BREAKDOWN_ROW_COLUMNS)
+        upload_segment = (
+            replace_parquet_view_segments if overwrite else append_parquet_view_segment
         )
-        print(
-            "New data is being uploaded view csv."
-            f" Creating backup of new file first {snapshot_file_name}"
+        upload_segment(
+            added_df,
+            parquet_view_name,
+            BREAKDOWN_VIEW_FOLDER,
+            sort_by=["Bus #", "reportedAt"],
+            drive_service=drive_service,
         )
-        drive_service.upload_file(
-            filename=snapshot_file_name,
-            folder_id=BUS_BREAKDOWN_SNAPSHOT_FOLDER,
-            file=breakdown_df,
-            mimetype="text/csv",
+        # the rows of a segment are the delta, the whole view is only read when a
+        # new base snapshot is due
+        save_view_snapshot(
+            snapshot_name,
+            BUS_BREAKDOWN_SNAPSHOT_FOLDER,
+            added_df,
+            get_view_df=lambda: read_parquet_view(  # type: ignore
+                parquet_view_name,
+                BREAKDOWN_VIEW_FOLDER,
+                normalize=upgrade_legacy_breakdown_view,
+                drive_service=drive_service,
+            ),
+            full=overwrite,
+            drive_service=drive_service,
         )
     else:
+        current_view_breakdown_df = pd.DataFrame()
+        if not overwrite:
+            current_view_breakdown_df = upgrade_legacy_breakdown_view(
+                pd.DataFrame(
+                    get_csv_from_drive_as_dataframe(
+                        file_id,
+                        drive_service=drive_service,
+                        pandas_read_csv_kwargs={"dtype": "string[pyarrow]"},
+                    )
+                )
+            )
+            if (
+                "keywords" not in current_view_breakdown_df
+                or current_view_breakdown_df["keywords"].isna().any()
+            ):
+                memo_id = None
+                save_memo = keyword_memo is None
+                if keyword_memo is None:
+                    memo_id, keyword_memo = load_keyword_memo(drive_service)
+                current_view_breakdown_df = add_missing_keywords(
+                    current_view_breakdown_df, keyword_memo
+                )
+                if save_memo:
+                    save_keyword_memo(keyword_memo, memo_id, drive_service)
+        if row_hash_index is None:
+            row_hash_index_id, row_hash_index = load_row_hash_index(
+                file_name,
+                BREAKDOWN_VIEW_FOLDER,
+                get_view_df=lambda: current_view_breakdown_df,
+                drive_service=drive_service,
+                columns=BREAKDOWN_ROW_COLUMNS,
+            )
+        if overwrite:
+            row_hash_index.clear()
+        added_df = row_hash_index.drop_seen_rows(breakdown_df, BREAKDOWN_ROW_COLUMNS)
+        breakdown_df = (
+            pd.concat([current_view_breakdown_df, added_df])
+            .sort_values(by=["reportedAt", "Bus #"])
+            .reset_index(drop=True)
+        )
+
+        if not overwrite and len(added_df):
+            print(
+                f"old dataframe {len(current_view_breakdown_df)} rows."
+                f"New dataframe {len(breakdown_df)} rows"
+            )
         del current_view_breakdown_df
 
-    drive_service.upload_file(
-        filename=file_name,
-        file_id=file_id,
-        folder_id=BREAKDOWN_VIEW_FOLDER,
-        file=(StringIO(breakdown_df.to_csv(index=False).encode("ascii", "ignore").strip().decode()) if isinstance(breakdown_df, pd.DataFrame) else breakdown_df),  # type: ignore
-        mimetype="text/csv",
-    )
+        view_id = drive_service.upload_file(
+            filename=file_name,
+            file_id=file_id,
+            folder_id=BREAKDOWN_VIEW_FOLDER,
+            file=dataframe_to_csv_chunks(
+                breakdown_df, encoding="ascii", errors="ignore"
+            ),
+            mimetype="text/csv",
+        )
+        # the manifest must not list raw files whose rows never made it to the view
+        if view_id is None:
+            raise ValueError(f"Unable to proceed, upload of {file_name} failed")
+        # the snapshot must not record rows the view never received
+        if overwrite:
+            save_view_snapshot(
+                snapshot_name,
+                BUS_BREAKDOWN_SNAPSHOT_FOLDER,
+                breakdown_df,
+                get_view_df=lambda: breakdown_df,
+                full=True,
+                drive_service=drive_service,
+            )
+        elif len(added_df):
+            save_view_snapshot(
+                snapshot_name,
+                BUS_BREAKDOWN_SNAPSHOT_FOLDER,
+                added_df,
+                get_view_df=lambda: breakdown_df,
+                drive_service=drive_service,
+            )
+    if save_index:
+        save_row_hash_index(
+            view_file_name,
+            BREAKDOWN_VIEW_FOLDER,
+            row_hash_index,
+            row_hash_index_id,
+            drive_service,
+        )
+    return added_df
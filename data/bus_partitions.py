@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+
+class BusPartitions:
+    """Rows of a view grouped by bus.  The rows are sorted by Bus # once and the first
+    and last position of every bus are kept, so selecting a bus is a slice of the
+    sorted rows instead of comparing the Bus # of every row.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        Args:
+            df (pd.DataFrame): rows of a view with a Bus # column, the rows of a bus keep
+            their order
+        """
+        buses = df["Bus #"].astype("category")
+        codes = buses.cat.codes.to_numpy()
+        if np.all(codes[1:] >= codes[:-1]):
+            # already grouped by bus, ie a view read from a single segment, the rows are
+            # referenced instead of copied
+            sorted_codes = codes
+            self.df = df.set_axis(pd.RangeIndex(len(df)), copy=False)
+        else:
+            order = np.argsort(codes, kind="stable")
+            sorted_codes = codes[order]
+            self.df = df.take(order).reset_index(drop=True)
+        if not isinstance(df["Bus #"].dtype, pd.CategoricalDtype):
+            self.df["Bus #"] = pd.Categorical.from_codes(
+                sorted_codes, dtype=buses.dtype  # type: ignore
+            )
+        category_codes = np.arange(len(buses.cat.categories))
+        starts = np.searchsorted(sorted_codes, category_codes, side="left")
+        stops = np.searchsorted(sorted_codes, category_codes, side="right")
+        self.offsets: dict[str, tuple[int, int]] = {
+            str(bus): (start, stop)
+            for bus, start, stop in zip(buses.cat.categories, starts, stops)
+            if stop > start
+        }
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def copy(self, deep: bool = True) -> "BusPartitions":
+        """
+        Args:
+            deep (bool, optional): copy the rows, otherwise the copy references the rows
+            of this instance like DataFrame.copy(deep=False). Defaults to True.
+
+        Returns:
+            BusPartitions: the copy, the offsets are shared as they are never changed
+        """
+        partitions_copy = object.__new__(BusPartitions)
+        partitions_copy.df = self.df.copy(deep=deep)
+        partitions_copy.offsets = self.offsets
+        return partitions_copy
+
+    @property
+    def buses(self) -> list[str]:
+        """Buses with at least one row, sorted"""
+        return sorted(self.offsets)
+
+    def get_slice(self, bus: str) -> slice:
+        """
+        Args:
+            bus (str): Bus #
+
+        Returns:
+            slice: positions of the rows of the bus in df, or in any frame with the rows
+            of df in the same order.  Empty when the bus has no rows.
+        """
+        return slice(*self.offsets.get(str(bus), (0, 0)))
+
+    def get(self, bus: str) -> pd.DataFrame:
+        """
+        Args:
+            bus (str): Bus #
+
+        Returns:
+            pd.DataFrame: the rows of the bus, a view of df rather than a copy
+        """
+        return self.df.iloc[self.get_slice(bus)]
@@ -0,0 +1,162 @@
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers.readers import TextFileReader
+
+from data.CONSTANTS import CSV_CHUNK_MEMORY_BUDGET
+
+
+class ChunkPlanner:
+    """Picks how many rows of a csv to parse at a time so a parsed chunk stays within a
+    memory budget.  The size of a row is not known before parsing, so it is measured on
+    every chunk parsed and the next chunk is sized from the running average.
+    """
+
+    def __init__(
+        self,
+        memory_budget_bytes: int = CSV_CHUNK_MEMORY_BUDGET,
+        initial_rows: int = 10_000,
+        min_rows: int = 1_000,
+        max_rows: int = 5_000_000,
+    ):
+        """
+        Args:
+            memory_budget_bytes (int, optional): Memory a parsed chunk may use.
+            Defaults to CSV_CHUNK_MEMORY_BUDGET.
+            initial_rows (int, optional): Rows of the first chunk, used to measure the
+            size of a row. Defaults to 10_000.
+            min_rows (int, optional): Smallest chunk planned. Defaults to 1_000.
+            max_rows (int, optional): Largest chunk planned. Defaults to 5_000_000.
+        """
+        self.memory_budget_bytes = memory_budget_bytes
+        self.initial_rows = initial_rows
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.bytes_per_row: Optional[float] = None
+
+    def observe(self, chunk: pd.DataFrame) -> None:
+        """Updates the measured size of a row from a parsed chunk.
+
+        Args:
+            chunk (pd.DataFrame): a chunk as parsed by read_csv
+        """
+        if not len(chunk):
+            return
+        bytes_per_row = chunk.memory_usage(index=True, deep=True).sum() / len(chunk)
+        self.bytes_per_row = (
+            bytes_per_row
+            if self.bytes_per_row is None
+            else 0.5 * self.bytes_per_row + 0.5 * bytes_per_row
+        )
+
+    def next_chunksize(self) -> int:
+        """
+        Returns:
+            int: rows to parse in the next chunk
+        """
+        if self.bytes_per_row is None:
+            return self.initial_rows
+        return int(
+            min(
+                max(self.memory_budget_bytes // self.bytes_per_row, self.min_rows),
+                self.max_rows,
+            )
+        )
+
+
+def iter_planned_chunks(
+    reader: TextFileReader, planner: Optional[ChunkPlanner] = None
+) -> Iterator[pd.DataFrame]:
+    """Reads a csv in chunks sized by a ChunkPlanner.  Open the reader with
+    iterator=True instead of a fixed chunksize.
+
+    Args:
+        reader (TextFileReader): read_csv opened with iterator=True
+        planner (Optional[ChunkPlanner], optional): Defaults to a planner with the
+        default memory budget.
+
+    Yields:
+        pd.DataFrame: the chunks of the csv
+    """
+    planner = planner or ChunkPlanner()
+    with reader:
+        while True:
+            try:
+                chunk = reader.get_chunk(planner.next_chunksize())
+            except StopIteration:
+                return
+            planner.observe(chunk)
+            yield chunk
+
+
+class ColumnBuffers:
+    """Collects dataframes with the same columns into one numpy array per column,
+    instead of keeping a list of dataframes to concatenate at the end.  The arrays are
+    preallocated and doubled when full, so appending costs one copy of the new rows.
+    Categorical columns are collected as their values and categorized once at the end.
+    """
+
+    def __init__(self, capacity: int = 0):
+        """
+        Args:
+            capacity (int, optional): Rows to preallocate, when known. Defaults to 0,
+            in which case the first chunk decides.
+        """
+        self.capacity = capacity
+        self.rows = 0
+        self._buffers: dict[str, np.ndarray] = {}
+        self._categorical: set[str] = set()
+
+    def _allocate(self, df: pd.DataFrame) -> None:
+        self.capacity = max(self.capacity, 4 * len(df))
+        for column, dtype in df.dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                self._categorical.add(column)  # type: ignore
+            numpy_dtype = dtype if isinstance(dtype, np.dtype) else np.dtype(object)
+            self._buffers[column] = np.empty(self.capacity, dtype=numpy_dtype)  # type: ignore
+
+    def _grow(self, rows: int) -> None:
+        capacity = self.capacity
+        while capacity < rows:
+            capacity *= 2
+        for column, buffer in self._buffers.items():
+            grown = np.empty(capacity, dtype=buffer.dtype)
+            grown[: self.rows] = buffer[: self.rows]
+            self._buffers[column] = grown
+        self.capacity = capacity
+
+    def append(self, df: pd.DataFrame) -> None:
+        """Copies the rows of df into the buffers.
+
+        Args:
+            df (pd.DataFrame): rows with the same columns as the first dataframe appended
+        """
+        if not len(df):
+            return
+        if not self._buffers:
+            self._allocate(df)
+        if self.rows + len(df) > self.capacity:
+            self._grow(self.rows + len(df))
+        for column, buffer in self._buffers.items():
+            values = df[column].to_numpy()
+            if buffer.dtype != object and not np.can_cast(values.dtype, buffer.dtype):
+                # chunks can be downcast to different dtypes, ie int8 then int16
+                buffer = buffer.astype(np.result_type(buffer.dtype, values.dtype))
+                self._buffers[column] = buffer
+            buffer[self.rows : self.rows + len(df)] = values
+        self.rows += len(df)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: every row appended, in order
+        """
+        return pd.DataFrame(
+            {
+                column: pd.Categorical(buffer[: self.rows])
+                if column in self._categorical
+                else buffer[: self.rows]
+                for column, buffer in self._buffers.items()
+            }
+        )
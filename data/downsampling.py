@@ -0,0 +1,118 @@
+from typing import Literal, Optional
+
+import numpy as np
+import pandas as pd
+
+from data.CONSTANTS import CHART_MAX_POINTS
+
+
+def get_lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets downsampling: keeps the first and last points and
+    from every one of n_out - 2 buckets the point forming the largest triangle with the
+    point kept before it and the average of the next bucket, which preserves the visual
+    shape of the line.
+
+    Args:
+        x (np.ndarray): sorted x values
+        y (np.ndarray): y values
+        n_out (int): points to keep
+
+    Returns:
+        np.ndarray: sorted positions of the points kept
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # n_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start = end
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    return indices
+
+
+def get_min_max_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Min/max decimation: splits the points in n_out / 2 buckets and keeps the lowest
+    and the highest point of every bucket, so no spike is lost.
+
+    Args:
+        y (np.ndarray): y values, ordered by x
+        n_out (int): most points to keep
+
+    Returns:
+        np.ndarray: sorted positions of the points kept
+    """
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    buckets = np.arange(n) * (n_out // 2) // n
+    grouped = pd.Series(y, dtype=np.float64).groupby(buckets)
+    return np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+
+
+def downsample_for_chart(
+    df: pd.DataFrame,
+    x_column: str,
+    y_column: str,
+    max_points: int = CHART_MAX_POINTS,
+    method: Literal["lttb", "min_max"] = "lttb",
+    keep: Optional[np.ndarray] = None,
+    marker_times: Optional[pd.Series] = None,
+) -> pd.DataFrame:
+    """Reduces a time series to about max_points rows before it is sent to the browser
+    by a line chart.  Flagged rows, ie anomalies, are always kept on top of max_points,
+    as are the rows closest to every marker time, ie breakdowns, so the line passes
+    through the points the chart highlights.
+
+    Args:
+        df (pd.DataFrame): one series, ie the readings of one bus
+        x_column (str): the time column, ie estDateTime
+        y_column (str): the value column
+        max_points (int, optional): points of the downsampled line.
+        Defaults to CHART_MAX_POINTS.
+        method (Literal["lttb", "min_max"], optional): lttb keeps the shape of the line,
+        min_max keeps the extremes of every bucket. Defaults to "lttb".
+        keep (Optional[np.ndarray], optional): boolean mask of rows to always keep.
+        marker_times (Optional[pd.Series], optional): times whose closest rows are kept.
+
+    Returns:
+        pd.DataFrame: the rows kept, ordered by x_column
+    """
+    has_value = df[y_column].notna().to_numpy()
+    df = df[has_value]
+    if keep is not None:
+        keep = np.asarray(keep, dtype=bool)[has_value]
+    order = np.argsort(df[x_column].to_numpy(), kind="stable")
+    df = df.iloc[order]
+    if keep is not None:
+        keep = keep[order]
+    if len(df) <= max_points:
+        return df
+    x = df[x_column].to_numpy().astype(np.int64)
+    y = df[y_column].to_numpy(dtype=np.float64)
+    if method == "min_max":
+        positions = get_min_max_indices(y, max_points)
+    else:
+        positions = get_lttb_indices(x, y, max_points)
+    if keep is not None:
+        positions = np.union1d(positions, np.flatnonzero(keep))
+    if marker_times is not None and len(marker_times):
+        markers = marker_times.dropna().to_numpy().astype(np.int64)
+        after = np.clip(np.searchsorted(x, markers), 0, len(x) - 1)
+        before = np.clip(after - 1, 0, len(x) - 1)
+        positions = np.union1d(positions, np.union1d(before, after))
+    return df.iloc[positions]
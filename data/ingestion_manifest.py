@@ -0,0 +1,105 @@
+import json
+from typing import Optional
+
+from connnections.google_drive import GoogleDriveFileMetadataTypedDict
+from connnections.storage import DriveBackend, get_drive_service
+from data.utilities import find_file_id_by_name
+
+IngestionManifest = dict[str, str]  # raw file id -> fingerprint of the ingested version
+
+
+def get_file_fingerprint(file: GoogleDriveFileMetadataTypedDict) -> str:
+    """Identifies a version of a file, the checksum when drive has one
+    otherwise its last modified time
+
+    Args:
+        file (GoogleDriveFileMetadataTypedDict): drive metadata of the file
+
+    Returns:
+        str: fingerprint which changes whenever the file contents change
+    """
+    return file.get("md5Checksum") or file.get("modifiedTime", "")
+
+
+def load_ingestion_manifest(
+    manifest_name: str, folder_id: str, drive_service: Optional[DriveBackend] = None
+) -> tuple[Optional[str], IngestionManifest]:
+    """Loads the manifest of raw files a pipeline already processed.
+
+    Args:
+        manifest_name (str): file name of the manifest
+        folder_id (str): folder the manifest is saved in
+
+    Returns:
+        tuple[Optional[str], IngestionManifest]: id of the manifest file (None when it
+        does not exist yet) and the manifest itself
+    """
+    drive_service = drive_service or get_drive_service()
+    manifest_id = find_file_id_by_name(folder_id, manifest_name, drive_service)
+    if manifest_id is None:
+        return None, {}
+    return manifest_id, json.loads(drive_service.get_file(manifest_id))
+
+
+def get_unprocessed_raw_files(
+    raw_folder_id: str,
+    manifest: IngestionManifest,
+    drive_service: Optional[DriveBackend] = None,
+) -> list[GoogleDriveFileMetadataTypedDict]:
+    """Lists the raw files which are new or changed since they were added to the manifest.
+    Changed files are processed again in full, the deduplication of the views
+    drops the rows that were already ingested.
+
+    Args:
+        raw_folder_id (str): Folder containing the raw csvs
+        manifest (IngestionManifest): manifest as returned by load_ingestion_manifest
+
+    Returns:
+        list[GoogleDriveFileMetadataTypedDict]: metadata of the files to process sorted by id
+    """
+    drive_service = drive_service or get_drive_service()
+    raw_files = drive_service.list_files_in_shared_drive_folder(
+        raw_folder_id,
+        fields="nextPageToken, files(id, name, md5Checksum, modifiedTime, size)",
+    )
+    return sorted(
+        (
+            raw_file
+            for raw_file in raw_files
+            if manifest.get(raw_file["id"]) != get_file_fingerprint(raw_file)
+        ),
+        key=lambda raw_file: raw_file["id"],
+    )
+
+
+def save_ingestion_manifest(
+    manifest_name: str,
+    folder_id: str,
+    manifest: IngestionManifest,
+    manifest_id: Optional[str] = None,
+    drive_service: Optional[DriveBackend] = None,
+) -> str:
+    """Uploads the manifest, replacing the previous version when manifest_id is passed.
+    Save it once the rows of its raw files are published in the view, the upload
+    functions raise when the view could not be uploaded.
+
+    Args:
+        manifest_name (str): file name of the manifest
+        folder_id (str): folder the manifest is saved in
+        manifest (IngestionManifest): the manifest to save
+        manifest_id (Optional[str], optional): id of the existing manifest file.
+
+    Returns:
+        str: id of the manifest file
+    """
+    drive_service = drive_service or get_drive_service()
+    saved_manifest_id = drive_service.upload_file(
+        filename=manifest_name,
+        folder_id=folder_id,
+        file=[json.dumps(manifest, indent=1, sort_keys=True).encode()],
+        mimetype="application/json",
+        file_id=manifest_id or "",
+    )
+    if saved_manifest_id is None:
+        raise ValueError(f"Unable to proceed, upload of {manifest_name} failed")
+    return saved_manifest_id
@@ -1,79 +1,417 @@
+from contextlib import nullcontext
+from functools import partial
 from typing import Callable
 
 import pandas as pd
 
-from connnections.google_drive import DriveService
+from connnections.storage import DriveBackend, get_drive_service
+from data.breakdown_keywords import load_keyword_memo, save_keyword_memo
 from data.breakdown_transformation import (
+    backfill_breakdown_view_keywords,
     generate_breakdown_view_data,
     generate_dataframe_for_breakdown_data,
     upload_breakdown_view_data,
 )
 from data.CONSTANTS import (
+    BATTERY_INGESTION_MANIFEST,
     BATTERY_RAW_DATA_FOLDER,
     BATTERY_VIEW_DATA_CSV,
+    BATTERY_VIEW_DATA_PARQUET,
+    BREAKDOWN_INGESTION_MANIFEST,
     BREAKDOWN_RAW_DATA_FOLDER,
+    BREAKDOWN_VIEW_FOLDER,
     BUS_BREAKDOWN_VIEW,
+    BUS_BREAKDOWN_VIEW_PARQUET,
+    METRICS_FINALIZED_DATA_FOLDER,
+    PARSE_PROCESSES,
+    RPM_INGESTION_MANIFEST,
+    RPM_INGESTION_SAMPLE_FRACTION,
+    RPM_INGESTION_SAMPLE_SEED,
     RPM_RAW_DATA_FOLDER,
     RPM_VIEW_DATA_CSV,
+    RPM_VIEW_DATA_PARQUET,
+)
+from data.ingestion_manifest import (
+    get_file_fingerprint,
+    get_unprocessed_raw_files,
+    load_ingestion_manifest,
+    save_ingestion_manifest,
 )
 from data.metrics_transformation import (
     format_metric_df,
     generate_dataframe_for_metric_data,
     generate_metric_view_data,
+    generate_metric_view_data_out_of_core,
     upload_metrics_view_data,
+    upload_metrics_view_segments,
+)
+from data.parallel_parsing import create_parse_executor, parse_csvs_from_drive
+from data.parquet_views import compact_parquet_view, read_parquet_view
+from data.rollups import (
+    METRIC_ROLLUP_PERIODS,
+    compute_breakdown_rollup,
+    compute_metric_rollup,
+    merge_breakdown_rollups,
+    merge_metric_rollups,
+    update_rollups,
 )
-from data.utilities import (
-    chunk_list,
-    get_csv_from_drive_as_dataframe,
-    get_raw_data_file_ids,
+from data.row_hash_index import load_row_hash_index, save_row_hash_index
+from data.sampling import HashSample, sample_dataframe
+from data.timestamps import upgrade_legacy_breakdown_view, upgrade_legacy_metric_view
+from data.utilities import chunk_list
+
+RPM_INGESTION_SAMPLE = HashSample(
+    RPM_INGESTION_SAMPLE_FRACTION, RPM_INGESTION_SAMPLE_SEED, ("device", "dateTime")
 )
 
 
-def generate_and_upload_breakdown_view():
+def update_metric_rollups(
+    view_file_name: str,
+    added_df: pd.DataFrame,
+    overwrite: bool,
+    drive_service: DriveBackend,
+):
+    """Updates the hourly and daily rollups of a metric view with the rows added to it,
+    see update_rollups
+
+    Args:
+        view_file_name (str): ie RPM_VIEW_DATA_PARQUET
+        added_df (pd.DataFrame): rows returned by upload_metrics_view_data
+        overwrite (bool): The view was replaced by added_df
+    """
+    update_rollups(
+        view_file_name,
+        METRICS_FINALIZED_DATA_FOLDER,
+        METRIC_ROLLUP_PERIODS,
+        added_df,
+        compute_metric_rollup,
+        merge_metric_rollups,
+        get_view_df=lambda: read_parquet_view(
+            view_file_name,
+            METRICS_FINALIZED_DATA_FOLDER,
+            normalize=upgrade_legacy_metric_view,
+            drive_service=drive_service,
+        ),
+        overwrite=overwrite,
+        drive_service=drive_service,
+    )
+
+
+def update_breakdown_rollups(
+    added_df: pd.DataFrame, overwrite: bool, drive_service: DriveBackend
+):
+    """Updates the monthly breakdown counts with the breakdowns added to the view,
+    see update_rollups
+
+    Args:
+        added_df (pd.DataFrame): rows returned by upload_breakdown_view_data
+        overwrite (bool): The view was replaced by added_df
+    """
+    update_rollups(
+        BUS_BREAKDOWN_VIEW_PARQUET,
+        BREAKDOWN_VIEW_FOLDER,
+        ("monthly",),
+        added_df,
+        compute_breakdown_rollup,
+        merge_breakdown_rollups,
+        get_view_df=lambda: read_parquet_view(
+            BUS_BREAKDOWN_VIEW_PARQUET,
+            BREAKDOWN_VIEW_FOLDER,
+            normalize=upgrade_legacy_breakdown_view,
+            drive_service=drive_service,
+        ),
+        overwrite=overwrite,
+        drive_service=drive_service,
+    )
+
+
+def generate_and_upload_breakdown_view(incremental: bool = True):
+    """Function to generate and upload breakdown data.  When incremental only the raw
+    files that are new or changed since the last run are processed and merged into the view.
+    Rows of the view ingested before the keywords were extracted by the pipeline get
+    theirs on the next incremental run, see backfill_breakdown_view_keywords.
+
+    Args:
+        incremental (bool, optional): False reprocesses every raw file. Defaults to True.
+    """
+    drive_service = get_drive_service()
+    manifest_id, manifest = load_ingestion_manifest(
+        BREAKDOWN_INGESTION_MANIFEST, BREAKDOWN_VIEW_FOLDER, drive_service
+    )
+    memo_id, keyword_memo = load_keyword_memo(drive_service)
+    if incremental:
+        backfill_breakdown_view_keywords(BUS_BREAKDOWN_VIEW_PARQUET, keyword_memo)
+    else:
+        manifest = {}
+    raw_files = get_unprocessed_raw_files(
+        BREAKDOWN_RAW_DATA_FOLDER, manifest, drive_service
+    )
+    if not raw_files:
+        print("No new breakdown files to process")
+        save_keyword_memo(keyword_memo, memo_id, drive_service)
+        return
     breakdown_df = generate_breakdown_view_data(
-        generate_dataframe_for_breakdown_data(BREAKDOWN_RAW_DATA_FOLDER)
+        generate_dataframe_for_breakdown_data(
+            BREAKDOWN_RAW_DATA_FOLDER,
+            breakdown_file_id_list=[raw_file["id"] for raw_file in raw_files],
+        ),
+        keyword_memo,
     )
-    upload_breakdown_view_data(
-        BUS_BREAKDOWN_VIEW, "bus_breakdown_view.csv", breakdown_df
+    added_df = upload_breakdown_view_data(
+        BUS_BREAKDOWN_VIEW,
+        "bus_breakdown_view.csv",
+        breakdown_df,
+        overwrite=not incremental,
+        parquet_view_name=BUS_BREAKDOWN_VIEW_PARQUET,
+        keyword_memo=keyword_memo,
     )
+    save_keyword_memo(keyword_memo, memo_id, drive_service)
+    update_breakdown_rollups(added_df, not incremental, drive_service)
+    manifest.update(
+        {raw_file["id"]: get_file_fingerprint(raw_file) for raw_file in raw_files}
+    )
+    save_ingestion_manifest(
+        BREAKDOWN_INGESTION_MANIFEST,
+        BREAKDOWN_VIEW_FOLDER,
+        manifest,
+        manifest_id,
+        drive_service,
+    )
+
 
+def generate_and_upload_battery_view(incremental: bool = True):
+    """Function to generate and upload metric data for batteries.  When incremental only
+    the raw files that are new or changed since the last run are processed and merged
+    into the view, otherwise the view is rebuilt from every raw file.
 
-def generate_and_upload_battery_view():
-    """Function to generate and upload metric data for batteries"""
+    Args:
+        incremental (bool, optional): False rebuilds the whole view. Defaults to True.
+    """
+    drive_service = get_drive_service()
+    manifest_id, manifest = load_ingestion_manifest(
+        BATTERY_INGESTION_MANIFEST, METRICS_FINALIZED_DATA_FOLDER, drive_service
+    )
+    if not incremental:
+        manifest = {}
+    raw_files = get_unprocessed_raw_files(
+        BATTERY_RAW_DATA_FOLDER, manifest, drive_service
+    )
+    if not raw_files:
+        print("No new battery files to process")
+        return
     battery_df = generate_metric_view_data(
-        generate_dataframe_for_metric_data(BATTERY_RAW_DATA_FOLDER)
-    )
-    upload_metrics_view_data(
-        BATTERY_VIEW_DATA_CSV, "battery_view_data.csv", battery_df, overwrite=True
-    )
-
-
-def generate_and_upload_rpm_view():
-    """Function to generate and upload metric data for rpm"""
-    metric_folder_id = RPM_RAW_DATA_FOLDER
-    drive_service = DriveService()
-    metric_file_id_list = get_raw_data_file_ids(metric_folder_id, drive_service)
-    metric_file_id_chunk_list = chunk_list(metric_file_id_list, 3)
-    for metric_file_id_chunked_list in metric_file_id_chunk_list:
-        giant_metric_data_csv_df = pd.concat(
-            [
-                format_metric_df(
-                    get_csv_from_drive_as_dataframe(
-                        file,
-                        drive_service,
-                        {"dtype": str, "index_col": 0, "chunksize": 200},
-                    ),  # type: ignore
-                    data_dtype="integer",
-                )
-                for file in metric_file_id_chunked_list
-            ]
+        generate_dataframe_for_metric_data(
+            BATTERY_RAW_DATA_FOLDER,
+            metric_file_id_list=[raw_file["id"] for raw_file in raw_files],
         )
-        giant_metric_data_csv_df = giant_metric_data_csv_df.drop_duplicates(
-            keep="first"
-        ).sample(n=int(len(giant_metric_data_csv_df) * 0.45))
-        giant_metric_data_csv_df = generate_metric_view_data(giant_metric_data_csv_df)
-        upload_metrics_view_data(
-            RPM_VIEW_DATA_CSV, "rpm_view_data.csv", giant_metric_data_csv_df
+    )
+    added_df = upload_metrics_view_data(
+        BATTERY_VIEW_DATA_CSV,
+        "battery_view_data.csv",
+        battery_df,
+        overwrite=not incremental,
+        parquet_view_name=BATTERY_VIEW_DATA_PARQUET,
+    )
+    update_metric_rollups(
+        BATTERY_VIEW_DATA_PARQUET, added_df, not incremental, drive_service
+    )
+    manifest.update(
+        {raw_file["id"]: get_file_fingerprint(raw_file) for raw_file in raw_files}
+    )
+    save_ingestion_manifest(
+        BATTERY_INGESTION_MANIFEST,
+        METRICS_FINALIZED_DATA_FOLDER,
+        manifest,
+        manifest_id,
+        drive_service,
+    )
+
+
+def generate_and_upload_rpm_view(incremental: bool = True, out_of_core: bool = False):
+    """Function to generate and upload metric data for rpm.  The new or changed raw files
+    are processed three at a time and the manifest is saved after every upload, so an
+    interrupted run continues where it stopped.  To fit in memory only 45% of the rows
+    are kept, unless out_of_core.  The sample is picked by hashing the device and time of
+    every row, so a reprocessed raw file keeps the same rows.
+
+    Args:
+        incremental (bool, optional): False reprocesses every raw file. Defaults to True.
+        out_of_core (bool, optional): Keep every row by generating the view with dask,
+        see generate_metric_view_data_out_of_core. Defaults to False.
+    """
+    drive_service = get_drive_service()
+    manifest_id, manifest = load_ingestion_manifest(
+        RPM_INGESTION_MANIFEST, METRICS_FINALIZED_DATA_FOLDER, drive_service
+    )
+    if not incremental:
+        manifest = {}
+    raw_files = get_unprocessed_raw_files(RPM_RAW_DATA_FOLDER, manifest, drive_service)
+    if not raw_files:
+        print("No new rpm files to process")
+        return
+    # loaded once for the whole run instead of once per upload, and saved before every
+    # manifest so the rows of the raw files in the manifest are always in the index
+    row_hash_index_id, row_hash_index = load_row_hash_index(
+        RPM_VIEW_DATA_PARQUET,
+        METRICS_FINALIZED_DATA_FOLDER,
+        get_view_df=lambda: read_parquet_view(
+            RPM_VIEW_DATA_PARQUET,
+            METRICS_FINALIZED_DATA_FOLDER,
+            normalize=upgrade_legacy_metric_view,
+            drive_service=drive_service,
+        )
+        if incremental
+        else None,
+        drive_service=drive_service,
+    )
+    if out_of_core:
+        # the partitions are sorted across every raw file, so they are uploaded as a few
+        # large segments and the index, rollups and manifest are saved once all of them
+        # are uploaded
+        added_df = upload_metrics_view_segments(
+            generate_metric_view_data_out_of_core(
+                [raw_file["id"] for raw_file in raw_files], data_dtype="integer"
+            ),
+            RPM_VIEW_DATA_PARQUET,
+            row_hash_index,
+            overwrite=not incremental,
+        )
+        save_row_hash_index(
+            RPM_VIEW_DATA_PARQUET,
+            METRICS_FINALIZED_DATA_FOLDER,
+            row_hash_index,
+            row_hash_index_id,
+            drive_service,
+        )
+        update_metric_rollups(
+            RPM_VIEW_DATA_PARQUET, added_df, not incremental, drive_service
+        )
+        manifest.update(
+            {raw_file["id"]: get_file_fingerprint(raw_file) for raw_file in raw_files}
+        )
+        save_ingestion_manifest(
+            RPM_INGESTION_MANIFEST,
+            METRICS_FINALIZED_DATA_FOLDER,
+            manifest,
+            manifest_id,
+            drive_service,
+        )
+        return
+    # the parse workers are started once and reused by every chunk of the run
+    with (
+        create_parse_executor(PARSE_PROCESSES, drive_service)
+        if PARSE_PROCESSES > 1
+        else nullcontext()
+    ) as parse_executor:
+        for chunk_number, raw_file_chunked_list in enumerate(chunk_list(raw_files, 3)):
+            giant_metric_data_csv_df = pd.concat(
+                parse_csvs_from_drive(
+                    [raw_file["id"] for raw_file in raw_file_chunked_list],
+                    partial(format_metric_df, data_dtype="integer"),
+                    {"dtype": str, "index_col": 0, "iterator": True},
+                    drive_service,
+                    executor=parse_executor,
+                )
+            )
+            giant_metric_data_csv_df = sample_dataframe(
+                giant_metric_data_csv_df, RPM_INGESTION_SAMPLE
+            )
+            giant_metric_data_csv_df = generate_metric_view_data(
+                giant_metric_data_csv_df
+            )
+            # a full rebuild replaces the view with the first chunk then adds the others
+            overwrite = not incremental and chunk_number == 0
+            added_df = upload_metrics_view_data(
+                RPM_VIEW_DATA_CSV,
+                "rpm_view_data.csv",
+                giant_metric_data_csv_df,
+                overwrite=overwrite,
+                parquet_view_name=RPM_VIEW_DATA_PARQUET,
+                row_hash_index=row_hash_index,
+            )
+            row_hash_index_id = save_row_hash_index(
+                RPM_VIEW_DATA_PARQUET,
+                METRICS_FINALIZED_DATA_FOLDER,
+                row_hash_index,
+                row_hash_index_id,
+                drive_service,
+            )
+            update_metric_rollups(
+                RPM_VIEW_DATA_PARQUET, added_df, overwrite, drive_service
+            )
+            manifest.update(
+                {
+                    raw_file["id"]: get_file_fingerprint(raw_file)
+                    for raw_file in raw_file_chunked_list
+                }
+            )
+            manifest_id = save_ingestion_manifest(
+                RPM_INGESTION_MANIFEST,
+                METRICS_FINALIZED_DATA_FOLDER,
+                manifest,
+                manifest_id,
+                drive_service,
+            )
+
+
+def compact_views(min_segments: int = 2):
+    """Merges the segments the ingestion pipelines appended to every view into a single
+    deduplicated segment.  Meant to be scheduled apart from the pipelines, ie weekly.
+
+    Args:
+        min_segments (int, optional): Only compact views with at least this many
+        segments. Defaults to 2.
+    """
+    for view_name, folder_id, sort_by, normalize in [
+        (
+            BUS_BREAKDOWN_VIEW_PARQUET,
+            BREAKDOWN_VIEW_FOLDER,
+            ["Bus #", "reportedAt"],
+            upgrade_legacy_breakdown_view,
+        ),
+        (
+            BATTERY_VIEW_DATA_PARQUET,
+            METRICS_FINALIZED_DATA_FOLDER,
+            ["Bus #", "dateTime"],
+            upgrade_legacy_metric_view,
+        ),
+        (
+            RPM_VIEW_DATA_PARQUET,
+            METRICS_FINALIZED_DATA_FOLDER,
+            ["Bus #", "dateTime"],
+            upgrade_legacy_metric_view,
+        ),
+    ]:
+        # compacting also rewrites segments of the legacy schema to epoch seconds
+        compact_parquet_view(view_name, folder_id, sort_by, min_segments, normalize)
+
+
+def generate_and_upload_rollups():
+    """Rebuilds the rollups of every view from the whole view.  The pipelines keep them
+    up to date, this is only needed when a view was changed some other way.
+    """
+    drive_service = get_drive_service()
+    update_breakdown_rollups(
+        read_parquet_view(
+            BUS_BREAKDOWN_VIEW_PARQUET,
+            BREAKDOWN_VIEW_FOLDER,
+            normalize=upgrade_legacy_breakdown_view,
+            drive_service=drive_service,
+        ),
+        True,
+        drive_service,
+    )
+    for view_file_name in [BATTERY_VIEW_DATA_PARQUET, RPM_VIEW_DATA_PARQUET]:
+        update_metric_rollups(
+            view_file_name,
+            read_parquet_view(
+                view_file_name,
+                METRICS_FINALIZED_DATA_FOLDER,
+                normalize=upgrade_legacy_metric_view,
+                drive_service=drive_service,
+            ),
+            True,
+            drive_service,
         )
 
 
@@ -82,3 +420,5 @@ METRIC_GENERATION_UPLOAD: list[Callable] = [
     generate_and_upload_rpm_view,
     generate_and_upload_battery_view,
 ]
+VIEW_COMPACTION: list[Callable] = [compact_views]
+ROLLUP_GENERATION: list[Callable] = [generate_and_upload_rollups]
@@ -1,68 +1,121 @@
 import json
-from io import StringIO
-from typing import Literal
+import math
+import os
+import tempfile
+from typing import Iterable, Iterator, Literal, Optional
 
+import dask
 import dask.dataframe as dd
 import numpy as np
 import pandas as pd
-import pytz
 from pandas.io.parsers.readers import TextFileReader
 
-from connnections.google_drive import DriveService
+from connnections.storage import get_drive_service
 from data.CONSTANTS import (
+    DASK_SPILL_DIRECTORY,
+    DRIVE_DOWNLOAD_MAX_WORKERS,
     METRICS_FINALIZED_DATA_FOLDER,
     METRICS_SNAPSHOT_FOLDER,
-    RPM_VIEW_DATA_CSV,
+    OUT_OF_CORE_FILES_PER_PARTITION,
+    OUT_OF_CORE_SEGMENT_ROWS,
+    PARSE_PROCESSES,
 )
-from data.reference_data import get_geotab_mappings_dataframe
+from data.chunking import ColumnBuffers, iter_planned_chunks
+from data.parallel_parsing import parse_csvs_from_drive
+from data.parquet_views import (
+    append_parquet_view_segment,
+    read_parquet_file,
+    read_parquet_view,
+    replace_parquet_view_segments,
+)
+from data.reference_data import GeotabMapping, get_geotab_mapping
+from data.row_hash_index import (
+    RowHashIndex,
+    load_row_hash_index,
+    save_row_hash_index,
+)
+from data.timestamps import to_epoch_seconds, upgrade_legacy_metric_view
 from data.utilities import (
+    dataframe_to_csv_chunks,
     get_csv_from_drive_as_dataframe,
-    get_random_sample_of_chunks,
     get_raw_data_file_ids,
 )
+from data.view_snapshots import save_view_snapshot
+
+
+def _decode_device_json(raw_device: str) -> Optional[str]:
+    try:
+        return str(json.loads(raw_device.replace("'", '"'))["id"])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
 
 
-def get_id_from_json(x) -> str:
-    """Takes columns containing strings {'id':'device_number'}
-    and gets teh device number. Created for use in DataFrame
-    apply function
+def get_ids_from_json(devices: pd.Series) -> pd.Series:
+    """Takes a column containing strings {'id':'device_number'} and gets the device
+    numbers.  A telemetry export only contains a few hundred distinct devices, so every
+    distinct string is decoded once and the device numbers are mapped back onto the rows
+    through the categorical codes.
+    Values which can not be decoded are kept as is and reported once per call.
 
     Args:
-        x (Series): the parameter from apply
+        devices (pd.Series): The raw device column
 
     Returns:
-        str: device number
+        pd.Series: categorical device numbers
     """
-    try:
-        dict_data = json.loads(x.replace("'", '"'))
-        return dict_data["id"]
-    except Exception as e:
-        print(type(x))
-        print(x)
-        print(e)
-        return x
+    devices = devices.astype("category")
+    raw_devices = devices.cat.categories.to_series()
+    device_ids = raw_devices.str.extract(
+        r"""^\s*\{\s*['"]id['"]\s*:\s*['"]([^'"]*)['"]\s*\}\s*$""", expand=False
+    )
+    undecoded = device_ids.isna()
+    if undecoded.any():
+        # anything the pattern misses, ie devices with more keys, goes through json
+        device_ids[undecoded] = raw_devices[undecoded].map(_decode_device_json)
+        malformed = raw_devices[device_ids.isna()]
+        if len(malformed):
+            print(
+                f"{len(malformed)} device values could not be decoded"
+                f" and are kept as is: {malformed.head(5).tolist()}"
+            )
+            device_ids = device_ids.fillna(raw_devices)
+    return devices.map(device_ids.to_dict()).astype("category")
 
 
-def generate_dataframe_for_metric_data(metric_folder_id: str) -> pd.DataFrame:
+def generate_dataframe_for_metric_data(
+    metric_folder_id: str,
+    max_workers: int = DRIVE_DOWNLOAD_MAX_WORKERS,
+    metric_file_id_list: Optional[list[str]] = None,
+    processes: int = PARSE_PROCESSES,
+) -> pd.DataFrame:
     """As currently all the raw files are split into smaller csvs
-    this generates a singular large dataframe containing all the files
+    this generates a singular large dataframe containing all the files.
+    The files are downloaded concurrently and formatted as each download finishes.
+
+    Args:
+        metric_folder_id (str): Folder containing the raw metric csvs
+        max_workers (int, optional): How many files are downloaded at the same time.
+        Defaults to DRIVE_DOWNLOAD_MAX_WORKERS.
+        metric_file_id_list (Optional[list[str]], optional): Only process these files
+        of the folder. Defaults to every file in the folder.
+        processes (int, optional): Processes the files are formatted in, see
+        parse_csvs_from_drive. Defaults to PARSE_PROCESSES.
 
     Returns:
         pd.DataFrame: Raw metric data across all geotab devices
     """
-    drive_service = DriveService()
-    metric_file_id_list = get_raw_data_file_ids(metric_folder_id, drive_service)
+    drive_service = get_drive_service()
+    if metric_file_id_list is None:
+        metric_file_id_list = get_raw_data_file_ids(metric_folder_id, drive_service)
     giant_metric_data_csv_df = pd.concat(
-        [
-            format_metric_df(
-                get_csv_from_drive_as_dataframe(
-                    file,
-                    drive_service,
-                    {"dtype": str, "index_col": 0, "chunksize": 200},
-                )  # type: ignore
-            )
-            for file in metric_file_id_list
-        ],
+        parse_csvs_from_drive(
+            metric_file_id_list,
+            format_metric_df,
+            {"dtype": str, "index_col": 0, "iterator": True},
+            drive_service,
+            max_workers=max_workers,
+            processes=processes,
+        )
     )
     return giant_metric_data_csv_df
 
@@ -71,24 +124,25 @@ def format_metric_df(
     chunks: TextFileReader, data_dtype: Literal["float", "integer"] = "float"
 ) -> pd.DataFrame:
     """
-    Gets chunks from the read_csv when data is passed down with chunksize
+    Gets chunks from the read_csv when data is passed down with iterator=True
 
     chunks (TextFileReader): Chunks to process metric data in dataframes of x size at a time to make
-    reading more memory efficient
+    reading more memory efficient, the size is planned from CSV_CHUNK_MEMORY_BUDGET
 
     Returns:
         pd.DataFrame: metric data reformatted to have better types per columns and a utc datetime
     """
     pd.set_option("mode.chained_assignment", None)
-    metrics_total_df = pd.concat(
-        parse_metric_df(metrics_raw_df, data_dtype=data_dtype)
-        if len(metrics_raw_df)
-        else pd.DataFrame()
-        for metrics_raw_df in chunks
-    )
+    metric_buffers = ColumnBuffers()
+    for metrics_raw_df in iter_planned_chunks(chunks):
+        if len(metrics_raw_df):
+            metric_buffers.append(
+                parse_metric_df(metrics_raw_df, data_dtype=data_dtype)
+            )
+    metrics_total_df = metric_buffers.to_dataframe()
     pd.reset_option("mode.chained_assignment")
     print(len(metrics_total_df))
-    return metrics_total_df.drop_duplicates(keep="first")
+    return metrics_total_df
 
 
 def parse_metric_df(
@@ -105,31 +159,27 @@ def parse_metric_df(
             metric_raw_chunk_df["data"].astype(np.float64).round(2), downcast="float"
         )
 
-    metric_raw_chunk_df["device"] = (
-        metric_raw_chunk_df["device"].apply(get_id_from_json).astype("category")
-    )
-    est_tz = pytz.timezone("US/Eastern")
+    metric_raw_chunk_df["device"] = get_ids_from_json(metric_raw_chunk_df["device"])
     try:
-        metric_raw_chunk_df["dateTime"] = pd.to_datetime(
+        date_times = pd.to_datetime(
             metric_raw_chunk_df["dateTime"],
             format="%Y-%m-%d %H:%M:%S.%f%z",
+            utc=True,
         )
     except ValueError:
-        metric_raw_chunk_df["dateTime"] = pd.to_datetime(
-            metric_raw_chunk_df["dateTime"], format="mixed"
+        date_times = pd.to_datetime(
+            metric_raw_chunk_df["dateTime"], format="mixed", utc=True
         )
+    # readings without a parsable time can not be placed on the timeline
+    unparsed = date_times.isna().to_numpy()
+    if unparsed.any():
+        print(f"Dropping {unparsed.sum()} readings without a valid dateTime")
+        metric_raw_chunk_df = metric_raw_chunk_df[~unparsed]
+        date_times = date_times[~unparsed]
+    # the views only keep epoch seconds, US/Eastern time is rendered by the dashboard
+    metric_raw_chunk_df["dateTime"] = to_epoch_seconds(date_times)
 
-    metric_raw_chunk_df["estDateTime"] = metric_raw_chunk_df["dateTime"].dt.tz_convert(
-        est_tz
-    )
-    metric_raw_chunk_df["estDateTime"] = metric_raw_chunk_df["estDateTime"].dt.strftime(
-        "%Y-%m-%d %H:%M:%S%z"
-    )
-    metric_raw_chunk_df["dateTime"] = pd.to_numeric(
-        metric_raw_chunk_df["dateTime"].dt.strftime("%s"), downcast="integer"
-    )
-
-    return metric_raw_chunk_df.drop_duplicates(keep="first")
+    return metric_raw_chunk_df
 
 
 def generate_metric_view_data(
@@ -142,176 +192,354 @@ def generate_metric_view_data(
     Returns:
         pd.DataFrame: Battery voltage data including the geotab mappings
     """
-    geotab_df = get_geotab_mappings_dataframe()
-    metric_data_df = metric_data_df.merge(
-        geotab_df, left_on=["device"], right_on=["Geotab Device"]
+    return _add_bus_numbers(metric_data_df, get_geotab_mapping())
+
+
+def _add_bus_numbers(
+    metric_data_df: pd.DataFrame, geotab_mapping: GeotabMapping
+) -> pd.DataFrame:
+    buses = geotab_mapping.get_buses(metric_data_df["device"])
+    mapped = buses.notna().to_numpy()
+    return pd.DataFrame(
+        {
+            "data": metric_data_df["data"].to_numpy()[mapped],
+            "dateTime": metric_data_df["dateTime"].to_numpy()[mapped],
+            "Bus #": buses.array[mapped],
+        }
+    )
+
+
+# every partition of a dask dataframe needs the same dtypes, format_metric_df downcasts
+# the data column per file
+_OUT_OF_CORE_DATA_DTYPES = {"float": "float32", "integer": "int32"}
+
+
+def _format_metric_file(
+    file_id: str, data_dtype: Literal["float", "integer"] = "float"
+) -> pd.DataFrame:
+    metric_df = format_metric_df(
+        get_csv_from_drive_as_dataframe(  # type: ignore
+            file_id,
+            pandas_read_csv_kwargs={"dtype": str, "index_col": 0, "iterator": True},
+        ),
+        data_dtype=data_dtype,
     )
-    metric_data_df["Bus #"] = metric_data_df["Bus #"].astype("category")
-    return metric_data_df[["data", "dateTime", "estDateTime", "Bus #"]].drop_duplicates(
-        keep="first"
+    return metric_df.astype(
+        {"data": _OUT_OF_CORE_DATA_DTYPES[data_dtype], "device": str}
     )
 
 
+def _get_staged_partition_paths(staging_directory: str) -> list[str]:
+    return [
+        os.path.join(staging_directory, file_name)
+        for file_name in sorted(os.listdir(staging_directory))
+        if file_name.endswith(".parquet")
+    ]
+
+
+def generate_metric_view_data_out_of_core(
+    metric_file_id_list: list[str],
+    data_dtype: Literal["float", "integer"] = "float",
+    files_per_partition: int = OUT_OF_CORE_FILES_PER_PARTITION,
+    spill_directory: str = DASK_SPILL_DIRECTORY,
+) -> Iterator[pd.DataFrame]:
+    """Out of core version of generate_dataframe_for_metric_data followed by
+    generate_metric_view_data, for raw data which does not fit in memory.  Parsing, the
+    geotab merge and sorting run as a partitioned dask graph: the parsed files are
+    staged as parquet in spill_directory, then sorted by dateTime with a disk shuffle.
+    Only a few partitions are in memory at any time.  Rows are not deduplicated, the
+    RowHashIndex of the view does that when the partitions are uploaded.
+
+    Args:
+        metric_file_id_list (list[str]): The raw metric csvs
+        data_dtype (Literal["float", "integer"], optional): see format_metric_df.
+        Defaults to "float".
+        files_per_partition (int, optional): Raw files per partition of the view.
+        Defaults to OUT_OF_CORE_FILES_PER_PARTITION.
+        spill_directory (str, optional): Local directory the staged partitions and
+        shuffles are written to. Defaults to DASK_SPILL_DIRECTORY.
+
+    Yields:
+        pd.DataFrame: The view data ordered by dateTime, one partition at a time
+    """
+    if not metric_file_id_list:
+        return
+    npartitions = max(1, math.ceil(len(metric_file_id_list) / files_per_partition))
+    geotab_mapping = get_geotab_mapping()
+    meta = pd.DataFrame(
+        {
+            "data": pd.Series(dtype=_OUT_OF_CORE_DATA_DTYPES[data_dtype]),
+            "device": pd.Series(dtype=object),
+            "dateTime": pd.Series(dtype="int64"),
+        }
+    )
+    os.makedirs(spill_directory, exist_ok=True)
+    with dask.config.set(
+        {"temporary_directory": spill_directory, "dataframe.shuffle.method": "disk"}
+    ), tempfile.TemporaryDirectory(dir=spill_directory) as staging_directory:
+        merged_directory = os.path.join(staging_directory, "merged")
+        view_directory = os.path.join(staging_directory, "view")
+        # staged so the raw files are only downloaded and parsed once, sorting reads
+        # its input twice to pick the partition boundaries
+        dd.from_delayed(
+            [
+                dask.delayed(_format_metric_file)(file_id, data_dtype)
+                for file_id in metric_file_id_list
+            ],
+            meta=meta,
+        ).map_partitions(
+            _add_bus_numbers,
+            geotab_mapping,
+            meta=_add_bus_numbers(meta, geotab_mapping),
+        ).to_parquet(
+            merged_directory, write_index=False
+        )
+        dd.read_parquet(merged_directory).sort_values(
+            "dateTime", npartitions=npartitions
+        ).to_parquet(
+            view_directory,
+            write_index=False,
+            name_function=lambda partition: f"part.{partition:06d}.parquet",
+        )
+        for partition_path in _get_staged_partition_paths(view_directory):
+            view_df = pd.read_parquet(partition_path)
+            if len(view_df):
+                view_df["Bus #"] = view_df["Bus #"].astype("category")
+                yield view_df.reset_index(drop=True)
+
+
 def upload_metrics_view_data(
-    file_id: str, file_name: str, metric_df: pd.DataFrame, overwrite: bool = False
-):
+    file_id: str,
+    file_name: str,
+    metric_df: pd.DataFrame,
+    overwrite: bool = False,
+    parquet_view_name: Optional[str] = None,
+    row_hash_index: Optional[RowHashIndex] = None,
+) -> pd.DataFrame:
     """Gets the existing metrics view file appends the new data to it and uploads the result.
-    It also compares the dataframe created to the current view dataframe.  If the data is different
-    then a snapshot of the view data is saved in the View Data/Metrics Snapshot folder
+    Rows already in the view are dropped through the RowHashIndex of the view, which is the
+    only place the metric pipelines deduplicate.  The rows added are saved as a snapshot in
+    the View Data/Metrics Snapshot folder, see save_view_snapshot
+
+    When parquet_view_name is passed the view is segmented instead: the new data is uploaded
+    as a new parquet segment of the view and the csv view is left untouched, so a run only
+    uploads what it produced.
 
     Args:
         file_id (str): The alphanumeric code id of the metric view file
         file_name (str): The filename of the metric view file
         metric_df (pd.DataFrame): The data being uploaded
+        overwrite (bool, optional): Replace the view with metric_df instead of adding to it.
+        parquet_view_name (Optional[str], optional): Name of the segmented parquet view,
+        sorted by Bus # and dateTime. Defaults to None.
+        row_hash_index (Optional[RowHashIndex], optional): The index of the view, for
+        callers uploading several times in a row. It is updated but not saved, the caller
+        saves it with save_row_hash_index. Defaults to loading and saving the index.
+
+    Returns:
+        pd.DataFrame: the rows added to the view, without the rows it already held
     """
-    drive_service = DriveService()
-    current_view_metrics_df = pd.DataFrame()
-    if overwrite == False:
-        current_view_metrics_df = pd.DataFrame(
-            get_csv_from_drive_as_dataframe(
-                file_id,
+    drive_service = get_drive_service()
+    snapshot_name = file_name.split(".csv")[0]
+    view_file_name = parquet_view_name or file_name
+    row_hash_index_id = None
+    save_index = row_hash_index is None
+    if parquet_view_name is not None:
+        if row_hash_index is None:
+            row_hash_index_id, row_hash_index = load_row_hash_index(
+                parquet_view_name,
+                METRICS_FINALIZED_DATA_FOLDER,
+                get_view_df=lambda: read_parquet_view(
+                    parquet_view_name,
+                    METRICS_FINALIZED_DATA_FOLDER,
+                    normalize=upgrade_legacy_metric_view,
+                    drive_service=drive_service,
+                ),
                 drive_service=drive_service,
-                pandas_read_csv_kwargs={
-                    "dtype": {
-                        "data": "float16[pyarrow]",
-                        "Bus #": "category",
-                        "estDateTime": "string[pyarrow]",
-                        "dateTime": "uint32[pyarrow]",
-                    },
-                },
             )
+        if overwrite:
+            row_hash_index.clear()
+        added_df = row_hash_index.drop_seen_rows(metric_df)
+        upload_segment = (
+            replace_parquet_view_segments if overwrite else append_parquet_view_segment
         )
-    # current_view_metrics_df['estDateTime'] = pd.to_datetime(current_view_metrics_df['estDateTime'], format="mixed", utc=False, errors="coerce")
-    # current_view_metrics_df['estDateTime'] = current_view_metrics_df['estDateTime'].apply(lambda x: x.strftime('%Y-%m-%d %H:%M:%S%z'))
-    # current_view_metrics_df['estDateTime'] = current_view_metrics_df['estDateTime'].astype("string")
-    # current_view_metrics_df['dateTime'] = pd.to_datetime(current_view_metrics_df['dateTime'], format="mixed", utc=False, errors="coerce")
-    # current_view_metrics_df['dateTime'] = current_view_metrics_df['dateTime]'].dt.strftime('%s').astype(np.int16)
-    # current_view_metrics_df['dateTime'] = current_view_metrics_df['dateTime'].apply(lambda x: x.strftime('%Y-%m-%d %H:%M:%S%z'))
-    # current_view_metrics_df['estDateTime'] = current_view_metrics_df['estDateTime'].astype("string")
-    # current_view_metrics_df['dateTime'] = current_view_metrics_df['dateTime'].astype("string")
-
-    metric_df = (
-        pd.concat([current_view_metrics_df, metric_df])
-        .sort_values(by=["dateTime", "Bus #"])
-        .drop_duplicates(keep="first")
-        .reset_index(drop=True)
-    )
-    # metric_df['data'] = pd.to_numeric(metric_df['data'], downcast="integer")
-    # metric_df['dateTime'] = pd.to_numeric(metric_df['dateTime'], downcast="integer")
-    # metric_df['estDateTime'] = metric_df['estDateTime'].convert_dtypes(dtype_backend="pyarrow")
-    # metric_df['Bus #'] = metric_df['Bus #'].astype('category')
-    if not current_view_metrics_df.equals(metric_df) and not overwrite:
-        from datetime import datetime
-
-        current_view_metrics_df_rowcount = len(current_view_metrics_df)
-        del current_view_metrics_df
-        metric_df_len = len(metric_df)
-        metric_df = StringIO(metric_df.to_csv(index=False))  # type:ignore
-
-        snapshot_file_name = (
-            f"{file_name.split('.csv')[0]}"
-            f"_{datetime.now().strftime('%Y-%m-%d %H:%M')}.csv"
+        upload_segment(
+            added_df,
+            parquet_view_name,
+            METRICS_FINALIZED_DATA_FOLDER,
+            sort_by=["Bus #", "dateTime"],
+            drive_service=drive_service,
         )
-        print(
-            f"old dataframe {current_view_metrics_df_rowcount} rows."
-            f"New dataframe {metric_df_len} rows"
-        )
-        print(
-            "New data is being uploaded view csv."
-            f" Creating backup of new file first {snapshot_file_name}"
-        )
-        drive_service.upload_file(
-            filename=snapshot_file_name,
-            folder_id=METRICS_SNAPSHOT_FOLDER,
-            file=metric_df,
-            mimetype="text/csv",
+        # the rows of a segment are the delta, the whole view is only read when a
+        # new base snapshot is due
+        save_view_snapshot(
+            snapshot_name,
+            METRICS_SNAPSHOT_FOLDER,
+            added_df,
+            get_view_df=lambda: read_parquet_view(  # type: ignore
+                parquet_view_name,
+                METRICS_FINALIZED_DATA_FOLDER,
+                normalize=upgrade_legacy_metric_view,
+                drive_service=drive_service,
+            ),
+            full=overwrite,
+            drive_service=drive_service,
         )
     else:
+        current_view_metrics_df = pd.DataFrame()
+        if overwrite == False:
+            current_view_metrics_df = pd.DataFrame(
+                get_csv_from_drive_as_dataframe(
+                    file_id,
+                    drive_service=drive_service,
+                    ranged=True,
+                    pandas_read_csv_kwargs={
+                        # legacy views already hold epoch seconds in dateTime next to
+                        # estDateTime
+                        "dtype": {
+                            "data": metric_df["data"].dtype,
+                            "Bus #": "category",
+                            "dateTime": "int64",
+                        },
+                        "usecols": ["data", "dateTime", "Bus #"],
+                    },
+                )
+            )
+        if row_hash_index is None:
+            row_hash_index_id, row_hash_index = load_row_hash_index(
+                file_name,
+                METRICS_FINALIZED_DATA_FOLDER,
+                get_view_df=lambda: current_view_metrics_df,
+                drive_service=drive_service,
+            )
+        if overwrite:
+            row_hash_index.clear()
+        added_df = row_hash_index.drop_seen_rows(metric_df)
+        metric_df = (
+            pd.concat([current_view_metrics_df, added_df])
+            .sort_values(by=["dateTime", "Bus #"])
+            .reset_index(drop=True)
+        )
+        if not overwrite and len(added_df):
+            print(
+                f"old dataframe {len(current_view_metrics_df)} rows."
+                f"New dataframe {len(metric_df)} rows"
+            )
         del current_view_metrics_df
 
-    drive_service.upload_file(
-        filename=file_name,
-        file_id=file_id,
-        folder_id=METRICS_FINALIZED_DATA_FOLDER,
-        file=(
-            StringIO(metric_df.to_csv(index=False))
-            if isinstance(metric_df, pd.DataFrame)
-            else metric_df
-        ),
-        mimetype="text/csv",
-    )
+        view_id = drive_service.upload_file(
+            filename=file_name,
+            file_id=file_id,
+            folder_id=METRICS_FINALIZED_DATA_FOLDER,
+            file=dataframe_to_csv_chunks(metric_df),
+            mimetype="text/csv",
+        )
+        # the manifest must not list raw files whose rows never made it to the view
+        if view_id is None:
+            raise ValueError(f"Unable to proceed, upload of {file_name} failed")
+        # the snapshot must not record rows the view never received
+        if overwrite:
+            save_view_snapshot(
+                snapshot_name,
+                METRICS_SNAPSHOT_FOLDER,
+                metric_df,
+                get_view_df=lambda: metric_df,
+                full=True,
+                drive_service=drive_service,
+            )
+        elif len(added_df):
+            save_view_snapshot(
+                snapshot_name,
+                METRICS_SNAPSHOT_FOLDER,
+                added_df,
+                get_view_df=lambda: metric_df,
+                drive_service=drive_service,
+            )
+    if save_index:
+        save_row_hash_index(
+            view_file_name,
+            METRICS_FINALIZED_DATA_FOLDER,
+            row_hash_index,
+            row_hash_index_id,
+            drive_service,
+        )
+    return added_df
 
 
-def get_rpm_data(
-    nrows: Literal["All", "Random"] | int = "All",
-    usecols: list[str] = ["data", "Bus #", "estDateTime"],
+def upload_metrics_view_segments(
+    metric_dfs: Iterable[pd.DataFrame],
+    parquet_view_name: str,
+    row_hash_index: RowHashIndex,
+    overwrite: bool = False,
+    segment_rows: int = OUT_OF_CORE_SEGMENT_ROWS,
 ) -> pd.DataFrame:
-    """Returns RPM data optimized with options allowing for nrows or a random sampling of data, as well
-    as not returning dateTime
+    """upload_metrics_view_data of a segmented view for rows produced in parts, ie the
+    partitions of generate_metric_view_data_out_of_core.  The rows not in the view yet
+    are buffered until segment_rows of them can be uploaded as one segment, and the
+    snapshot of the rows added is saved once all of them are uploaded.
 
     Args:
-        nrows (Literal['All','Random'] | int, optional): All returns all rows, Random will return a sampling
-        of 70% of the rows randomly chosen and a number n will return top n rows. Defaults to "All".
-        usecols (list[str], optional): Which cols you want returned. Defaults to ['data','Bus #', 'estDateTime'].
+        metric_dfs (Iterable[pd.DataFrame]): The data being uploaded, in parts
+        parquet_view_name (str): Name of the segmented parquet view
+        row_hash_index (RowHashIndex): The index of the view, updated but not saved,
+        see upload_metrics_view_data
+        overwrite (bool, optional): Replace the view with metric_dfs instead of adding
+        to it. Defaults to False.
+        segment_rows (int, optional): Rows of a segment, the last one can hold less.
+        Defaults to OUT_OF_CORE_SEGMENT_ROWS.
 
     Returns:
-        pd.DataFrame: RPM data returned with a tad more optimization
+        pd.DataFrame: the rows added to the view, read back from the segments uploaded
     """
-    pandas_read_csv_kwargs = {
-        "dtype": {
-            "data": "int16[pyarrow]",
-            "Bus #": "category",
-            "estDateTime": "string[pyarrow]",
-            "dateTime": "uint32[pyarrow]",
-        },
-        "usecols": usecols,
-        # "parse_dates":['estDateTime'],
-        # "infer_datetime_format":True,
-        "dtype_backend": "pyarrow",
-    }
-
-    def _remove_est_tz_info(df: pd.DataFrame) -> pd.DataFrame:
-        """Removes the -05:00 from the estDatetime
-
-        Args:
-            df (pd.DataFrame): the rpm view
-
-        Returns:
-            pd.DataFrame: RPM view
-        """
-        df["estDateTime"] = df["estDateTime"].str.rsplit("-", n=1, expand=True)[0]
-        df["Bus #"] = df["Bus #"].astype("category")
-        return df
-
-    drive_service = DriveService()
-    if isinstance(nrows, int):
-        pandas_read_csv_kwargs = {
-            "nrows": nrows,
-            **pandas_read_csv_kwargs,
-        }
-    else:
-        pandas_read_csv_kwargs = {
-            "chunksize": 2000,
-            **pandas_read_csv_kwargs,
-        }
-
-    if nrows == "Random":
-        rpm_view_df = _remove_est_tz_info(
-            get_random_sample_of_chunks(
-                get_csv_from_drive_as_dataframe(
-                    RPM_VIEW_DATA_CSV,
-                    drive_service=drive_service,
-                    pandas_read_csv_kwargs=pandas_read_csv_kwargs,
-                ),
-                sample_percent=0.7,
-            )
-        )  # type: ignore
-        rpm_view_df["Bus #"] = rpm_view_df["Bus #"].astype("category")
-        return rpm_view_df
-
-    rpm_view_chunks = get_csv_from_drive_as_dataframe(
-        RPM_VIEW_DATA_CSV,
+    drive_service = get_drive_service()
+    if overwrite:
+        row_hash_index.clear()
+    segment_ids: list[str] = []
+    buffered_dfs: list[pd.DataFrame] = []
+
+    def upload_buffered_rows():
+        # a full rebuild replaces the view with the first segment then adds the others
+        upload_segment = (
+            replace_parquet_view_segments
+            if overwrite and not segment_ids
+            else append_parquet_view_segment
+        )
+        segment_id = upload_segment(
+            pd.concat(buffered_dfs, ignore_index=True),
+            parquet_view_name,
+            METRICS_FINALIZED_DATA_FOLDER,
+            sort_by=["Bus #", "dateTime"],
+            drive_service=drive_service,
+        )
+        segment_ids.append(segment_id)  # type: ignore
+        buffered_dfs.clear()
+
+    for metric_df in metric_dfs:
+        buffered_dfs.append(row_hash_index.drop_seen_rows(metric_df))
+        if sum(len(buffered_df) for buffered_df in buffered_dfs) >= segment_rows:
+            upload_buffered_rows()
+    if buffered_dfs and (overwrite or any(map(len, buffered_dfs))):
+        upload_buffered_rows()
+    if not segment_ids:
+        return pd.DataFrame(columns=["data", "dateTime", "Bus #"])
+    added_df = pd.concat(
+        [
+            read_parquet_file(segment_id, drive_service=drive_service)
+            for segment_id in segment_ids
+        ],
+        ignore_index=True,
+    )
+    save_view_snapshot(
+        parquet_view_name.rsplit(".parquet", 1)[0],
+        METRICS_SNAPSHOT_FOLDER,
+        added_df,
+        get_view_df=lambda: read_parquet_view(  # type: ignore
+            parquet_view_name,
+            METRICS_FINALIZED_DATA_FOLDER,
+            normalize=upgrade_legacy_metric_view,
+            drive_service=drive_service,
+        ),
+        full=overwrite,
         drive_service=drive_service,
-        pandas_read_csv_kwargs=pandas_read_csv_kwargs,
     )
-    return pd.concat((_remove_est_tz_info(rpm_view_df) for rpm_view_df in rpm_view_chunks), ignore_index=True)  # type: ignore
+    return added_df
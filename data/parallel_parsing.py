@@ -0,0 +1,179 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Callable, Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+from pandas.io.parsers.readers import TextFileReader
+
+from connnections.google_drive import WorkerCredentials
+from connnections.storage import DriveBackend, get_drive_service
+from data.CONSTANTS import DRIVE_DOWNLOAD_MAX_WORKERS, PARSE_PROCESSES
+from data.utilities import get_csvs_from_drive_as_dataframes
+
+
+def dataframe_to_arrow_ipc(df: pd.DataFrame) -> bytes:
+    """Serializes a dataframe as an Arrow IPC stream.  The columns are written as
+    contiguous buffers, which is much cheaper to send between processes than pickling
+    a dataframe, and categorical columns stay dictionary encoded.
+
+    Args:
+        df (pd.DataFrame): The dataframe to serialize
+
+    Returns:
+        bytes: Arrow IPC stream
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def arrow_ipc_to_dataframe(payload: bytes) -> pd.DataFrame:
+    """Inverse of dataframe_to_arrow_ipc, the arrow buffers are read in place.
+
+    Args:
+        payload (bytes): Arrow IPC stream
+
+    Returns:
+        pd.DataFrame: The deserialized dataframe
+    """
+    return pa.ipc.open_stream(pa.py_buffer(payload)).read_all().to_pandas()
+
+
+# drive connection of a worker process, opened once by _connect_worker when it starts
+_worker_drive_service: Optional[DriveBackend] = None
+
+
+def _connect_worker(worker_credentials: Optional[WorkerCredentials]) -> None:
+    global _worker_drive_service
+    _worker_drive_service = get_drive_service(worker_credentials)
+
+
+def _parse_csv_from_drive(
+    file_id: str,
+    parse: Callable[[TextFileReader], pd.DataFrame],
+    pandas_read_csv_kwargs: dict,
+) -> bytes:
+    # runs in a worker process, which streams the file itself so only the file id
+    # goes in and only the parsed columns come back.  The disk cache is left to the
+    # parent process, the workers would race on its entries
+    drive_service: DriveBackend = _worker_drive_service  # type: ignore
+    with drive_service.open_file(file_id, use_cache=False) as file:
+        return dataframe_to_arrow_ipc(
+            parse(pd.read_csv(file, **pandas_read_csv_kwargs))  # type: ignore
+        )
+
+
+def create_parse_executor(
+    processes: int, drive_service: Optional[DriveBackend] = None
+) -> ProcessPoolExecutor:
+    """Starts the worker processes of parse_csvs_in_processes.  Every worker connects
+    to drive once when it starts, with the credentials of drive_service instead of
+    running the login flow.  Starting the workers takes seconds, a pipeline creates
+    one executor per run and passes it to every parse_csvs_from_drive call.
+
+    Args:
+        processes (int): Number of worker processes
+        drive_service (Optional[DriveBackend], optional): connection of this process.
+        Defaults to get_drive_service().
+
+    Returns:
+        ProcessPoolExecutor: shut it down once the run is over, ie in a with block
+    """
+    drive_service = drive_service or get_drive_service()
+    # workers are spawned rather than forked, a forked worker would share the http
+    # connections of the parent's drive service
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_connect_worker,
+        initargs=(drive_service.worker_credentials,),
+    )
+
+
+def parse_csvs_in_processes(
+    file_ids: list[str],
+    parse: Callable[[TextFileReader], pd.DataFrame],
+    pandas_read_csv_kwargs: dict,
+    executor: ProcessPoolExecutor,
+    processes: int,
+) -> Iterator[pd.DataFrame]:
+    """Downloads and parses csv files in a pool of processes, so parsing is not bound
+    to a single core by the GIL.  Yields the parsed files in the order they finish,
+    with at most 2 * processes parsed files waiting to be consumed.
+
+    Args:
+        file_ids (list[str]): Alphanumeric IDs of the csv files
+        parse (Callable[[TextFileReader], pd.DataFrame]): turns the read_csv result of a
+        file into a dataframe, ie format_metric_df. Must be a module level function or a
+        functools.partial of one so it can be sent to the workers.
+        pandas_read_csv_kwargs (dict): any arguments you want to pass to the pandas read_csv call.
+        executor (ProcessPoolExecutor): from create_parse_executor
+        processes (int): Number of worker processes of the executor
+
+    Yields:
+        pd.DataFrame: The parsed dataframe of one file
+    """
+    file_id_iter = iter(file_ids)
+    pending = set()
+    while True:
+        pending |= {
+            executor.submit(
+                _parse_csv_from_drive, file_id, parse, pandas_read_csv_kwargs
+            )
+            for file_id in islice(file_id_iter, 2 * processes - len(pending))
+        }
+        if not pending:
+            break
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield arrow_ipc_to_dataframe(future.result())
+
+
+def parse_csvs_from_drive(
+    file_ids: list[str],
+    parse: Callable[[TextFileReader], pd.DataFrame],
+    pandas_read_csv_kwargs: dict,
+    drive_service: Optional[DriveBackend] = None,
+    max_workers: int = DRIVE_DOWNLOAD_MAX_WORKERS,
+    processes: int = PARSE_PROCESSES,
+    executor: Optional[ProcessPoolExecutor] = None,
+) -> Iterator[pd.DataFrame]:
+    """Downloads and parses csv files, in a pool of processes when processes is above 1
+    and there is more than one file or when an executor is passed, otherwise in this
+    process as the downloads finish.
+
+    Args:
+        file_ids (list[str]): Alphanumeric IDs of the csv files
+        parse (Callable[[TextFileReader], pd.DataFrame]): turns the read_csv result of a
+        file into a dataframe, see parse_csvs_in_processes
+        pandas_read_csv_kwargs (dict): any arguments you want to pass to the pandas read_csv call.
+        max_workers (int, optional): How many files are downloaded at the same time when
+        parsing in this process. Defaults to DRIVE_DOWNLOAD_MAX_WORKERS.
+        processes (int, optional): Number of worker processes. Defaults to PARSE_PROCESSES.
+        executor (Optional[ProcessPoolExecutor], optional): workers shared by the calls
+        of a run, see create_parse_executor.  processes is its number of workers.
+        Defaults to starting workers for this call when processes is above 1.
+
+    Yields:
+        pd.DataFrame: The parsed dataframe of one file
+    """
+    if executor is not None:
+        yield from parse_csvs_in_processes(
+            file_ids, parse, pandas_read_csv_kwargs, executor, processes
+        )
+        return
+    if processes > 1 and len(file_ids) > 1:
+        processes = min(processes, len(file_ids))
+        with create_parse_executor(processes, drive_service) as executor:
+            yield from parse_csvs_in_processes(
+                file_ids, parse, pandas_read_csv_kwargs, executor, processes
+            )
+        return
+    for chunks in get_csvs_from_drive_as_dataframes(
+        file_ids, drive_service, pandas_read_csv_kwargs, max_workers=max_workers
+    ):
+        yield parse(chunks)  # type: ignore
@@ -0,0 +1,478 @@
+import json
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional, TypedDict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from connnections.storage import DriveBackend, get_drive_service
+from data.CONSTANTS import DRIVE_DOWNLOAD_MAX_WORKERS, VIEW_PARQUET_ROW_GROUP_SIZE
+from data.sampling import HashSample, sample_arrow_table
+from data.utilities import find_file_id_by_name
+
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+
+
+class ViewSegmentTypedDict(TypedDict):
+    id: str  # drive id of the segment file
+    name: str  # file name of the segment
+    rows: int  # number of rows in the segment
+
+
+class ViewIndexTypedDict(TypedDict):
+    view: str  # name of the view, ie rpm_view_data.parquet
+    segments: list[ViewSegmentTypedDict]  # segments in the order they were written
+
+
+def write_parquet_view(
+    view_df: pd.DataFrame,
+    path: str,
+    sort_by: list[str],
+    row_group_size: int = VIEW_PARQUET_ROW_GROUP_SIZE,
+) -> None:
+    """Writes a view as parquet sorted by sort_by.  Sorting keeps the row group min/max
+    statistics of the sort columns narrow so filtered reads can skip most row groups.
+
+    Args:
+        view_df (pd.DataFrame): The view being written
+        path (str): local path of the parquet file
+        sort_by (list[str]): Columns the rows are sorted by, ie ['Bus #', 'dateTime']
+        row_group_size (int, optional): Rows per row group.
+        Defaults to VIEW_PARQUET_ROW_GROUP_SIZE.
+    """
+    view_df = view_df.sort_values(by=sort_by, ignore_index=True)
+    pq.write_table(
+        pa.Table.from_pandas(view_df, preserve_index=False),
+        path,
+        row_group_size=row_group_size,
+        compression="zstd",
+        write_statistics=True,
+    )
+
+
+def upload_parquet_file(
+    view_df: pd.DataFrame,
+    file_name: str,
+    folder_id: str,
+    sort_by: list[str],
+    drive_service: DriveBackend,
+    file_id: str = "",
+) -> Optional[str]:
+    """Writes a dataframe with write_parquet_view and uploads it as file_name,
+    replacing the contents of file_id when passed.
+
+    Returns:
+        Optional[str]: id of the uploaded file, None if the upload failed
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, file_name)
+        write_parquet_view(view_df, path, sort_by)
+        with open(path, "rb") as parquet_file:
+            return drive_service.upload_file(
+                filename=file_name,
+                folder_id=folder_id,
+                file=parquet_file,
+                mimetype=PARQUET_MIMETYPE,
+                file_id=file_id,
+            )
+
+
+def upload_parquet_view(
+    view_df: pd.DataFrame,
+    view_name: str,
+    folder_id: str,
+    sort_by: list[str],
+    drive_service: Optional[DriveBackend] = None,
+) -> Optional[str]:
+    """Writes a view as a single parquet file and uploads it, replacing the existing file
+    of the same name.  Views written through append_parquet_view_segment are read from
+    their index instead, use replace_parquet_view_segments to rewrite those.
+
+    Args:
+        view_df (pd.DataFrame): The view being uploaded
+        view_name (str): File name of the view, ie rpm_view_data.parquet
+        folder_id (str): Folder the view is saved in
+        sort_by (list[str]): Columns the rows are sorted by
+
+    Returns:
+        Optional[str]: id of the uploaded view
+    """
+    drive_service = drive_service or get_drive_service()
+    file_id = find_file_id_by_name(folder_id, view_name, drive_service)
+    return upload_parquet_file(
+        view_df, view_name, folder_id, sort_by, drive_service, file_id or ""
+    )
+
+
+def get_view_index_name(view_name: str) -> str:
+    """Name of the index file listing the segments of a view,
+    ie rpm_view_data.parquet -> rpm_view_data.index.json"""
+    return f"{view_name.rsplit('.parquet', 1)[0]}.index.json"
+
+
+def load_view_index(
+    view_name: str, folder_id: str, drive_service: Optional[DriveBackend] = None
+) -> tuple[Optional[str], Optional[ViewIndexTypedDict]]:
+    """Loads the index of a segmented view.
+
+    Args:
+        view_name (str): File name of the view, ie rpm_view_data.parquet
+        folder_id (str): Folder the view is saved in
+
+    Returns:
+        tuple[Optional[str], Optional[ViewIndexTypedDict]]: id of the index file and the
+        index, both None when the view is not segmented
+    """
+    drive_service = drive_service or get_drive_service()
+    index_id = find_file_id_by_name(
+        folder_id, get_view_index_name(view_name), drive_service
+    )
+    if index_id is None:
+        return None, None
+    return index_id, json.loads(drive_service.get_file(index_id))
+
+
+def _save_view_index(
+    index: ViewIndexTypedDict,
+    folder_id: str,
+    index_id: Optional[str],
+    drive_service: DriveBackend,
+) -> str:
+    # uploading the index is what publishes segments to readers, a segment which was
+    # uploaded but is missing from the index is never read.  Callers must not go on
+    # (saving row hash indexes and manifests, trashing segments) when it failed
+    index_name = get_view_index_name(index["view"])
+    saved_index_id = drive_service.upload_file(
+        filename=index_name,
+        folder_id=folder_id,
+        file=[json.dumps(index, indent=1).encode()],
+        mimetype="application/json",
+        file_id=index_id or "",
+    )
+    if saved_index_id is None:
+        raise ValueError(f"Unable to proceed, upload of index {index_name} failed")
+    return saved_index_id
+
+
+def _get_segment_name(view_name: str) -> str:
+    return (
+        f"{view_name.rsplit('.parquet', 1)[0]}"
+        f".{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}"
+        f"-{uuid.uuid4().hex[:8]}.parquet"
+    )
+
+
+def _upload_view_segment(
+    view_df: pd.DataFrame,
+    view_name: str,
+    folder_id: str,
+    sort_by: list[str],
+    drive_service: DriveBackend,
+) -> ViewSegmentTypedDict:
+    segment_name = _get_segment_name(view_name)
+    segment_id = upload_parquet_file(
+        view_df, segment_name, folder_id, sort_by, drive_service
+    )
+    if segment_id is None:
+        raise ValueError(f"Unable to proceed, upload of segment {segment_name} failed")
+    return {"id": segment_id, "name": segment_name, "rows": len(view_df)}
+
+
+def append_parquet_view_segment(
+    view_df: pd.DataFrame,
+    view_name: str,
+    folder_id: str,
+    sort_by: list[str],
+    drive_service: Optional[DriveBackend] = None,
+) -> Optional[str]:
+    """Adds rows to a view by uploading them as a new immutable segment and listing it
+    in the view's index, so a run only uploads the rows it produced.  The rows already in
+    the view are never downloaded, overlapping rows are dropped by compact_parquet_view.
+    A view uploaded as a single parquet file becomes the first segment of the index.
+
+    Args:
+        view_df (pd.DataFrame): The new rows
+        view_name (str): File name of the view, ie rpm_view_data.parquet
+        folder_id (str): Folder the view is saved in
+        sort_by (list[str]): Columns the rows of the segment are sorted by
+
+    Returns:
+        Optional[str]: id of the uploaded segment, None when there were no rows to add
+    """
+    drive_service = drive_service or get_drive_service()
+    if view_df.empty:
+        print(f"No new rows for {view_name}")
+        return None
+    index_id, index = load_view_index(view_name, folder_id, drive_service)
+    if index is None:
+        index = {"view": view_name, "segments": []}
+        if (
+            view_id := find_file_id_by_name(folder_id, view_name, drive_service)
+        ) is not None:
+            index["segments"].append(
+                {
+                    "id": view_id,
+                    "name": view_name,
+                    "rows": pq.ParquetFile(
+                        drive_service.open_file_ranged(view_id)
+                    ).metadata.num_rows,
+                }
+            )
+    segment = _upload_view_segment(
+        view_df, view_name, folder_id, sort_by, drive_service
+    )
+    index["segments"].append(segment)
+    _save_view_index(index, folder_id, index_id, drive_service)
+    print(f"Added segment {segment['name']} of {segment['rows']} rows to {view_name}")
+    return segment["id"]
+
+
+def replace_parquet_view_segments(
+    view_df: pd.DataFrame,
+    view_name: str,
+    folder_id: str,
+    sort_by: list[str],
+    drive_service: Optional[DriveBackend] = None,
+) -> Optional[str]:
+    """Replaces every segment of a view by a single segment holding view_df.  The
+    segments it replaces are only trashed once the new index is saved, when saving it
+    fails the view keeps its previous segments.
+
+    Args:
+        view_df (pd.DataFrame): The whole view
+        view_name (str): File name of the view, ie rpm_view_data.parquet
+        folder_id (str): Folder the view is saved in
+        sort_by (list[str]): Columns the rows are sorted by
+
+    Returns:
+        Optional[str]: id of the new segment
+    """
+    drive_service = drive_service or get_drive_service()
+    index_id, index = load_view_index(view_name, folder_id, drive_service)
+    previous_segments = index["segments"] if index is not None else []
+    segment = _upload_view_segment(
+        view_df, view_name, folder_id, sort_by, drive_service
+    )
+    _save_view_index(
+        {"view": view_name, "segments": [segment]}, folder_id, index_id, drive_service
+    )
+    for previous_segment in previous_segments:
+        drive_service.trash_file(previous_segment["id"])
+    return segment["id"]
+
+
+def compact_parquet_view(
+    view_name: str,
+    folder_id: str,
+    sort_by: list[str],
+    min_segments: int = 2,
+    normalize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    drive_service: Optional[DriveBackend] = None,
+) -> Optional[str]:
+    """Merges the segments of a view into one deduplicated segment, keeping the number
+    of files readers open small.  Runs separately from the ingestion pipelines.
+
+    Args:
+        view_name (str): File name of the view, ie rpm_view_data.parquet
+        folder_id (str): Folder the view is saved in
+        sort_by (list[str]): Columns the rows are sorted by
+        min_segments (int, optional): Only compact views with at least this many
+        segments. Defaults to 2.
+        normalize (Optional[Callable[[pd.DataFrame], pd.DataFrame]], optional): applied
+        to every segment before merging, ie to upgrade segments of an older schema.
+
+    Returns:
+        Optional[str]: id of the compacted segment, None when nothing was compacted
+    """
+    drive_service = drive_service or get_drive_service()
+    _, index = load_view_index(view_name, folder_id, drive_service)
+    if index is None or len(index["segments"]) < min_segments:
+        print(f"Nothing to compact for {view_name}")
+        return None
+    # segments written by different runs can overlap when a raw file was reprocessed
+    view_df = (
+        _read_view_segments(
+            index["segments"], normalize=normalize, drive_service=drive_service
+        )
+        .drop_duplicates(keep="first")
+        .reset_index(drop=True)
+    )
+    print(
+        f"Compacting {len(index['segments'])} segments of {view_name}"
+        f" into {len(view_df)} rows"
+    )
+    return replace_parquet_view_segments(
+        view_df, view_name, folder_id, sort_by, drive_service
+    )
+
+
+def parquet_view_has_column(
+    view_name: str,
+    folder_id: str,
+    column: str,
+    drive_service: Optional[DriveBackend] = None,
+) -> bool:
+    """Checks every segment of a view holds a column, only the footers of the segments
+    are read.
+
+    Args:
+        view_name (str): File name of the view, ie rpm_view_data.parquet
+        folder_id (str): Folder the view is saved in
+        column (str): the column, ie a column added to the view after it was created
+
+    Returns:
+        bool: False when a segment lacks the column, True when there is no view yet
+    """
+    drive_service = drive_service or get_drive_service()
+    _, index = load_view_index(view_name, folder_id, drive_service)
+    if index is not None:
+        file_ids = [segment["id"] for segment in index["segments"]]
+    else:
+        file_id = find_file_id_by_name(folder_id, view_name, drive_service)
+        file_ids = [] if file_id is None else [file_id]
+    return all(
+        column
+        in pq.ParquetFile(drive_service.open_file_ranged(file_id)).schema_arrow.names
+        for file_id in file_ids
+    )
+
+
+def read_parquet_file(
+    file_id: str,
+    columns: Optional[list[str]] = None,
+    filters: Optional[list[tuple[str, str, Any]]] = None,
+    nrows: Optional[int] = None,
+    drive_service: Optional[DriveBackend] = None,
+    sample: Optional[HashSample] = None,
+) -> pd.DataFrame:
+    """Reads a parquet file only decoding the requested columns, and skipping the row
+    groups whose min/max statistics can not match the filters.
+
+    Args:
+        file_id (str): The alphanumeric id of the parquet file
+        columns (Optional[list[str]], optional): Columns to read. Defaults to all.
+        filters (Optional[list[tuple[str, str, Any]]], optional): pyarrow filters,
+        ie [('Bus #', 'in', ['1001'])]. Defaults to None.
+        nrows (Optional[int], optional): Only read the first n rows. Defaults to all.
+        sample (Optional[HashSample], optional): Only return the rows in this sample,
+        they are picked before the rows are converted to pandas. Defaults to all rows.
+
+    Returns:
+        pd.DataFrame: The rows read
+    """
+    drive_service = drive_service or get_drive_service()
+    view_file = drive_service.open_file_ranged(file_id)
+    read_columns = columns
+    if sample is not None and columns is not None:
+        read_columns = list(dict.fromkeys([*columns, *sample.key_columns]))
+    if nrows is not None and not filters:
+        # only the row groups covering the first nrows are decoded
+        batch = next(
+            pq.ParquetFile(view_file).iter_batches(
+                batch_size=nrows, columns=read_columns
+            ),
+            None,
+        )
+        if batch is None:
+            return pd.DataFrame(columns=columns)
+        table = pa.Table.from_batches([batch])
+    else:
+        table = pq.read_table(view_file, columns=read_columns, filters=filters)
+        if nrows is not None:
+            table = table.slice(0, nrows)
+    if sample is not None:
+        table = sample_arrow_table(table, sample)
+        if columns is not None:
+            table = table.select(columns)
+    return table.to_pandas()
+
+
+def _read_view_segments(
+    segments: list[ViewSegmentTypedDict],
+    columns: Optional[list[str]] = None,
+    filters: Optional[list[tuple[str, str, Any]]] = None,
+    nrows: Optional[int] = None,
+    normalize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    drive_service: Optional[DriveBackend] = None,
+    sample: Optional[HashSample] = None,
+) -> pd.DataFrame:
+    drive_service = drive_service or get_drive_service()
+
+    def read_segment(segment: ViewSegmentTypedDict, nrows: Optional[int]):
+        segment_df = read_parquet_file(
+            segment["id"], columns, filters, nrows, drive_service, sample
+        )
+        return segment_df if normalize is None else normalize(segment_df)
+
+    if nrows is not None:
+        # the first segments are enough to fill nrows, no need to download the others
+        segment_dfs = []
+        for segment in segments:
+            segment_dfs.append(read_segment(segment, nrows))
+            if sum(len(segment_df) for segment_df in segment_dfs) >= nrows:
+                break
+    else:
+        with ThreadPoolExecutor(
+            max_workers=min(DRIVE_DOWNLOAD_MAX_WORKERS, max(len(segments), 1))
+        ) as executor:
+            segment_dfs = list(
+                executor.map(lambda segment: read_segment(segment, None), segments)
+            )
+    if not segment_dfs:
+        return pd.DataFrame(columns=columns)
+    if len(segment_dfs) == 1:
+        view_df = segment_dfs[0]
+    else:
+        # overlapping segments are left to compact_parquet_view, deduping on every read
+        # would cost a full hash of the view
+        view_df = pd.concat(segment_dfs, ignore_index=True)
+    return view_df if nrows is None else view_df.head(nrows)
+
+
+def read_parquet_view(
+    view_name: str,
+    folder_id: str,
+    columns: Optional[list[str]] = None,
+    filters: Optional[list[tuple[str, str, Any]]] = None,
+    nrows: Optional[int] = None,
+    normalize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    drive_service: Optional[DriveBackend] = None,
+    sample: Optional[HashSample] = None,
+) -> Optional[pd.DataFrame]:
+    """Reads a parquet view, the union of the segments listed in its index when the
+    view is segmented, otherwise the single parquet file named view_name.
+    Only the requested columns are decoded and the row groups whose min/max statistics
+    can not match the filters are skipped.
+
+    Args:
+        view_name (str): File name of the view, ie rpm_view_data.parquet
+        folder_id (str): Folder the view is saved in
+        columns (Optional[list[str]], optional): Columns to read. Defaults to all.
+        filters (Optional[list[tuple[str, str, Any]]], optional): pyarrow filters,
+        ie [('Bus #', 'in', ['1001'])]. Defaults to None.
+        nrows (Optional[int], optional): Only read the first n rows. Defaults to all.
+        normalize (Optional[Callable[[pd.DataFrame], pd.DataFrame]], optional): applied
+        to every segment before they are combined, ie to upgrade segments of an older schema.
+        sample (Optional[HashSample], optional): Only return the rows in this sample,
+        see read_parquet_file. Its key columns are read as stored, before normalize.
+        Defaults to all rows.
+
+    Returns:
+        Optional[pd.DataFrame]: The view, None when there is no parquet view yet
+    """
+    drive_service = drive_service or get_drive_service()
+    _, index = load_view_index(view_name, folder_id, drive_service)
+    if index is not None:
+        return _read_view_segments(
+            index["segments"], columns, filters, nrows, normalize, drive_service, sample
+        )
+    file_id = find_file_id_by_name(folder_id, view_name, drive_service)
+    if file_id is None:
+        return None
+    view_df = read_parquet_file(file_id, columns, filters, nrows, drive_service, sample)
+    return view_df if normalize is None else normalize(view_df)
@@ -1,9 +1,13 @@
+import threading
 from io import BytesIO
+from typing import Optional
 
+import numpy as np
 import pandas as pd
 
-from connnections.google_drive import DriveService
+from connnections.storage import DriveBackend, get_drive_service
 from data.CONSTANTS import GEOTAB_MAPPINGS_CSV
+from data.ingestion_manifest import get_file_fingerprint
 
 
 def get_geotab_mappings_raw_file() -> BytesIO:
@@ -13,7 +17,7 @@ def get_geotab_mappings_raw_file() -> BytesIO:
     Returns:
         BytesIO: Raw csv data as pulled by the Drive API
     """
-    geotab_bytes = BytesIO(DriveService().get_file(GEOTAB_MAPPINGS_CSV))
+    geotab_bytes = BytesIO(get_drive_service().get_file(GEOTAB_MAPPINGS_CSV))
     return geotab_bytes
 
 
@@ -27,3 +31,84 @@ def get_geotab_mappings_dataframe() -> pd.DataFrame:
     geotab_df = pd.read_csv(get_geotab_mappings_raw_file(), dtype=str)
     geotab_df = geotab_df.rename(columns={"Geotab Name": "Bus #"})
     return geotab_df
+
+
+class GeotabMapping:
+    """Geotab device -> bus lookup built once per version of geotab-mappings.csv.
+    Buses are stored as categorical codes so mapping a column of devices is an array
+    take per distinct device instead of a merge copying every column of the data.
+    """
+
+    def __init__(self, geotab_df: pd.DataFrame, fingerprint: str = ""):
+        """
+        Args:
+            geotab_df (pd.DataFrame): as returned by get_geotab_mappings_dataframe
+            fingerprint (str, optional): version of the mapping file, see
+            get_file_fingerprint. Defaults to "".
+        """
+        geotab_df = geotab_df.dropna(subset=["Geotab Device", "Bus #"])
+        duplicated = geotab_df["Geotab Device"].duplicated(keep="first")
+        if duplicated.any():
+            print(
+                f"{duplicated.sum()} geotab devices are mapped to more than one bus,"
+                f" only their first bus is used: "
+                f"{geotab_df['Geotab Device'][duplicated].head(5).tolist()}"
+            )
+            geotab_df = geotab_df[~duplicated.to_numpy()]
+        buses = pd.Categorical(geotab_df["Bus #"])
+        self.fingerprint = fingerprint
+        self.devices = pd.Index(geotab_df["Geotab Device"])
+        self.bus_dtype = buses.dtype
+        self.bus_codes = buses.codes
+
+    def get_buses(self, devices: pd.Series) -> pd.Series:
+        """Maps geotab devices to their bus.
+
+        Args:
+            devices (pd.Series): geotab device ids, ideally categorical
+
+        Returns:
+            pd.Series: categorical Bus #, NaN for devices missing from the mapping
+        """
+        devices = devices.astype("category")
+        positions = self.devices.get_indexer(devices.cat.categories.astype(str))
+        if len(self.bus_codes):
+            bus_codes = np.where(positions >= 0, self.bus_codes[positions], -1)
+        else:
+            # an empty mapping has no bus to index, every device is missing
+            bus_codes = np.full(len(positions), -1)
+        # one bus code per distinct device, the trailing -1 is taken by missing devices
+        bus_codes_by_device = np.append(bus_codes, -1).astype(self.bus_codes.dtype)
+        return pd.Series(
+            pd.Categorical.from_codes(
+                bus_codes_by_device.take(devices.cat.codes.to_numpy()),
+                dtype=self.bus_dtype,
+            ),
+            index=devices.index,
+            name="Bus #",
+        )
+
+
+_geotab_mapping: Optional[GeotabMapping] = None
+_geotab_mapping_lock = threading.Lock()
+
+
+def get_geotab_mapping(drive_service: Optional[DriveBackend] = None) -> GeotabMapping:
+    """Gets the GeotabMapping of the current geotab-mappings.csv.  The mapping is kept in
+    memory and only downloaded and rebuilt when the drive metadata of the file shows
+    it changed.
+
+    Returns:
+        GeotabMapping: Lookup of the bus of a geotab device
+    """
+    global _geotab_mapping
+    drive_service = drive_service or get_drive_service()
+    fingerprint = get_file_fingerprint(
+        drive_service.get_file_metadata(GEOTAB_MAPPINGS_CSV)
+    )
+    with _geotab_mapping_lock:
+        if _geotab_mapping is None or _geotab_mapping.fingerprint != fingerprint:
+            _geotab_mapping = GeotabMapping(
+                get_geotab_mappings_dataframe(), fingerprint
+            )
+        return _geotab_mapping
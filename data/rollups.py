@@ -0,0 +1,247 @@
+from typing import Callable, Literal, Optional
+
+import numpy as np
+import pandas as pd
+
+from connnections.storage import DriveBackend, get_drive_service
+from data.parquet_views import read_parquet_file, upload_parquet_file
+from data.timestamps import epoch_seconds_to_eastern
+from data.utilities import find_file_id_by_name
+
+RollupPeriod = Literal["hourly", "daily", "monthly"]
+METRIC_ROLLUP_PERIODS: tuple[RollupPeriod, ...] = ("hourly", "daily")
+
+
+def get_rollup_name(view_file_name: str, period: RollupPeriod) -> str:
+    """Name of a rollup of a view, ie rpm_view_data.parquet.daily_rollup.parquet"""
+    return f"{view_file_name}.{period}_rollup.parquet"
+
+
+def get_eastern_periods(epoch_seconds: pd.Series, period: RollupPeriod) -> pd.Series:
+    """
+    Args:
+        epoch_seconds (pd.Series): seconds since the unix epoch
+        period (RollupPeriod): hourly, daily or monthly
+
+    Returns:
+        pd.Series: US/Eastern start of the hour, day or month each time falls in
+    """
+    eastern = epoch_seconds_to_eastern(epoch_seconds)
+    if period == "monthly":
+        return eastern.dt.to_period("M").dt.to_timestamp()
+    return eastern.dt.floor("H" if period == "hourly" else "D")
+
+
+def _add_mean_std(rollup_df: pd.DataFrame) -> pd.DataFrame:
+    # sample standard deviation like pandas' std, NaN for a single reading
+    rollup_df["mean"] = rollup_df["sum"] / rollup_df["count"]
+    squared_deviations = rollup_df["sum_sq"] - rollup_df["sum"] * rollup_df["mean"]
+    degrees_of_freedom = (rollup_df["count"] - 1).where(rollup_df["count"] > 1)
+    rollup_df["std"] = np.sqrt((squared_deviations / degrees_of_freedom).clip(lower=0))
+    rollup_df["Bus #"] = rollup_df["Bus #"].astype("category")
+    return rollup_df
+
+
+def compute_metric_rollup(
+    metric_df: pd.DataFrame, period: RollupPeriod
+) -> pd.DataFrame:
+    """Summarizes the readings of every bus per US/Eastern hour or day.  The sum and
+    sum of squares are kept next to the statistics, so a rollup can be merged with the
+    rollup of new rows without reading the view again.
+
+    Args:
+        metric_df (pd.DataFrame): rows of a metric view, data, dateTime and Bus #
+        period (RollupPeriod): hourly or daily
+
+    Returns:
+        pd.DataFrame: Bus #, estPeriod, count, min, max, sum, sum_sq, mean and std
+        per bus and period
+    """
+    data = metric_df["data"].astype(np.float64)
+    rollup_df = (
+        pd.DataFrame(
+            {
+                "Bus #": metric_df["Bus #"].astype(str).to_numpy(),
+                "estPeriod": get_eastern_periods(metric_df["dateTime"], period),
+                "data": data.to_numpy(),
+                "data_sq": np.square(data.to_numpy()),
+            }
+        )
+        .groupby(["Bus #", "estPeriod"])
+        .agg(
+            count=("data", "count"),
+            min=("data", "min"),
+            max=("data", "max"),
+            sum=("data", "sum"),
+            sum_sq=("data_sq", "sum"),
+        )
+        .reset_index()
+    )
+    return _add_mean_std(rollup_df)
+
+
+def merge_metric_rollups(rollups: list[pd.DataFrame]) -> pd.DataFrame:
+    """Merges rollups of disjoint rows of the same view and period, ie the saved rollup
+    and the rollup of the rows an incremental run added.
+
+    Args:
+        rollups (list[pd.DataFrame]): rollups from compute_metric_rollup
+
+    Returns:
+        pd.DataFrame: the rollup of all their rows
+    """
+    rollup_df = (
+        pd.concat([rollup.astype({"Bus #": str}) for rollup in rollups])
+        .groupby(["Bus #", "estPeriod"])
+        .agg(
+            count=("count", "sum"),
+            min=("min", "min"),
+            max=("max", "max"),
+            sum=("sum", "sum"),
+            sum_sq=("sum_sq", "sum"),
+        )
+        .reset_index()
+    )
+    return _add_mean_std(rollup_df)
+
+
+def compute_breakdown_rollup(
+    breakdown_df: pd.DataFrame, period: RollupPeriod = "monthly"
+) -> pd.DataFrame:
+    """Counts the breakdowns of every bus per US/Eastern period.
+
+    Args:
+        breakdown_df (pd.DataFrame): rows of the breakdown view, reportedAt and Bus #
+        period (RollupPeriod, optional): Defaults to monthly.
+
+    Returns:
+        pd.DataFrame: Bus #, estPeriod and count per bus and period with a breakdown
+    """
+    rollup_df = (
+        pd.DataFrame(
+            {
+                "Bus #": breakdown_df["Bus #"].astype(str).to_numpy(),
+                "estPeriod": get_eastern_periods(breakdown_df["reportedAt"], period),
+            }
+        )
+        .groupby(["Bus #", "estPeriod"])
+        .size()
+        .rename("count")
+        .reset_index()
+    )
+    rollup_df["Bus #"] = rollup_df["Bus #"].astype("category")
+    return rollup_df
+
+
+def merge_breakdown_rollups(rollups: list[pd.DataFrame]) -> pd.DataFrame:
+    """Merges rollups of disjoint breakdowns, see merge_metric_rollups
+
+    Args:
+        rollups (list[pd.DataFrame]): rollups from compute_breakdown_rollup
+
+    Returns:
+        pd.DataFrame: the rollup of all their breakdowns
+    """
+    rollup_df = (
+        pd.concat([rollup.astype({"Bus #": str}) for rollup in rollups])
+        .groupby(["Bus #", "estPeriod"])["count"]
+        .sum()
+        .reset_index()
+    )
+    rollup_df["Bus #"] = rollup_df["Bus #"].astype("category")
+    return rollup_df
+
+
+def load_rollup(
+    view_file_name: str,
+    folder_id: str,
+    period: RollupPeriod,
+    drive_service: Optional[DriveBackend] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Args:
+        view_file_name (str): file name of the view, ie rpm_view_data.parquet
+        folder_id (str): folder of the view
+        period (RollupPeriod): hourly, daily or monthly
+
+    Returns:
+        Optional[pd.DataFrame]: the rollup, None when it was not generated yet
+    """
+    drive_service = drive_service or get_drive_service()
+    rollup_id = find_file_id_by_name(
+        folder_id, get_rollup_name(view_file_name, period), drive_service
+    )
+    if rollup_id is None:
+        return None
+    return read_parquet_file(rollup_id, drive_service=drive_service)
+
+
+def update_rollups(
+    view_file_name: str,
+    folder_id: str,
+    periods: tuple[RollupPeriod, ...],
+    added_df: pd.DataFrame,
+    compute_rollup: Callable[[pd.DataFrame, RollupPeriod], pd.DataFrame],
+    merge_rollups: Callable[[list[pd.DataFrame]], pd.DataFrame],
+    get_view_df: Callable[[], Optional[pd.DataFrame]],
+    overwrite: bool = False,
+    drive_service: Optional[DriveBackend] = None,
+):
+    """Updates the rollups saved next to a view with the rows a run added to it.  Only
+    the added rows are summarized and merged into the saved rollups, a rollup which does
+    not exist yet is computed from the whole view.  Update them after the rows were
+    uploaded and their row hash index saved, so rows are never counted twice.
+
+    Args:
+        view_file_name (str): file name of the view, ie rpm_view_data.parquet
+        folder_id (str): folder of the view
+        periods (tuple[RollupPeriod, ...]): periods of the rollups of the view
+        added_df (pd.DataFrame): rows added to the view, as returned by
+        upload_metrics_view_data or upload_breakdown_view_data
+        compute_rollup (Callable[[pd.DataFrame, RollupPeriod], pd.DataFrame]): ie
+        compute_metric_rollup
+        merge_rollups (Callable[[list[pd.DataFrame]], pd.DataFrame]): ie
+        merge_metric_rollups
+        get_view_df (Callable[[], Optional[pd.DataFrame]]): returns the current rows of
+        the view, only called when a rollup does not exist yet
+        overwrite (bool, optional): The view was replaced by added_df.
+        Defaults to False.
+
+    Raises:
+        ValueError: When a rollup could not be uploaded
+    """
+    drive_service = drive_service or get_drive_service()
+    view_df = None
+    for period in periods:
+        rollup_name = get_rollup_name(view_file_name, period)
+        rollup_id = find_file_id_by_name(folder_id, rollup_name, drive_service)
+        if overwrite:
+            rollup_df = compute_rollup(added_df, period)
+        elif rollup_id is None:
+            if view_df is None:
+                print(f"Building the rollups of {view_file_name}")
+                view_df = get_view_df()
+            if view_df is None or view_df.empty:
+                view_df = added_df
+            rollup_df = compute_rollup(view_df, period)
+        elif len(added_df):
+            rollup_df = merge_rollups(
+                [
+                    read_parquet_file(rollup_id, drive_service=drive_service),
+                    compute_rollup(added_df, period),
+                ]
+            )
+        else:
+            continue
+        # the rows were already added to the row hash index, a rollup missing them
+        # would never be updated with them again
+        saved_rollup_id = upload_parquet_file(
+            rollup_df,
+            rollup_name,
+            folder_id,
+            sort_by=["Bus #", "estPeriod"],
+            drive_service=drive_service,
+            file_id=rollup_id or "",
+        )
+        if saved_rollup_id is None:
+            raise ValueError(f"Unable to proceed, upload of {rollup_name} failed")
@@ -0,0 +1,185 @@
+from io import BytesIO
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from connnections.storage import DriveBackend, get_drive_service
+from data.utilities import find_file_id_by_name
+
+
+def get_row_hash_index_name(view_file_name: str) -> str:
+    """Name of the row hash index of a view, ie rpm_view_data.parquet.row_hashes.npy"""
+    return f"{view_file_name}.row_hashes.npy"
+
+
+def get_canonical_row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Hashes every row of a dataframe on its values, whatever the order of its columns.
+    Numbers are widened to 64 bits first, the pipelines downcast every chunk to the
+    smallest dtype holding its values so the same row can come in as int8 one run and
+    int16 the next.
+
+    Args:
+        df (pd.DataFrame): rows of a view
+
+    Returns:
+        np.ndarray: uint64 hash per row
+    """
+    widened_dtypes = {
+        column: np.float64 if pd.api.types.is_float_dtype(dtype) else np.int64
+        for column, dtype in df.dtypes.items()
+        if isinstance(dtype, np.dtype) and dtype.kind in "biuf"
+    }
+    return pd.util.hash_pandas_object(
+        df[sorted(df.columns)].astype(widened_dtypes), index=False  # type: ignore
+    ).to_numpy()
+
+
+class RowHashIndex:
+    """Sorted array of the 64 bit hashes of every row already in a view.  New rows are
+    deduplicated against it with a binary search per row, so an incremental run never
+    has to read the view or deduplicate the rows it already holds.
+    """
+
+    def __init__(self, hashes: Optional[np.ndarray] = None):
+        """
+        Args:
+            hashes (Optional[np.ndarray], optional): sorted unique uint64 row hashes.
+            Defaults to an empty index.
+        """
+        self.hashes = (
+            np.empty(0, dtype=np.uint64) if hashes is None else hashes.astype(np.uint64)
+        )
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def clear(self) -> None:
+        """Forgets every row, for views which are replaced as a whole"""
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            hashes (np.ndarray): uint64 row hashes
+
+        Returns:
+            np.ndarray: boolean mask of the hashes already in the index
+        """
+        positions = np.searchsorted(self.hashes, hashes)
+        found = positions < len(self.hashes)
+        found[found] = self.hashes[positions[found]] == hashes[found]
+        return found
+
+    def add(self, hashes: np.ndarray) -> None:
+        """
+        Args:
+            hashes (np.ndarray): unique uint64 row hashes which are not in the index yet
+        """
+        hashes = np.sort(hashes.astype(np.uint64))
+        self.hashes = np.insert(
+            self.hashes, np.searchsorted(self.hashes, hashes), hashes
+        )
+
+    def drop_seen_rows(
+        self, df: pd.DataFrame, columns: Optional[list[str]] = None
+    ) -> pd.DataFrame:
+        """Keeps the first occurrence of every row of df which is not in the index yet
+        and adds those rows to the index.  This replaces drop_duplicates, as rows seen
+        in a previous run are dropped too.
+
+        Args:
+            df (pd.DataFrame): new rows of the view
+            columns (Optional[list[str]], optional): columns identifying a row, columns
+            derived from them are left out of the hash. Defaults to every column.
+
+        Returns:
+            pd.DataFrame: rows of df never seen before, in their original order
+        """
+        if df.empty:
+            return df
+        hashes = get_canonical_row_hashes(df if columns is None else df[columns])
+        unique_hashes, first_positions = np.unique(hashes, return_index=True)
+        unseen = ~self.contains(unique_hashes)
+        self.add(unique_hashes[unseen])
+        keep = np.sort(first_positions[unseen])
+        print(f"Dropped {len(df) - len(keep)} of {len(df)} rows already in the view")
+        return df.iloc[keep]
+
+
+def load_row_hash_index(
+    view_file_name: str,
+    folder_id: str,
+    get_view_df: Optional[Callable[[], Optional[pd.DataFrame]]] = None,
+    drive_service: Optional[DriveBackend] = None,
+    columns: Optional[list[str]] = None,
+) -> tuple[Optional[str], RowHashIndex]:
+    """Loads the row hash index saved next to a view.  When the view has no index yet
+    it is built from the rows of the view.
+
+    Args:
+        view_file_name (str): file name of the view, ie rpm_view_data.parquet
+        folder_id (str): folder of the view
+        get_view_df (Optional[Callable[[], Optional[pd.DataFrame]]], optional): returns
+        the current rows of the view, only called when there is no index yet.
+        Defaults to starting from an empty index.
+        columns (Optional[list[str]], optional): columns identifying a row, see
+        RowHashIndex.drop_seen_rows. Defaults to every column.
+
+    Returns:
+        tuple[Optional[str], RowHashIndex]: id of the index file (None when it does not
+        exist yet) and the index
+    """
+    drive_service = drive_service or get_drive_service()
+    index_id = find_file_id_by_name(
+        folder_id, get_row_hash_index_name(view_file_name), drive_service
+    )
+    if index_id is not None:
+        return index_id, RowHashIndex(
+            np.load(BytesIO(drive_service.get_file(index_id)), allow_pickle=False)
+        )
+    row_hash_index = RowHashIndex()
+    view_df = get_view_df() if get_view_df is not None else None
+    if view_df is not None and len(view_df):
+        print(f"Building the row hash index of {view_file_name}")
+        if columns is not None:
+            view_df = view_df[columns]
+        row_hash_index.add(np.unique(get_canonical_row_hashes(view_df)))
+    return None, row_hash_index
+
+
+def save_row_hash_index(
+    view_file_name: str,
+    folder_id: str,
+    row_hash_index: RowHashIndex,
+    index_id: Optional[str] = None,
+    drive_service: Optional[DriveBackend] = None,
+) -> str:
+    """Saves the row hash index of a view.  Save it after the rows it holds were
+    uploaded to the view and before the ingestion manifest, so a failed run is
+    reprocessed against the index as it was before the run.  Raises when the upload
+    fails, passing None on as index_id would create a second index file.
+
+    Args:
+        view_file_name (str): file name of the view, ie rpm_view_data.parquet
+        folder_id (str): folder of the view
+        row_hash_index (RowHashIndex): the index
+        index_id (Optional[str], optional): id of the index file when it already exists
+
+    Returns:
+        str: id of the index file
+    """
+    drive_service = drive_service or get_drive_service()
+    index_name = get_row_hash_index_name(view_file_name)
+    index_file = BytesIO()
+    np.save(index_file, row_hash_index.hashes, allow_pickle=False)
+    saved_index_id = drive_service.upload_file(
+        filename=index_name,
+        folder_id=folder_id,
+        file=[index_file.getvalue()],
+        mimetype="application/octet-stream",
+        file_id=index_id or "",
+    )
+    if saved_index_id is None:
+        raise ValueError(f"Unable to proceed, upload of {index_name} failed")
+    return saved_index_id
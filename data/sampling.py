@@ -0,0 +1,97 @@
+from typing import Iterable, NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from data.row_hash_index import get_canonical_row_hashes
+
+
+class HashSample(NamedTuple):
+    """A deterministic sample of the rows of a view.  A row is in the sample when the
+    hash of its key columns falls in the first fraction of the hash range, so the same
+    rows are picked on every run and whatever chunk or segment they are read from.
+    """
+
+    fraction: float  # between 0 and 1
+    seed: int = 0  # different seeds pick independent samples
+    key_columns: tuple[str, ...] = ("Bus #", "dateTime")
+
+
+def get_sample_mask(keys_df: pd.DataFrame, sample: HashSample) -> np.ndarray:
+    """
+    Args:
+        keys_df (pd.DataFrame): the key columns of the sample for every row
+        sample (HashSample): the sample
+
+    Returns:
+        np.ndarray: boolean mask of the rows in the sample
+    """
+    if sample.fraction >= 1:
+        return np.ones(len(keys_df), dtype=bool)
+    keys_df = keys_df[list(sample.key_columns)]
+    complete = keys_df.notna().all(axis=1).to_numpy()
+    if not complete.all():
+        # rows missing a key have no stable hash, they are never in the sample
+        mask = np.zeros(len(keys_df), dtype=bool)
+        mask[complete] = get_sample_mask(keys_df[complete], sample)
+        return mask
+    # numeric keys are ids and epoch seconds, compared as whole numbers as csv readers
+    # can return them as floats
+    keys_df = keys_df.astype(
+        {
+            column: "int64"
+            for column, dtype in keys_df.dtypes.items()
+            if pd.api.types.is_float_dtype(dtype)
+        }
+    )
+    hashes = get_canonical_row_hashes(keys_df)
+    # rehashing with the seed mixed in makes every seed an independent sample
+    seeded_hashes = pd.util.hash_array(hashes ^ np.uint64(sample.seed))
+    return seeded_hashes < np.uint64(sample.fraction * np.iinfo(np.uint64).max)
+
+
+def sample_dataframe(df: pd.DataFrame, sample: HashSample) -> pd.DataFrame:
+    """
+    Args:
+        df (pd.DataFrame): rows holding the key columns of the sample
+        sample (HashSample): the sample
+
+    Returns:
+        pd.DataFrame: the rows of df in the sample
+    """
+    return df[get_sample_mask(df, sample)]
+
+
+def sample_arrow_table(table: pa.Table, sample: HashSample) -> pa.Table:
+    """Samples an arrow table before it is converted to pandas, only the key columns
+    are converted to compute the sample.
+
+    Args:
+        table (pa.Table): rows holding the key columns of the sample
+        sample (HashSample): the sample
+
+    Returns:
+        pa.Table: the rows of table in the sample
+    """
+    return table.filter(
+        pa.array(
+            get_sample_mask(table.select(list(sample.key_columns)).to_pandas(), sample)
+        )
+    )
+
+
+def sample_chunks(chunks: Iterable[pd.DataFrame], sample: HashSample) -> pd.DataFrame:
+    """Samples every chunk of a csv as it is read, so only the sampled rows are held in
+    memory.  Replaces get_random_sample_of_chunks.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): chunks of a csv holding the key columns
+        sample (HashSample): the sample
+
+    Returns:
+        pd.DataFrame: the rows in the sample
+    """
+    return pd.concat(
+        (sample_dataframe(chunk, sample) for chunk in chunks), ignore_index=True
+    )
@@ -0,0 +1,98 @@
+import pandas as pd
+
+EST_TZ = "US/Eastern"
+# format of the timestamp strings stored by the views before they held epoch seconds
+LEGACY_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S%z"
+
+
+def to_epoch_seconds(datetimes: pd.Series) -> pd.Series:
+    """Converts timezone aware datetimes to int64 seconds since the unix epoch.
+
+    Args:
+        datetimes (pd.Series): timezone aware datetimes
+
+    Raises:
+        ValueError: When a datetime is NaT, it has no epoch seconds
+
+    Returns:
+        pd.Series: int64 epoch seconds, the timezone the datetimes were in does not matter
+    """
+    if datetimes.isna().any():
+        raise ValueError(
+            f"Unable to proceed, {datetimes.isna().sum()} datetimes are NaT"
+        )
+    return datetimes.dt.tz_convert("UTC").astype("int64") // 10**9
+
+
+def epoch_seconds_to_eastern(epoch_seconds: pd.Series) -> pd.Series:
+    """Renders epoch seconds as US/Eastern wall clock time for display.
+
+    Args:
+        epoch_seconds (pd.Series): seconds since the unix epoch
+
+    Returns:
+        pd.Series: timezone naive datetimes in US/Eastern time
+    """
+    return (
+        pd.to_datetime(epoch_seconds.astype("int64"), unit="s", utc=True)
+        .dt.tz_convert(EST_TZ)
+        .dt.tz_localize(None)
+    )
+
+
+def get_epoch_seconds(timestamps: pd.Series) -> pd.Series:
+    """Returns a timestamp column as int64 epoch seconds whatever version of the views
+    it was read from.  Numbers are kept as is, timestamp strings of the legacy views,
+    ie 2023-01-01 05:00:00+0000, are parsed with their exact format instead of having
+    pandas infer the format of every value.
+
+    Args:
+        timestamps (pd.Series): epoch seconds, legacy timestamp strings or a mix of both
+
+    Returns:
+        pd.Series: int64 epoch seconds
+    """
+    if pd.api.types.is_numeric_dtype(timestamps):
+        return timestamps.astype("int64")
+    epoch_seconds = pd.to_numeric(timestamps, errors="coerce")
+    legacy = epoch_seconds.isna() & timestamps.notna()
+    if legacy.any():
+        legacy_timestamps = timestamps[legacy].astype(str)
+        try:
+            parsed = pd.to_datetime(
+                legacy_timestamps, format=LEGACY_TIMESTAMP_FORMAT, utc=True
+            )
+        except ValueError:
+            parsed = pd.to_datetime(legacy_timestamps, format="mixed", utc=True)
+        epoch_seconds[legacy] = to_epoch_seconds(parsed)
+    return epoch_seconds.astype("int64")
+
+
+def upgrade_legacy_view(
+    view_df: pd.DataFrame, timestamp_column: str, display_column: str
+) -> pd.DataFrame:
+    """Brings rows of a legacy view to the epoch seconds schema, dropping the formatted
+    US/Eastern column which is now rendered at display time.
+
+    Args:
+        view_df (pd.DataFrame): rows of a view, legacy or not
+        timestamp_column (str): the timestamp column, ie dateTime or reportedAt
+        display_column (str): the legacy formatted column, ie estDateTime
+
+    Returns:
+        pd.DataFrame: the rows with timestamp_column as int64 epoch seconds
+    """
+    view_df = view_df.drop(columns=[display_column], errors="ignore")
+    if timestamp_column in view_df:
+        view_df[timestamp_column] = get_epoch_seconds(view_df[timestamp_column])
+    return view_df
+
+
+def upgrade_legacy_metric_view(view_df: pd.DataFrame) -> pd.DataFrame:
+    """upgrade_legacy_view for the battery and rpm views"""
+    return upgrade_legacy_view(view_df, "dateTime", "estDateTime")
+
+
+def upgrade_legacy_breakdown_view(view_df: pd.DataFrame) -> pd.DataFrame:
+    """upgrade_legacy_view for the bus breakdown view"""
+    return upgrade_legacy_view(view_df, "reportedAt", "estReportedAt")
@@ -1,10 +1,13 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from io import BytesIO
-from typing import Any
+from itertools import islice
+from typing import Any, Iterator, Optional
 
 import pandas as pd
 from pandas.io.parsers.readers import TextFileReader
 
-from connnections.google_drive import DriveService
+from connnections.storage import DriveBackend, get_drive_service
+from data.CONSTANTS import DRIVE_DOWNLOAD_MAX_WORKERS
 
 
 def chunk_list(lst: list[Any], n: int) -> list[list[Any]]:
@@ -23,9 +26,10 @@ def chunk_list(lst: list[Any], n: int) -> list[list[Any]]:
 
 def get_csv_from_drive_as_dataframe(
     file_id: str,
-    drive_service: DriveService = DriveService(),
+    drive_service: Optional[DriveBackend] = None,
     pandas_read_csv_kwargs: dict = {},
     drive_kwargs: dict = {},
+    ranged: bool = False,
 ) -> pd.DataFrame | TextFileReader:
     """Downloads a csv file and converts it into a dataframe
     making it easy to use using pandas read_csv attribute.
@@ -34,19 +38,61 @@ def get_csv_from_drive_as_dataframe(
         file_id (str): Alphanumeric ID of the file you're trying to retrieve
         pandas_read_csv_kwargs (dict): any arguments you want to pass to the pandas read_csv call.
         drive_kwargs (dict): Any arguments passing to the drive call
+        ranged (bool, optional): Download the file as concurrent byte ranges, meant for
+        the large view files. Defaults to False.
 
     Returns:
         Union[pd.DataFrame, TextFileReader]: DataFrame containing the data.
         If chunksize is used then TextFileReader returned
     """
+    drive_service = drive_service or get_drive_service()
+    open_file = drive_service.open_file_ranged if ranged else drive_service.open_file
     return pd.read_csv(
-        BytesIO(drive_service.get_file(file_id, **drive_kwargs)),
+        open_file(file_id, **drive_kwargs),
         **pandas_read_csv_kwargs,
     )
 
 
+def get_csvs_from_drive_as_dataframes(
+    file_ids: list[str],
+    drive_service: Optional[DriveBackend] = None,
+    pandas_read_csv_kwargs: dict = {},
+    drive_kwargs: dict = {},
+    max_workers: int = DRIVE_DOWNLOAD_MAX_WORKERS,
+) -> Iterator[pd.DataFrame | TextFileReader]:
+    """Downloads several csv files concurrently using a thread pool and yields each one
+    as a dataframe in the order the downloads finish.  At most 2 * max_workers downloaded
+    files are held in memory waiting to be parsed.
+
+    Args:
+        file_ids (list[str]): Alphanumeric IDs of the files you're trying to retrieve
+        pandas_read_csv_kwargs (dict): any arguments you want to pass to the pandas read_csv call.
+        drive_kwargs (dict): Any arguments passing to the drive call
+        max_workers (int, optional): How many files are downloaded at the same time.
+        Defaults to DRIVE_DOWNLOAD_MAX_WORKERS.
+
+    Yields:
+        Union[pd.DataFrame, TextFileReader]: DataFrame containing the data of one file.
+        If chunksize is used then TextFileReader returned
+    """
+    drive_service = drive_service or get_drive_service()
+    file_id_iter = iter(file_ids)
+    pending = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            pending |= {
+                executor.submit(drive_service.get_file, file_id, **drive_kwargs)
+                for file_id in islice(file_id_iter, 2 * max_workers - len(pending))
+            }
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pd.read_csv(BytesIO(future.result()), **pandas_read_csv_kwargs)
+
+
 def get_raw_data_file_ids(
-    folder_id: str, drive_service: DriveService = DriveService()
+    folder_id: str, drive_service: Optional[DriveBackend] = None
 ) -> list[str]:
     """Gets a list of all battery raw file ids
     Args:
@@ -55,6 +101,7 @@ def get_raw_data_file_ids(
     Returns:
         list[str]: list of ids containing the csvs of the different raw files
     """
+    drive_service = drive_service or get_drive_service()
     # TODO: update to ensure only csvs are pulled
     return list(
         sorted(
@@ -70,19 +117,51 @@ def get_raw_data_file_ids(
     )
 
 
-def get_random_sample_of_chunks(
-    chunks: TextFileReader, sample_percent: float = 0.50
-) -> pd.DataFrame:
-    """If using the chunksize parameter to read csv and wanting to return a sample of the dataframe
-    csv use this function to help drive down memory usage while returninga random sampleof data
+def find_file_id_by_name(
+    folder_id: str, file_name: str, drive_service: Optional[DriveBackend] = None
+) -> Optional[str]:
+    """Looks up the id of a file from its name, for files such as manifests that are
+    created by the pipelines instead of having a fixed id in CONSTANTS.
 
     Args:
-        chunks (TextFileReader): pass in pd.read_csv with chunksize parameter here
-        sample_percent (float, optional): The percent of data you want returned
-        between 0 and 1. Defaults to 0.50.
+        folder_id (str): Folder containing the file
+        file_name (str): Name of the file
 
     Returns:
-        pd.DataFrame: The dataframe with the sample chosen.
+        Optional[str]: id of the file, None if there is no file of that name
     """
-    total_df = pd.concat((df.sample(n=int(len(df) * sample_percent)) for df in chunks))
-    return total_df
+    drive_service = drive_service or get_drive_service()
+    return next(
+        (
+            file["id"]
+            for file in drive_service.list_files_in_shared_drive_folder(folder_id)
+            if file["name"] == file_name
+        ),
+        None,
+    )
+
+
+def dataframe_to_csv_chunks(
+    df: pd.DataFrame,
+    rows_per_chunk: int = 100_000,
+    encoding: str = "utf-8",
+    errors: str = "strict",
+) -> Iterator[bytes]:
+    """Renders a dataframe to csv a slice of rows at a time.  Pass the generator to
+    drive_service.upload_file so the full csv is never held in memory as one string.
+
+    Args:
+        df (pd.DataFrame): The dataframe being written
+        rows_per_chunk (int, optional): Rows rendered per piece. Defaults to 100_000.
+        encoding (str, optional): Encoding of the csv. Defaults to "utf-8".
+        errors (str, optional): How unencodable characters are handled. Defaults to "strict".
+
+    Yields:
+        bytes: csv contents, the first piece includes the header
+    """
+    for start in range(0, max(len(df), 1), rows_per_chunk):
+        yield (
+            df.iloc[start : start + rows_per_chunk]
+            .to_csv(index=False, header=start == 0)
+            .encode(encoding, errors)
+        )
@@ -0,0 +1,250 @@
+import json
+from datetime import datetime
+from typing import Callable, Optional, TypedDict
+
+import pandas as pd
+
+from connnections.storage import DriveBackend, get_drive_service
+from data.CONSTANTS import SNAPSHOT_FULL_BASE_EVERY
+from data.parquet_views import read_parquet_file, upload_parquet_file
+from data.utilities import find_file_id_by_name
+
+ROW_HASH_COLUMN = "_row_hash"
+REMOVED_COLUMN = "_removed"
+
+
+class ViewSnapshotTypedDict(TypedDict):
+    id: str  # drive id of the snapshot file
+    name: str  # file name of the snapshot
+    kind: str  # base for a full copy of the view, delta for the rows added/removed
+    created: str  # ISO timestamp of the snapshot
+    rows: int  # rows in the snapshot file
+
+
+class ViewSnapshotIndexTypedDict(TypedDict):
+    view: str  # name of the view, ie rpm_view_data
+    snapshots: list[ViewSnapshotTypedDict]  # snapshots in the order they were taken
+
+
+def get_row_hashes(df: pd.DataFrame) -> pd.Series:
+    """Hashes every row of a dataframe on its values, the index is ignored.
+
+    Args:
+        df (pd.DataFrame): rows of a view
+
+    Returns:
+        pd.Series: uint64 hash per row
+    """
+    return pd.util.hash_pandas_object(df, index=False)
+
+
+def get_changed_rows(
+    previous_view_df: pd.DataFrame, view_df: pd.DataFrame
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Compares two versions of a view by row hash.
+
+    Args:
+        previous_view_df (pd.DataFrame): The view before the change
+        view_df (pd.DataFrame): The view after the change
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: the rows added and the rows removed
+    """
+    if previous_view_df.empty:
+        return view_df, previous_view_df
+    previous_hashes = get_row_hashes(previous_view_df)
+    hashes = get_row_hashes(view_df)
+    return (
+        view_df[~hashes.isin(previous_hashes).to_numpy()],
+        previous_view_df[~previous_hashes.isin(hashes).to_numpy()],
+    )
+
+
+def _get_snapshot_index_name(view_name: str) -> str:
+    return f"{view_name}.snapshots.json"
+
+
+def load_snapshot_index(
+    view_name: str,
+    snapshot_folder_id: str,
+    drive_service: Optional[DriveBackend] = None,
+) -> tuple[Optional[str], ViewSnapshotIndexTypedDict]:
+    """Loads the list of snapshots taken of a view.
+
+    Args:
+        view_name (str): name of the view, ie rpm_view_data
+        snapshot_folder_id (str): folder the snapshots are saved in
+
+    Returns:
+        tuple[Optional[str], ViewSnapshotIndexTypedDict]: id of the index file (None when
+        no snapshot was taken yet) and the index
+    """
+    drive_service = drive_service or get_drive_service()
+    index_id = find_file_id_by_name(
+        snapshot_folder_id, _get_snapshot_index_name(view_name), drive_service
+    )
+    if index_id is None:
+        return None, {"view": view_name, "snapshots": []}
+    return index_id, json.loads(drive_service.get_file(index_id))
+
+
+def save_view_snapshot(
+    view_name: str,
+    snapshot_folder_id: str,
+    added_df: pd.DataFrame,
+    removed_df: Optional[pd.DataFrame] = None,
+    get_view_df: Optional[Callable[[], pd.DataFrame]] = None,
+    full: bool = False,
+    drive_service: Optional[DriveBackend] = None,
+) -> Optional[str]:
+    """Records a change of a view.  Usually only the rows added and removed are uploaded as
+    a delta snapshot, every SNAPSHOT_FULL_BASE_EVERY deltas (or when full) the whole view is
+    uploaded as a new base instead, so restoring never replays more than that many deltas.
+
+    Args:
+        view_name (str): name of the view, ie rpm_view_data
+        snapshot_folder_id (str): folder the snapshots are saved in
+        added_df (pd.DataFrame): rows added to the view
+        removed_df (Optional[pd.DataFrame], optional): rows removed from the view.
+        Defaults to None.
+        get_view_df (Optional[Callable[[], pd.DataFrame]], optional): returns the whole
+        view after the change, only called when a base is due. Without it only deltas
+        are written.
+        full (bool, optional): Write a base even if one is not due, for views which were
+        replaced as a whole. Defaults to False.
+
+    Raises:
+        ValueError: When the snapshot or the snapshot index could not be uploaded
+
+    Returns:
+        Optional[str]: id of the snapshot, None when there was nothing to record
+    """
+    drive_service = drive_service or get_drive_service()
+    index_id, index = load_snapshot_index(view_name, snapshot_folder_id, drive_service)
+    deltas_since_base = 0
+    for snapshot in reversed(index["snapshots"]):
+        if snapshot["kind"] == "base":
+            break
+        deltas_since_base += 1
+    base_due = full or deltas_since_base >= SNAPSHOT_FULL_BASE_EVERY
+    if not base_due and not index["snapshots"]:
+        # deltas can only be replayed on top of a base
+        base_due = get_view_df is not None
+    created = datetime.now()
+    if base_due and get_view_df is not None:
+        kind = "base"
+        snapshot_df = get_view_df()
+        snapshot_df = snapshot_df.assign(
+            **{ROW_HASH_COLUMN: get_row_hashes(snapshot_df)}
+        )
+    else:
+        if removed_df is None:
+            removed_df = added_df.iloc[:0]
+        if added_df.empty and removed_df.empty:
+            return None
+        kind = "delta"
+        snapshot_df = pd.concat(
+            [
+                added_df.assign(
+                    **{ROW_HASH_COLUMN: get_row_hashes(added_df), REMOVED_COLUMN: False}
+                ),
+                removed_df.assign(
+                    **{
+                        ROW_HASH_COLUMN: get_row_hashes(removed_df),
+                        REMOVED_COLUMN: True,
+                    }
+                ),
+            ],
+            ignore_index=True,
+        )
+    snapshot_name = (
+        f"{view_name}_{kind}_{created.strftime('%Y-%m-%d %H:%M:%S')}.parquet"
+    )
+    print(f"Creating {kind} snapshot {snapshot_name} of {len(snapshot_df)} rows")
+    snapshot_id = upload_parquet_file(
+        snapshot_df,
+        snapshot_name,
+        snapshot_folder_id,
+        [ROW_HASH_COLUMN],
+        drive_service,
+    )
+    if snapshot_id is None:
+        raise ValueError(
+            f"Unable to proceed, upload of snapshot {snapshot_name} failed"
+        )
+    index["snapshots"].append(
+        {
+            "id": snapshot_id,
+            "name": snapshot_name,
+            "kind": kind,
+            "created": created.isoformat(),
+            "rows": len(snapshot_df),
+        }
+    )
+    # a snapshot missing from the index is never restored
+    saved_index_id = drive_service.upload_file(
+        filename=_get_snapshot_index_name(view_name),
+        folder_id=snapshot_folder_id,
+        file=[json.dumps(index, indent=1).encode()],
+        mimetype="application/json",
+        file_id=index_id or "",
+    )
+    if saved_index_id is None:
+        raise ValueError(
+            f"Unable to proceed, upload of {_get_snapshot_index_name(view_name)} failed"
+        )
+    return snapshot_id
+
+
+def restore_view_snapshot(
+    view_name: str,
+    snapshot_folder_id: str,
+    until: Optional[datetime] = None,
+    drive_service: Optional[DriveBackend] = None,
+) -> Optional[pd.DataFrame]:
+    """Rebuilds a view as it was when a snapshot was taken, from the last base before
+    that point and the deltas taken after it.
+
+    Args:
+        view_name (str): name of the view, ie rpm_view_data
+        snapshot_folder_id (str): folder the snapshots are saved in
+        until (Optional[datetime], optional): restore the view as of the last snapshot
+        taken at or before this time. Defaults to the latest snapshot.
+
+    Returns:
+        Optional[pd.DataFrame]: The view, None when there is no base snapshot before until
+    """
+    drive_service = drive_service or get_drive_service()
+    _, index = load_snapshot_index(view_name, snapshot_folder_id, drive_service)
+    snapshots = [
+        snapshot
+        for snapshot in index["snapshots"]
+        if until is None or datetime.fromisoformat(snapshot["created"]) <= until
+    ]
+    base_position = next(
+        (
+            position
+            for position in range(len(snapshots) - 1, -1, -1)
+            if snapshots[position]["kind"] == "base"
+        ),
+        None,
+    )
+    if base_position is None:
+        return None
+    view_df = read_parquet_file(
+        snapshots[base_position]["id"], drive_service=drive_service
+    )
+    for snapshot in snapshots[base_position + 1 :]:
+        delta_df = read_parquet_file(snapshot["id"], drive_service=drive_service)
+        removed = delta_df[REMOVED_COLUMN].to_numpy()
+        view_df = pd.concat(
+            [
+                view_df[
+                    ~view_df[ROW_HASH_COLUMN].isin(delta_df[ROW_HASH_COLUMN][removed])
+                ],
+                delta_df[~removed].drop(columns=[REMOVED_COLUMN]),
+            ],
+            ignore_index=True,
+        ).drop_duplicates(subset=[ROW_HASH_COLUMN], keep="first")
+    print(f"Restored {view_name} from {len(snapshots) - base_position} snapshots")
+    return view_df.drop(columns=[ROW_HASH_COLUMN]).reset_index(drop=True)
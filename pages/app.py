@@ -3,8 +3,22 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 
-from data.CONSTANTS import BATTERY_VIEW_DATA_CSV, BUS_BREAKDOWN_VIEW, RPM_VIEW_DATA_CSV
-from streamlit_utilities import get_battery_data, get_breakdown_data, get_rpm_data
+from data.CONSTANTS import BATTERY_VIEW_DATA_CSV, RPM_VIEW_DATA_CSV
+from data.downsampling import downsample_for_chart
+from streamlit_utilities import (
+    BATTERY_DATASETS,
+    BREAKDOWN_DATASETS,
+    OVERVIEW_DATASETS,
+    RPM_DATASETS,
+    RPM_SAMPLE_DATASETS,
+    get_battery_data_by_bus,
+    get_battery_rollup,
+    get_breakdown_data,
+    get_breakdown_monthly_counts,
+    get_rpm_data_by_bus,
+    get_rpm_rollup,
+    show_loading_progress,
+)
 
 
 # Function to detect anomalies based on Isolation Forest
@@ -24,7 +38,14 @@ def detect_anomalies(data, threshold=3):
 
 
 # Function to create a line chart using Altair
-def create_line_chart(data):
+def create_line_chart(data, anomalies=None):
+    # bounded number of points whatever the history of the bus, keeping the anomalies
+    data = downsample_for_chart(
+        data,
+        "estDateTime",
+        "data",
+        keep=data.index.isin(anomalies.index) if anomalies is not None else None,
+    )[["estDateTime", "data"]]
     chart = (
         alt.Chart(data)
         .mark_line(color="orange")
@@ -48,12 +69,11 @@ def display_tables_side_by_side(tables, titles=[]):
 
 # Function for Battery anomaly detection
 def battery_anomaly_detection():
-    file_data = get_battery_data()
+    show_loading_progress(BATTERY_DATASETS)
+    battery_by_bus = get_battery_data_by_bus()
+    file_data = battery_by_bus.df
 
-    if file_data is not None:
-        file_data["estDateTime"] = pd.to_datetime(
-            file_data["estDateTime"], format="mixed"
-        )
+    if len(file_data):
         outlier_indices = detect_anomalies(file_data["data"])
         anomalies = file_data.iloc[outlier_indices]
         anomalies_sorted = anomalies.sort_values(by="data")
@@ -79,9 +99,11 @@ def battery_anomaly_detection():
             buses = bottom_buses
 
         for bus in buses["Bus #"]:
-            bus_data = file_data[file_data["Bus #"] == bus]
+            bus_data = battery_by_bus.get(bus)
             st.write(f"Data for Bus {bus}:")
-            st.altair_chart(create_line_chart(bus_data), use_container_width=True)
+            st.altair_chart(
+                create_line_chart(bus_data, anomalies), use_container_width=True
+            )
 
         tables = [
             top_buses[["Bus #"]],
@@ -97,12 +119,11 @@ def battery_anomaly_detection():
 
 # Function for RPM anomaly detection
 def rpm_anomaly_detection():
-    file_data = get_rpm_data(nrows="Random")
+    show_loading_progress(RPM_SAMPLE_DATASETS)
+    rpm_by_bus = get_rpm_data_by_bus(nrows="Random")
+    file_data = rpm_by_bus.df
 
-    if file_data is not None:
-        file_data["estDateTime"] = pd.to_datetime(
-            file_data["estDateTime"], format="mixed"
-        )
+    if len(file_data):
         outlier_indices = detect_anomalies(file_data["data"])
         anomalies = file_data.iloc[outlier_indices]
         anomalies_sorted = anomalies.sort_values(by="data")
@@ -128,9 +149,11 @@ def rpm_anomaly_detection():
             buses = bottom_buses
 
         for bus in buses["Bus #"]:
-            bus_data = file_data[file_data["Bus #"] == bus]
+            bus_data = rpm_by_bus.get(bus)
             st.write(f"Data for Bus {bus}:")
-            st.altair_chart(create_line_chart(bus_data), use_container_width=True)
+            st.altair_chart(
+                create_line_chart(bus_data, anomalies), use_container_width=True
+            )
 
         tables = [
             top_buses[["Bus #"]],
@@ -144,75 +167,65 @@ def rpm_anomaly_detection():
         st.write(anomalies)
 
 
-# Function to extract year from datetime value or return "NaT" on exception
-def get_year(x):
-    try:
-        return pd.to_datetime(x, errors="coerce").dt.year
-    except:
-        return pd.NaT
-
-
-# Function to extract month from datetime value or return "NaT" on exception
-def get_month(x):
-    try:
-        return pd.to_datetime(x).strftime("%B")
-    except:
-        return "NaT"
+# Average reading of every bus from the sums and counts of a rollup
+def get_average_by_bus(rollup: pd.DataFrame) -> pd.DataFrame:
+    totals = rollup.groupby("Bus #", observed=True)[["sum", "count"]].sum()
+    return (totals["sum"] / totals["count"]).rename("data").reset_index()
 
 
 # Function for the "Overview" page
 def overview_page():
-    battery_data = get_battery_data()
-    rpm_data = get_rpm_data(nrows="Random")
-    breakdown_data = get_breakdown_data()
+    show_loading_progress(OVERVIEW_DATASETS)
+    # the daily rollups summarize every reading in a few rows per bus and day
+    battery_rollup = get_battery_rollup()
+    rpm_rollup = get_rpm_rollup()
+    breakdown_counts = get_breakdown_monthly_counts()
 
-    if battery_data is not None and rpm_data is not None and breakdown_data is not None:
-        st.title("Overview - Average Statistics for All Buses")
+    st.title("Overview - Average Statistics for All Buses")
 
-        st.subheader("Battery Readings")
-        avg_battery_readings = (
-            battery_data.groupby("Bus #")["data"].mean().reset_index()  # type: ignore
-        )
-        overall_avg_battery = avg_battery_readings["data"].mean()
-        st.write(f"Average Battery Reading for All Buses: {overall_avg_battery:.2f}")
+    st.subheader("Battery Readings")
+    avg_battery_readings = get_average_by_bus(battery_rollup)
+    overall_avg_battery = avg_battery_readings["data"].mean()
+    st.write(f"Average Battery Reading for All Buses: {overall_avg_battery:.2f}")
 
-        st.subheader("RPM Data")
-        avg_rpm_data = rpm_data.groupby("Bus #")["data"].mean().reset_index()
-        overall_avg_rpm = avg_rpm_data["data"].mean()
-        st.write(f"Average RPM Data for All Buses: {overall_avg_rpm:.2f}")
+    st.subheader("RPM Data")
+    avg_rpm_data = get_average_by_bus(rpm_rollup)
+    overall_avg_rpm = avg_rpm_data["data"].mean()
+    st.write(f"Average RPM Data for All Buses: {overall_avg_rpm:.2f}")
 
-        st.subheader("Breakdown Counts")
-        total_breakdown_count = breakdown_data.shape[0]
-        st.write(f"Total Breakdown Count for All Buses: {total_breakdown_count}")
+    st.subheader("Breakdown Counts")
+    total_breakdown_count = breakdown_counts["count"].sum()
+    st.write(f"Total Breakdown Count for All Buses: {total_breakdown_count}")
 
 
 # Function for the "Individual Bus Statistics" page
 def individual_bus_statistics_page():
-    breakdown_file_id = BUS_BREAKDOWN_VIEW
-
-    battery_data = get_battery_data()
-    rpm_data = get_rpm_data()
-    breakdown_data = get_breakdown_data()
+    show_loading_progress(OVERVIEW_DATASETS + BATTERY_DATASETS + RPM_DATASETS)
+    breakdown_counts = get_breakdown_monthly_counts()
     color_scheme = ["steelblue", "darkorange", "limegreen"]
 
-    if battery_data is not None and rpm_data is not None and breakdown_data is not None:
-        unique_buses = (
-            set(battery_data["Bus #"].astype(str))
-            | set(rpm_data["Bus #"].astype(str))
-            | set(breakdown_data["Bus #"].astype(str))
-        )
-        unique_buses = sorted(unique_buses)  # Sort the unique bus numbers
+    unique_buses = (
+        set(get_battery_rollup()["Bus #"].astype(str))
+        | set(get_rpm_rollup()["Bus #"].astype(str))
+        | set(breakdown_counts["Bus #"].astype(str))
+    )
+    unique_buses = sorted(unique_buses)  # Sort the unique bus numbers
+
+    if not unique_buses:
+        st.title("No matching bus numbers found in the datasets.")
+        return
 
-        if not unique_buses:
-            st.title("No matching bus numbers found in the datasets.")
-            return
+    selected_bus = st.sidebar.selectbox("Select Bus", unique_buses)
 
-        selected_bus = st.sidebar.selectbox("Select Bus", unique_buses)
+    if selected_bus:
+        st.title(f"Individual Bus Statistics - Bus {selected_bus}")
+    # the whole history is loaded once, selecting a bus is then a slice of it
+    rpm_data = get_rpm_data_by_bus()
+    battery_data = get_battery_data_by_bus()
 
-        if selected_bus:
-            st.title(f"Individual Bus Statistics - Bus {selected_bus}")
+    if selected_bus:
         # RPM Data
-        selected_rpm_data = rpm_data[rpm_data["Bus #"] == selected_bus]
+        selected_rpm_data = rpm_data.get(selected_bus)
         selected_rpm_data_display = selected_rpm_data[["estDateTime", "data"]]
 
         # Display RPM Data
@@ -222,14 +235,16 @@ def individual_bus_statistics_page():
         # Plot RPM Data
         st.write("RPM Data Chart:")
         chart_rpm = (
-            alt.Chart(selected_rpm_data)
+            alt.Chart(
+                downsample_for_chart(selected_rpm_data_display, "estDateTime", "data")
+            )
             .mark_line(color=color_scheme[0])
             .encode(x="estDateTime", y="data")
         )
         st.altair_chart(chart_rpm, use_container_width=True)
 
         # Battery Readings
-        selected_battery_data = battery_data[battery_data["Bus #"] == selected_bus]
+        selected_battery_data = battery_data.get(selected_bus)
         selected_battery_data_display = selected_battery_data[["estDateTime", "data"]]
 
         # Display Battery Readings
@@ -239,36 +254,29 @@ def individual_bus_statistics_page():
         # Plot Battery Readings
         st.write("Battery Readings Chart:")
         chart_battery = (
-            alt.Chart(selected_battery_data)
+            alt.Chart(
+                downsample_for_chart(
+                    selected_battery_data_display, "estDateTime", "data"
+                )
+            )
             .mark_line(color=color_scheme[1])
             .encode(x="estDateTime", y="data")
         )
         st.altair_chart(chart_battery, use_container_width=True)
 
         # Breakdown Counts
-        selected_breakdown_data = breakdown_data[
-            breakdown_data["Bus #"] == selected_bus
-        ]
-        selected_breakdown_data["estReportedAt"] = pd.to_datetime(
-            selected_breakdown_data["estReportedAt"], format="mixed"
-        )
-        selected_breakdown_data["Year"] = selected_breakdown_data[
-            "estReportedAt"
-        ].apply(get_year)
-        selected_breakdown_data["Month"] = selected_breakdown_data[
-            "estReportedAt"
-        ].apply(get_month)
-
-        # Calculate breakdown counts
-        breakdown_counts = (
-            selected_breakdown_data.groupby(["Year", "Month"])
-            .size()
-            .reset_index(name="count")
+        breakdown_counts = breakdown_counts[breakdown_counts["Bus #"] == selected_bus]
+        breakdown_counts = pd.DataFrame(
+            {
+                "Year": breakdown_counts["estPeriod"].dt.year,
+                "Month": breakdown_counts["estPeriod"].dt.month_name(),
+                "count": breakdown_counts["count"],
+            }
         )
 
         # Display Breakdown Counts
         st.write("Breakdown Counts:")
-        total_breakdown_count = len(selected_breakdown_data)
+        total_breakdown_count = breakdown_counts["count"].sum()
         st.write(total_breakdown_count)
 
         # Plot Breakdown Counts
@@ -285,55 +293,18 @@ def individual_bus_statistics_page():
 
 # Function for the "Breakdown Data Analysis" page
 def breakdown_data_analysis():
-    import contractions
-    import nltk
-    from rake_nltk import Rake
     from st_aggrid import AgGrid
     from st_aggrid.shared import GridUpdateMode
 
-    nltk.download("stopwords")
-    nltk.download("punkt")
-    # Read the breakdown data CSV file
+    show_loading_progress(BREAKDOWN_DATASETS)
+    # Read the breakdown view, its keywords are extracted by the breakdown pipeline
     bus_breakdown_view_df = get_breakdown_data()
 
-    r = Rake(
-        min_length=1,
-        max_length=4,
-        language="english",
-        include_repeated_phrases=False,
-        stopwords={
-            "will not start",
-            "ignition broke",
-            "vandalized",
-            "shift gears",
-            "driver" "door",
-        },
-    )
-
-    def extract_keywords(text: str):
-        replace_dict = {"over heated": "overheated", "wasnt": "wasn't"}
-        text = text.lower()
-        for replace, replacement in replace_dict.items():
-            text = text.replace(replace, replacement)
-        text = contractions.fix(text)
-        r.extract_keywords_from_text(text)
-        return (
-            ranked_phrase_list[0]
-            if len(ranked_phrase_list := r.get_ranked_phrases())
-            else ""
-        )
-
-    bus_breakdown_view_df["description"] = bus_breakdown_view_df["description"].astype(
-        str
-    )
-    bus_breakdown_view_df["keywords"] = bus_breakdown_view_df["description"].apply(
-        extract_keywords
-    )
     # Convert the 'estReportedAt' column to datetime type and extract year and month
     # file_data['Year'] = file_data['estReportedAt'].apply(get_year)
-    bus_breakdown_view_df["Month"] = bus_breakdown_view_df["estReportedAt"].apply(
-        get_month
-    )
+    bus_breakdown_view_df["Month"] = bus_breakdown_view_df[
+        "estReportedAt"
+    ].dt.month_name()
 
     # Group the data by Month and breakdown description, and count the occurrences
     grouped_data = (
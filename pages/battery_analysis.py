@@ -1,13 +1,16 @@
 import altair as alt
 import numpy as np
-import pandas as pd
 import streamlit as st
 from sklearn.ensemble import IsolationForest
 
+from data.downsampling import downsample_for_chart
 from streamlit_utilities import (
+    BATTERY_DATASETS,
+    BREAKDOWN_DATASETS,
     format_breakdown_for_chart,
-    get_battery_data,
+    get_battery_data_by_bus,
     get_breakdown_count_by_bus,
+    show_loading_progress,
 )
 
 
@@ -34,6 +37,15 @@ def detect_anomalies(data):
 
 # Function to create a line chart using Altair
 def create_line_chart(data, breakdowns):
+    # the readings are reduced to a bounded number of points whatever the history of
+    # the bus, anomalies and the readings around breakdowns are always kept
+    data = downsample_for_chart(
+        data,
+        "estDateTime",
+        "Battery Voltage",
+        keep=data["anomaly"].to_numpy(),
+        marker_times=breakdowns["estDateTime"],
+    )[["estDateTime", "Battery Voltage", "anomaly"]]
     chart = (
         alt.Chart(data)
         .mark_line()
@@ -56,15 +68,12 @@ def create_line_chart(data, breakdowns):
 
 # Main function
 def main():
+    show_loading_progress(BATTERY_DATASETS + BREAKDOWN_DATASETS)
     # Retrieve the file data from Google Drive
-    battery_view_df = get_battery_data()
-    if battery_view_df is None or not len(battery_view_df):
+    battery_by_bus = get_battery_data_by_bus()
+    if not len(battery_by_bus):
         return "Error: no battery data available"
-
-    # Convert the 'estDateTime' column to datetime type
-    battery_view_df["estDateTime"] = pd.to_datetime(
-        battery_view_df["estDateTime"], format="mixed"
-    )
+    battery_view_df = battery_by_bus.df
 
     # Detect anomalies
     outlier_indices = detect_anomalies(battery_view_df["data"])
@@ -75,7 +84,9 @@ def main():
     # TODO: convert to breakdowns before and after anomaly detected
     anomalies = anomalies.merge(get_breakdown_count_by_bus(), how="left", on=["Bus #"])
     battery_view_df["anomaly"] = False
-    battery_view_df.anomaly.iloc[outlier_indices] = True
+    battery_view_df.iloc[
+        outlier_indices, battery_view_df.columns.get_loc("anomaly")
+    ] = True
 
     # Sort the anomalies by 'data' column to identify top, middle, and bottom buses
     anomaly_count_by_bus = (
@@ -107,10 +118,11 @@ def main():
     )
 
     # Plot each of the top 5 buses separately
-    bus_options = set(battery_view_df["Bus #"])
+    bus_options = battery_by_bus.buses
     selected_bus = st.selectbox("Select Bus", bus_options)
 
-    selected_bus_data = battery_view_df[battery_view_df["Bus #"] == selected_bus]
+    # the rows of battery_view_df are in the order of battery_by_bus
+    selected_bus_data = battery_view_df.iloc[battery_by_bus.get_slice(selected_bus)]
     st.write(f"Data for Bus {selected_bus}:")
     st.altair_chart(
         create_line_chart(selected_bus_data, format_breakdown_for_chart(selected_bus)),
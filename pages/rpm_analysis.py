@@ -1,13 +1,16 @@
 import altair as alt
 import numpy as np
-import pandas as pd
 import streamlit as st
 
 from data.CONSTANTS import RPM_VIEW_DATA_CSV
+from data.downsampling import downsample_for_chart
 from streamlit_utilities import (
+    BREAKDOWN_DATASETS,
+    RPM_SAMPLE_DATASETS,
     format_breakdown_for_chart,
     get_breakdown_count_by_bus,
-    get_rpm_data,
+    get_rpm_data_by_bus,
+    show_loading_progress,
 )
 
 
@@ -29,6 +32,15 @@ def detect_anomalies(data, threshold=3):
 
 # Function to create a simple line chart using Altair
 def create_line_chart(data, breakdowns):
+    # the readings are reduced to a bounded number of points whatever the history of
+    # the bus, anomalies and the readings around breakdowns are always kept
+    data = downsample_for_chart(
+        data,
+        "estDateTime",
+        "RPM",
+        keep=data["anomaly"].to_numpy(),
+        marker_times=breakdowns["estDateTime"],
+    )[["estDateTime", "RPM", "anomaly"]]
     # Extract the hour component from the estDateTime column
 
     chart = (
@@ -59,18 +71,15 @@ def create_line_chart(data, breakdowns):
 
 # Main function
 def main():
+    show_loading_progress(RPM_SAMPLE_DATASETS + BREAKDOWN_DATASETS)
     # Retrieve the file ID from the CONSTANTS module
     file_id = RPM_VIEW_DATA_CSV
 
     # Call the get_rpm_data function to retrieve the file data
-    rpm_view_df = get_rpm_data(nrows="Random")
-    if rpm_view_df is None or not len(rpm_view_df):
+    rpm_by_bus = get_rpm_data_by_bus(nrows="Random")
+    if not len(rpm_by_bus):
         return "Error: no RPM data available"
-    rpm_view_df = rpm_view_df.rename(columns={"data": "RPM"})
-    # Convert the 'estDateTime' column to datetime type
-    rpm_view_df["estDateTime"] = pd.to_datetime(
-        rpm_view_df["estDateTime"], format="mixed"
-    )
+    rpm_view_df = rpm_by_bus.df.rename(columns={"data": "RPM"})
 
     # Detect anomalies based on standard deviation
     outlier_indices = detect_anomalies(rpm_view_df["RPM"])
@@ -78,7 +87,7 @@ def main():
     anomalies = anomalies.merge(get_breakdown_count_by_bus(), how="left", on=["Bus #"])
 
     rpm_view_df["anomaly"] = False
-    rpm_view_df.anomaly.iloc[outlier_indices] = True
+    rpm_view_df.iloc[outlier_indices, rpm_view_df.columns.get_loc("anomaly")] = True
 
     # Get the data points with anomalies
 
@@ -121,10 +130,11 @@ def main():
     bottom_buses_breakdown = bottom_buses[["Bus #", "RPM", "Breakdowns"]]
 
     # Plot each of the top, middle, and bottom buses separately
-    bus_options = set(rpm_view_df["Bus #"])
+    bus_options = rpm_by_bus.buses
     selected_bus = st.selectbox("Select Bus", bus_options)
 
-    selected_bus_data = rpm_view_df[rpm_view_df["Bus #"] == selected_bus]
+    # the rows of rpm_view_df are in the order of rpm_by_bus
+    selected_bus_data = rpm_view_df.iloc[rpm_by_bus.get_slice(selected_bus)]
     st.write(f"Data for Bus {selected_bus}:")
     st.altair_chart(
         create_line_chart(selected_bus_data, format_breakdown_for_chart(selected_bus)),
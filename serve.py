@@ -0,0 +1,32 @@
+import os
+
+import click
+import pandas as pd
+from streamlit.web import bootstrap
+from streamlit.web.cli import configurator_options
+
+from streamlit_utilities import DASHBOARD_WARMUP
+
+WELCOME_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "welcome.py")
+
+
+@click.command(context_settings={"auto_envvar_prefix": "STREAMLIT"})
+@configurator_options
+@click.argument("args", nargs=-1)
+def main(args, **kwargs):
+    """Starts the dashboard like streamlit run welcome.py, and starts loading the views
+    as soon as the server runs instead of on the first visit.  Takes the options of
+    streamlit run, ie --server.port 8888 or STREAMLIT_SERVER_PORT=8888
+    """
+    bootstrap.load_config_options(flag_options=kwargs)
+    # the datasets are shared by every session, see SharedDataset.  With copy on write
+    # a frame derived from them only copies the columns it changes
+    pd.set_option("mode.copy_on_write", True)
+    # outside of a session st.cache_resource does not cache, so the warmup connects to
+    # drive once per view, the sessions then reuse their cached connection
+    DASHBOARD_WARMUP.start()
+    bootstrap.run(WELCOME_PAGE, "python serve.py", list(args), flag_options=kwargs)
+
+
+if __name__ == "__main__":
+    main()
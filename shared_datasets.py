@@ -0,0 +1,280 @@
+import inspect
+import threading
+import time
+from functools import partial, update_wrapper
+from typing import Any, Callable, Generic, NamedTuple, Optional, TypeVar
+
+import pandas as pd
+
+from connnections.storage import DriveBackend, get_drive_service
+from data.bus_partitions import BusPartitions
+from data.CONSTANTS import DASHBOARD_REFRESH_INTERVAL
+from data.ingestion_manifest import get_file_fingerprint
+from data.parquet_views import get_view_index_name
+from data.rollups import get_rollup_name
+
+Dataset = TypeVar("Dataset", pd.DataFrame, BusPartitions)
+
+
+def get_view_version(
+    folder_id: str,
+    view_files: list[str],
+    drive_service: Optional[DriveBackend] = None,
+) -> str:
+    """Identifies the current version of views from a single listing of their folder.
+    The index and rollups of parquet views are part of their version, a new segment or
+    compaction changes the index.
+
+    Args:
+        folder_id (str): folder of the views
+        view_files (list[str]): names of the parquet views and ids of the csv views,
+        ie [RPM_VIEW_DATA_PARQUET, RPM_VIEW_DATA_CSV]
+
+    Returns:
+        str: changes whenever one of the files changes, is added or removed
+    """
+    drive_service = drive_service or get_drive_service()
+    names = set(view_files)
+    for view_file in view_files:
+        if view_file.endswith(".parquet"):
+            names.add(get_view_index_name(view_file))
+            names.update(
+                get_rollup_name(view_file, period)
+                for period in ("hourly", "daily", "monthly")
+            )
+    files = drive_service.list_files_in_shared_drive_folder(
+        folder_id, fields="nextPageToken, files(id, name, md5Checksum, modifiedTime)"
+    )
+    return "|".join(
+        sorted(
+            f"{file['name']}:{get_file_fingerprint(file)}"  # type: ignore
+            for file in files
+            if file["id"] in names or file["name"] in names
+        )
+    )
+
+
+class _SharedDatasetEntry(NamedTuple):
+    version: str
+    args: tuple
+    kwargs: dict[str, Any]
+    dataset: Any
+
+
+class SharedDataset(Generic[Dataset]):
+    """A dashboard loader whose results are kept in memory once per server and shared
+    by every session and rerun, instead of every session unpickling its own copy like
+    st.cache_data.  Memory stays the same whatever the number of users.
+
+    Callers get a shallow copy, with copy on write, which the dashboard entry points
+    turn on, changing or adding a column copies that column and leaves the shared rows
+    untouched.  Loaded datasets are served stale while the
+    dataset refresher reloads the ones whose view changed, see refresh_shared_datasets,
+    so a page only waits on a download the first time a dataset is loaded.
+    """
+
+    def __init__(self, load: Callable[..., Dataset], get_version: Callable[[], str]):
+        """
+        Args:
+            load (Callable[..., Dataset]): loader returning a DataFrame or BusPartitions
+            get_version (Callable[[], str]): version of the views the loader reads, see
+            get_view_version.  Loaders reading the same views should share it.
+        """
+        update_wrapper(self, load)
+        self.load = load
+        self.get_version = get_version
+        self.signature = inspect.signature(load)
+        self.entries: dict[str, _SharedDatasetEntry] = {}
+        self.lock = threading.Lock()
+        _shared_datasets.append(self)
+
+    def __call__(self, *args, **kwargs) -> Dataset:
+        bound_arguments = self.signature.bind(*args, **kwargs)
+        bound_arguments.apply_defaults()
+        key = repr(bound_arguments.arguments)
+        entry = self.entries.get(key)
+        if entry is None:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is None:
+                    entry = self._load(
+                        self.get_version(), bound_arguments.args, bound_arguments.kwargs
+                    )
+                    self.entries[key] = entry
+            start_dataset_refresher()
+        if loading_stack := getattr(_loading, "stack", None):
+            loading_stack[-1].append(entry.version)
+        return entry.dataset.copy(deep=False)
+
+    def _load(
+        self, version: str, args: tuple, kwargs: dict[str, Any]
+    ) -> _SharedDatasetEntry:
+        # a dataset derived from another one is stamped with the version of the entry it
+        # was built from.  When the reload of that entry failed the derived dataset is
+        # reloaded at the next poll, instead of keeping stale rows under this version
+        loading_stack = _loading.__dict__.setdefault("stack", [])
+        loading_stack.append([])
+        try:
+            dataset = self.load(*args, **kwargs)
+        finally:
+            read_versions = loading_stack.pop()
+        stale_versions = [
+            read_version for read_version in read_versions if read_version != version
+        ]
+        return _SharedDatasetEntry(
+            stale_versions[0] if stale_versions else version, args, kwargs, dataset
+        )
+
+    def is_loaded(self, *args, **kwargs) -> bool:
+        """
+        Returns:
+            bool: the dataset of these arguments is in memory, calling it won't block
+        """
+        bound_arguments = self.signature.bind(*args, **kwargs)
+        bound_arguments.apply_defaults()
+        return repr(bound_arguments.arguments) in self.entries
+
+    def refresh(self, version: str) -> None:
+        """Reloads the datasets loaded with a previous version of the views and swaps
+        them in.  Until then, and when reloading fails, the previous version is served.
+
+        Args:
+            version (str): current version of the views, from get_version
+        """
+        for key, entry in list(self.entries.items()):
+            if entry.version == version:
+                continue
+            print(f"Refreshing {self.load.__name__}{entry.args}")
+            try:
+                self.entries[key] = self._load(version, entry.args, entry.kwargs)
+            except Exception as error:
+                print(
+                    f"Refreshing {self.load.__name__} failed,"
+                    f" the loaded version is kept: {error}"
+                )
+
+    def clear(self) -> None:
+        """Forgets every loaded dataset, the next call loads it again"""
+        self.entries.clear()
+
+
+def shared_dataset(
+    get_version: Callable[[], str]
+) -> Callable[[Callable[..., Dataset]], SharedDataset[Dataset]]:
+    """Decorator turning a loader into a SharedDataset
+
+    Args:
+        get_version (Callable[[], str]): see SharedDataset
+    """
+    return lambda load: SharedDataset(load, get_version)
+
+
+# in the order they were defined, so a dataset derived from another one is refreshed
+# after it
+_shared_datasets: list[SharedDataset] = []
+_dataset_refresher: Optional[threading.Thread] = None
+_dataset_refresher_lock = threading.Lock()
+# versions of the shared datasets read by the loaders running in a thread, innermost
+# loader last, see SharedDataset._load
+_loading = threading.local()
+
+
+def refresh_shared_datasets() -> None:
+    """Reloads every shared dataset whose views changed.  The version of every view is
+    polled once, however many datasets read it.
+    """
+    versions: dict[Callable[[], str], str] = {}
+    for dataset in _shared_datasets:
+        if not dataset.entries:
+            continue
+        try:
+            if dataset.get_version not in versions:
+                versions[dataset.get_version] = dataset.get_version()
+        except Exception as error:
+            print(f"Polling the version of {dataset.load.__name__} failed: {error}")
+            continue
+        dataset.refresh(versions[dataset.get_version])
+
+
+def _refresh_shared_datasets_periodically(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        refresh_shared_datasets()
+
+
+def start_dataset_refresher(interval: float = DASHBOARD_REFRESH_INTERVAL) -> None:
+    """Starts the thread refreshing the shared datasets every interval seconds, once
+    per server.
+
+    Args:
+        interval (float, optional): seconds between polls of the views.
+        Defaults to DASHBOARD_REFRESH_INTERVAL.
+    """
+    global _dataset_refresher
+    with _dataset_refresher_lock:
+        if _dataset_refresher is None:
+            _dataset_refresher = threading.Thread(
+                target=_refresh_shared_datasets_periodically,
+                args=(interval,),
+                name="dataset-refresher",
+                daemon=True,
+            )
+            _dataset_refresher.start()
+
+
+def is_dataset_loaded(call: partial) -> bool:
+    """
+    Args:
+        call (partial): a SharedDataset with its arguments, ie partial(get_rpm_data_by_bus)
+
+    Returns:
+        bool: calling it won't block
+    """
+    return call.func.is_loaded(*call.args, **call.keywords)
+
+
+class DatasetWarmup:
+    """Loads shared datasets in a background thread when the server starts, so the
+    first visitors after a deploy do not wait on the downloads of every view.  Pages
+    check which of their datasets are loaded to show progress instead of blocking.
+    """
+
+    def __init__(self, calls: list[partial]):
+        """
+        Args:
+            calls (list[partial]): SharedDatasets with their arguments, loaded in order.
+            The derived datasets should come after the ones they are derived from.
+        """
+        self.calls = calls
+        self.loaded = 0
+        self.done = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """Every dataset was loaded, or failed to load and will be loaded on demand"""
+        return self.done.is_set()
+
+    def start(self) -> None:
+        """Starts loading the datasets in the background, only the first call does"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._warm_up, name="dataset-warmup", daemon=True
+                )
+                self.thread.start()
+
+    def _warm_up(self) -> None:
+        started_at = time.perf_counter()
+        for call in self.calls:
+            try:
+                call()
+            except Exception as error:
+                print(f"Warming up {call.func.__name__} failed: {error}")
+            self.loaded += 1
+        print(
+            f"Warmed up {self.loaded} datasets"
+            f" in {time.perf_counter() - started_at:.1f}s"
+        )
+        self.done.set()
@@ -1,12 +1,66 @@
+import time
+from functools import partial
 from io import BytesIO
-from typing import Any, Literal
+from typing import Any, Literal, Optional
 
 import pandas as pd
 import streamlit as st
 
-from connnections.google_drive import DriveService
-from data.CONSTANTS import BATTERY_VIEW_DATA_CSV, BUS_BREAKDOWN_VIEW, RPM_VIEW_DATA_CSV
-from data.utilities import get_csv_from_drive_as_dataframe, get_random_sample_of_chunks
+from connnections.storage import get_drive_service
+from data.CONSTANTS import (
+    BATTERY_VIEW_DATA_CSV,
+    BATTERY_VIEW_DATA_PARQUET,
+    BREAKDOWN_VIEW_FOLDER,
+    BUS_BREAKDOWN_VIEW,
+    BUS_BREAKDOWN_VIEW_PARQUET,
+    DASHBOARD_SAMPLE_FRACTION,
+    DASHBOARD_SAMPLE_SEED,
+    METRICS_FINALIZED_DATA_FOLDER,
+    RPM_VIEW_DATA_CSV,
+    RPM_VIEW_DATA_PARQUET,
+)
+from data.bus_partitions import BusPartitions
+from data.chunking import iter_planned_chunks
+from data.parquet_views import read_parquet_view
+from data.rollups import (
+    RollupPeriod,
+    compute_breakdown_rollup,
+    compute_metric_rollup,
+    load_rollup,
+)
+from data.sampling import HashSample, sample_chunks
+from data.timestamps import (
+    epoch_seconds_to_eastern,
+    upgrade_legacy_breakdown_view,
+    upgrade_legacy_metric_view,
+)
+from data.utilities import get_csv_from_drive_as_dataframe
+from shared_datasets import (
+    DatasetWarmup,
+    get_view_version,
+    is_dataset_loaded,
+    shared_dataset,
+)
+
+# the rows returned by nrows="Random", the same rows on every load
+DASHBOARD_SAMPLE = HashSample(DASHBOARD_SAMPLE_FRACTION, DASHBOARD_SAMPLE_SEED)
+
+# versions of the views the shared datasets are loaded from, see get_view_version
+RPM_VIEW_VERSION = partial(
+    get_view_version,
+    METRICS_FINALIZED_DATA_FOLDER,
+    [RPM_VIEW_DATA_PARQUET, RPM_VIEW_DATA_CSV],
+)
+BATTERY_VIEW_VERSION = partial(
+    get_view_version,
+    METRICS_FINALIZED_DATA_FOLDER,
+    [BATTERY_VIEW_DATA_PARQUET, BATTERY_VIEW_DATA_CSV],
+)
+BREAKDOWN_VIEW_VERSION = partial(
+    get_view_version,
+    BREAKDOWN_VIEW_FOLDER,
+    [BUS_BREAKDOWN_VIEW_PARQUET, BUS_BREAKDOWN_VIEW],
+)
 
 
 def _downcast_data(
@@ -19,52 +73,106 @@ def _downcast_data(
     return df
 
 
-def _remove_est_tz_info(
-    df: pd.DataFrame, est_tz_column_name: str = "estDateTime"
+def _add_est_datetime(
+    df: pd.DataFrame,
+    usecols: list[str],
+    epoch_column: str = "dateTime",
+    est_column: str = "estDateTime",
 ) -> pd.DataFrame:
-    """Removes the -05:00 from the estDatetime
+    """Renders the epoch seconds of the view as US/Eastern datetimes when est_column
+    is requested, and drops the epoch seconds unless they were requested as well.
 
     Args:
-        df (pd.DataFrame): the rpm view
+        df (pd.DataFrame): rows of a view
+        usecols (list[str]): the columns requested by the caller
 
     Returns:
-        pd.DataFrame: RPM view
+        pd.DataFrame: the rows with the requested columns
     """
-    df[est_tz_column_name] = df[est_tz_column_name].str.rsplit("-", n=1, expand=True)[0]
+    if est_column in usecols:
+        df[est_column] = epoch_seconds_to_eastern(df[epoch_column])
+    if epoch_column not in usecols:
+        df = df.drop(columns=[epoch_column])
     df["Bus #"] = df["Bus #"].astype("category")
     return df
 
 
-@st.cache_data
+def _get_view_columns(usecols: list[str]) -> list[str]:
+    # estDateTime is not stored, it is rendered from dateTime
+    return list(
+        dict.fromkeys(
+            "dateTime" if column == "estDateTime" else column for column in usecols
+        )
+    )
+
+
+def _filter_buses(
+    df: pd.DataFrame, bus_numbers: Optional[list[str]] = None
+) -> pd.DataFrame:
+    return df if not bus_numbers else df[df["Bus #"].isin(bus_numbers)]
+
+
+def _get_metric_view_from_parquet(
+    view_name: str,
+    nrows: Literal["All", "Random"] | int,
+    usecols: list[str],
+    bus_numbers: Optional[list[str]],
+    downcast_to: Literal["integer", "unsigned", "float"],
+) -> Optional[pd.DataFrame]:
+    """Reads a metric view from its parquet copy, only decoding usecols and skipping the
+    row groups of other buses when bus_numbers is passed.
+
+    Returns:
+        Optional[pd.DataFrame]: The view, None when there is no parquet copy of the view
+    """
+    view_df = read_parquet_view(
+        view_name,
+        METRICS_FINALIZED_DATA_FOLDER,
+        columns=_get_view_columns(usecols),
+        filters=[("Bus #", "in", bus_numbers)] if bus_numbers else None,
+        nrows=nrows if isinstance(nrows, int) else None,
+        normalize=upgrade_legacy_metric_view,
+        sample=DASHBOARD_SAMPLE if nrows == "Random" else None,
+    )
+    if view_df is None:
+        return None
+    return _downcast_data(_add_est_datetime(view_df, usecols), downcast_to)
+
+
 def get_rpm_data(
     nrows: Literal["All", "Random"] | int = "All",
     usecols: list[str] = ["data", "Bus #", "estDateTime"],
+    bus_numbers: Optional[list[str]] = None,
 ) -> pd.DataFrame:
     """Returns RPM data optimized with options allowing for nrows or a random sampling of data, as well
     as not returning dateTime
 
     Args:
         nrows (Literal['All','Random'] | int, optional): All returns all rows, Random will return a sampling
-        of 70% of the rows randomly chosen and a number n will return top n rows. Defaults to "All".
+        of 70% of the rows, the same rows on every call, and a number n will return top n rows. Defaults to "All".
         usecols (list[str], optional): Which cols you want returned. Defaults to ['data','Bus #', 'estDateTime'].
+        bus_numbers (Optional[list[str]], optional): Only return these buses. Defaults to all.
 
     Returns:
         pd.DataFrame: RPM data returned with a tad more optimization
     """
+    if (
+        rpm_view_df := _get_metric_view_from_parquet(
+            RPM_VIEW_DATA_PARQUET, nrows, usecols, bus_numbers, "integer"
+        )
+    ) is not None:
+        return rpm_view_df
     pandas_read_csv_kwargs = {
         "dtype": {
             "data": "int16[pyarrow]",
             "Bus #": "category",
-            "estDateTime": "string[pyarrow]",
-            "dateTime": "uint32[pyarrow]",
+            "dateTime": "int64",
         },
-        "usecols": usecols,
-        # "parse_dates":['estDateTime'],
-        # "infer_datetime_format":True,
+        "usecols": _get_view_columns(usecols),
         "dtype_backend": "pyarrow",
     }
 
-    drive_service = DriveService()
+    drive_service = get_drive_service()
     if isinstance(nrows, int):
         pandas_read_csv_kwargs = {
             "nrows": nrows,
@@ -72,62 +180,78 @@ def get_rpm_data(
         }
     else:
         pandas_read_csv_kwargs = {
-            "chunksize": 2000,
+            "iterator": True,
             **pandas_read_csv_kwargs,
         }
 
     if nrows == "Random":
-        rpm_view_df = _remove_est_tz_info(
-            get_random_sample_of_chunks(
-                get_csv_from_drive_as_dataframe(
-                    RPM_VIEW_DATA_CSV,
-                    drive_service=drive_service,
-                    pandas_read_csv_kwargs=pandas_read_csv_kwargs,
-                ),  # type: ignore
-                sample_percent=0.7,
-            )
+        rpm_view_df = _add_est_datetime(
+            sample_chunks(
+                iter_planned_chunks(
+                    get_csv_from_drive_as_dataframe(
+                        RPM_VIEW_DATA_CSV,
+                        drive_service=drive_service,
+                        pandas_read_csv_kwargs={
+                            **pandas_read_csv_kwargs,
+                            "usecols": _get_view_columns(
+                                [*usecols, *DASHBOARD_SAMPLE.key_columns]
+                            ),
+                        },
+                        ranged=True,
+                    )  # type: ignore
+                ),
+                DASHBOARD_SAMPLE,
+            ),
+            usecols,
         )  # type: ignore
         rpm_view_df["Bus #"] = rpm_view_df["Bus #"].astype("category")
-        return rpm_view_df
+        return _filter_buses(rpm_view_df, bus_numbers)
 
-    rpm_view_chunks = get_csv_from_drive_as_dataframe(
-        RPM_VIEW_DATA_CSV,
-        drive_service=drive_service,
-        pandas_read_csv_kwargs=pandas_read_csv_kwargs,
+    rpm_view_chunks = iter_planned_chunks(
+        get_csv_from_drive_as_dataframe(
+            RPM_VIEW_DATA_CSV,
+            drive_service=drive_service,
+            pandas_read_csv_kwargs=pandas_read_csv_kwargs,
+            ranged=True,
+        )  # type: ignore
     )
-    return pd.concat((_downcast_data(_remove_est_tz_info(rpm_view_df), "integer") for rpm_view_df in rpm_view_chunks), ignore_index=True)  # type: ignore
+    return _filter_buses(pd.concat((_downcast_data(_add_est_datetime(rpm_view_df, usecols), "integer") for rpm_view_df in rpm_view_chunks), ignore_index=True), bus_numbers)  # type: ignore
 
 
-@st.cache_data(persist=True)
 def get_battery_data(
     nrows: Literal["All", "Random"] | int = "All",
     usecols: list[str] = ["data", "Bus #", "estDateTime"],
+    bus_numbers: Optional[list[str]] = None,
 ) -> pd.DataFrame:
     """Returns Battery data optimized with options allowing for nrows or a random sampling of data, as well
     as not returning dateTime
 
     Args:
         nrows (Literal['All','Random'] | int, optional): All returns all rows, Random will return a sampling
-        of 70% of the rows randomly chosen and a number n will return top n rows. Defaults to "All".
+        of 70% of the rows, the same rows on every call, and a number n will return top n rows. Defaults to "All".
         usecols (list[str], optional): Which cols you want returned. Defaults to ['data','Bus #', 'estDateTime'].
+        bus_numbers (Optional[list[str]], optional): Only return these buses. Defaults to all.
 
     Returns:
         pd.DataFrame: battery data returned with a tad more optimization
     """
+    if (
+        battery_view_df := _get_metric_view_from_parquet(
+            BATTERY_VIEW_DATA_PARQUET, nrows, usecols, bus_numbers, "float"
+        )
+    ) is not None:
+        return battery_view_df
     pandas_read_csv_kwargs = {
         "dtype": {
             "data": "float32",
             "Bus #": "category",
-            "estDateTime": "string[pyarrow]",
-            "dateTime": "uint32[pyarrow]",
+            "dateTime": "int64",
         },
-        "usecols": usecols,
-        # "parse_dates":['estDateTime'],
-        # "infer_datetime_format":True,
+        "usecols": _get_view_columns(usecols),
         "dtype_backend": "pyarrow",
     }
 
-    drive_service = DriveService()
+    drive_service = get_drive_service()
     if isinstance(nrows, int):
         pandas_read_csv_kwargs = {
             "nrows": nrows,
@@ -135,47 +259,114 @@ def get_battery_data(
         }
     else:
         pandas_read_csv_kwargs = {
-            "chunksize": 2000,
+            "iterator": True,
             **pandas_read_csv_kwargs,
         }
 
     if nrows == "Random":
-        battery_view_df = _remove_est_tz_info(
-            get_random_sample_of_chunks(
-                get_csv_from_drive_as_dataframe(
-                    BATTERY_VIEW_DATA_CSV,
-                    drive_service=drive_service,
-                    pandas_read_csv_kwargs=pandas_read_csv_kwargs,
-                ),  # type: ignore
-                sample_percent=0.7,
-            )
+        battery_view_df = _add_est_datetime(
+            sample_chunks(
+                iter_planned_chunks(
+                    get_csv_from_drive_as_dataframe(
+                        BATTERY_VIEW_DATA_CSV,
+                        drive_service=drive_service,
+                        pandas_read_csv_kwargs={
+                            **pandas_read_csv_kwargs,
+                            "usecols": _get_view_columns(
+                                [*usecols, *DASHBOARD_SAMPLE.key_columns]
+                            ),
+                        },
+                    )  # type: ignore
+                ),
+                DASHBOARD_SAMPLE,
+            ),
+            usecols,
         )  # type: ignore
         battery_view_df["Bus #"] = battery_view_df["Bus #"].astype("category")
-        return battery_view_df
+        return _filter_buses(battery_view_df, bus_numbers)
 
-    battery_view_chunks = get_csv_from_drive_as_dataframe(
-        BATTERY_VIEW_DATA_CSV,
-        drive_service=drive_service,
-        pandas_read_csv_kwargs=pandas_read_csv_kwargs,
+    battery_view_chunks = iter_planned_chunks(
+        get_csv_from_drive_as_dataframe(
+            BATTERY_VIEW_DATA_CSV,
+            drive_service=drive_service,
+            pandas_read_csv_kwargs=pandas_read_csv_kwargs,
+        )  # type: ignore
     )
-    return pd.concat((_downcast_data(_remove_est_tz_info(battery_view_df), "float") for battery_view_df in battery_view_chunks), ignore_index=True)  # type: ignore
+    return _filter_buses(pd.concat((_downcast_data(_add_est_datetime(battery_view_df, usecols), "float") for battery_view_df in battery_view_chunks), ignore_index=True), bus_numbers)  # type: ignore
+
+
+@shared_dataset(RPM_VIEW_VERSION)
+def get_rpm_data_by_bus(
+    nrows: Literal["All", "Random"] | int = "All",
+    usecols: list[str] = ["data", "Bus #", "estDateTime"],
+) -> BusPartitions:
+    """Returns the rows of get_rpm_data grouped by bus, for pages selecting buses.  The
+    rows are sorted by bus once when loaded, selecting a bus with BusPartitions.get is
+    then a slice instead of a scan of every row.  get_rpm_data is not shared itself, only
+    the sorted rows are kept in memory.
+
+    Args:
+        nrows (Literal['All','Random'] | int, optional): see get_rpm_data. Defaults to "All".
+        usecols (list[str], optional): see get_rpm_data. Defaults to ['data','Bus #', 'estDateTime'].
+
+    Returns:
+        BusPartitions: RPM data grouped by bus
+    """
+    return BusPartitions(get_rpm_data(nrows, usecols))
+
+
+@shared_dataset(BATTERY_VIEW_VERSION)
+def get_battery_data_by_bus(
+    nrows: Literal["All", "Random"] | int = "All",
+    usecols: list[str] = ["data", "Bus #", "estDateTime"],
+) -> BusPartitions:
+    """Returns the rows of get_battery_data grouped by bus, see get_rpm_data_by_bus
+
+    Args:
+        nrows (Literal['All','Random'] | int, optional): see get_battery_data. Defaults to "All".
+        usecols (list[str], optional): see get_battery_data. Defaults to ['data','Bus #', 'estDateTime'].
+
+    Returns:
+        BusPartitions: Battery data grouped by bus
+    """
+    return BusPartitions(get_battery_data(nrows, usecols))
 
 
-@st.cache_data(persist=True)
+@shared_dataset(BREAKDOWN_VIEW_VERSION)
 def get_breakdown_data() -> pd.DataFrame:
-    file_id = BUS_BREAKDOWN_VIEW
-    bus_breakdown_view_df = get_csv_from_drive_as_dataframe(file_id)
-    return bus_breakdown_view_df.drop_duplicates(keep="first")
+    bus_breakdown_view_df = read_parquet_view(
+        BUS_BREAKDOWN_VIEW_PARQUET,
+        BREAKDOWN_VIEW_FOLDER,
+        normalize=upgrade_legacy_breakdown_view,
+    )
+    if bus_breakdown_view_df is None:
+        bus_breakdown_view_df = upgrade_legacy_breakdown_view(
+            get_csv_from_drive_as_dataframe(BUS_BREAKDOWN_VIEW)  # type: ignore
+        )
+    bus_breakdown_view_df = bus_breakdown_view_df.drop_duplicates(keep="first")
+    # rows ingested before the pipeline extracted keywords have none until the next
+    # breakdown pipeline run backfills them
+    bus_breakdown_view_df["keywords"] = bus_breakdown_view_df.get(
+        "keywords", pd.Series("", index=bus_breakdown_view_df.index)
+    ).fillna("")
+    bus_breakdown_view_df["estReportedAt"] = epoch_seconds_to_eastern(
+        bus_breakdown_view_df["reportedAt"]
+    )
+    return bus_breakdown_view_df
 
 
-@st.cache_data(persist=True)
+@shared_dataset(BREAKDOWN_VIEW_VERSION)
 def get_breakdown_timeline() -> pd.DataFrame:
     breakdown_df = get_breakdown_data()
-    breakdown_df = _remove_est_tz_info(breakdown_df, "estReportedAt")
     breakdown_df = breakdown_df.rename(columns={"estReportedAt": "Reported At"})
     return breakdown_df[["Bus #", "Reported At"]].drop_duplicates(keep="first")
 
 
+@shared_dataset(BREAKDOWN_VIEW_VERSION)
+def get_breakdown_timeline_by_bus() -> BusPartitions:
+    return BusPartitions(get_breakdown_timeline())
+
+
 def get_breakdown_count_by_bus() -> pd.DataFrame:
     breakdown_df = get_breakdown_timeline()
     breakdown_df = (
@@ -186,7 +377,109 @@ def get_breakdown_count_by_bus() -> pd.DataFrame:
 
 
 def format_breakdown_for_chart(selected_bus: str) -> pd.DataFrame:
-    breakdown_df = get_breakdown_timeline()
-    breakdown_df = breakdown_df.loc[breakdown_df["Bus #"] == selected_bus]
+    breakdown_df = get_breakdown_timeline_by_bus().get(selected_bus)
     breakdown_df = breakdown_df.rename(columns={"Reported At": "estDateTime"})
     return breakdown_df
+
+
+@shared_dataset(RPM_VIEW_VERSION)
+def get_rpm_rollup(period: RollupPeriod = "daily") -> pd.DataFrame:
+    """Returns the per bus rollup of the rpm view generated by the ingestion pipeline,
+    see data/rollups.py.  It is computed from the view when it was not generated yet.
+
+    Args:
+        period (RollupPeriod, optional): hourly or daily. Defaults to "daily".
+
+    Returns:
+        pd.DataFrame: Bus #, estPeriod, count, min, max, sum, sum_sq, mean and std
+    """
+    rollup_df = load_rollup(
+        RPM_VIEW_DATA_PARQUET, METRICS_FINALIZED_DATA_FOLDER, period
+    )
+    if rollup_df is None:
+        rollup_df = compute_metric_rollup(
+            get_rpm_data(usecols=["data", "Bus #", "dateTime"]), period
+        )
+    return rollup_df
+
+
+@shared_dataset(BATTERY_VIEW_VERSION)
+def get_battery_rollup(period: RollupPeriod = "daily") -> pd.DataFrame:
+    """Returns the per bus rollup of the battery view, see get_rpm_rollup
+
+    Args:
+        period (RollupPeriod, optional): hourly or daily. Defaults to "daily".
+
+    Returns:
+        pd.DataFrame: Bus #, estPeriod, count, min, max, sum, sum_sq, mean and std
+    """
+    rollup_df = load_rollup(
+        BATTERY_VIEW_DATA_PARQUET, METRICS_FINALIZED_DATA_FOLDER, period
+    )
+    if rollup_df is None:
+        rollup_df = compute_metric_rollup(
+            get_battery_data(usecols=["data", "Bus #", "dateTime"]), period
+        )
+    return rollup_df
+
+
+@shared_dataset(BREAKDOWN_VIEW_VERSION)
+def get_breakdown_monthly_counts() -> pd.DataFrame:
+    """Returns the number of breakdowns of every bus per month, see get_rpm_rollup
+
+    Returns:
+        pd.DataFrame: Bus #, estPeriod, the first day of the month, and count
+    """
+    rollup_df = load_rollup(
+        BUS_BREAKDOWN_VIEW_PARQUET, BREAKDOWN_VIEW_FOLDER, "monthly"
+    )
+    if rollup_df is None:
+        rollup_df = compute_breakdown_rollup(get_breakdown_data())
+    return rollup_df
+
+
+# the datasets each page reads, the overview only reads kilobytes of rollups so it is
+# loaded first and usable seconds after a deploy
+OVERVIEW_DATASETS = [
+    partial(get_battery_rollup),
+    partial(get_rpm_rollup),
+    partial(get_breakdown_monthly_counts),
+]
+BREAKDOWN_DATASETS = [
+    partial(get_breakdown_data),
+    partial(get_breakdown_timeline_by_bus),
+]
+BATTERY_DATASETS = [partial(get_battery_data_by_bus)]
+RPM_SAMPLE_DATASETS = [partial(get_rpm_data_by_bus, nrows="Random")]
+RPM_DATASETS = [partial(get_rpm_data_by_bus)]
+DASHBOARD_WARMUP = DatasetWarmup(
+    OVERVIEW_DATASETS
+    + BREAKDOWN_DATASETS
+    + BATTERY_DATASETS
+    + RPM_SAMPLE_DATASETS
+    + RPM_DATASETS
+)
+
+
+def show_loading_progress(datasets: list[partial]) -> None:
+    """Waits for the datasets of a page while DASHBOARD_WARMUP loads them, showing a
+    progress bar instead of a page stuck on a download.  Datasets the warmup does not
+    load, or failed to load, are loaded by the page itself.
+
+    Args:
+        datasets (list[partial]): the datasets the page reads, ie OVERVIEW_DATASETS
+    """
+    DASHBOARD_WARMUP.start()
+    progress_bar = None
+    while not DASHBOARD_WARMUP.ready:
+        loaded = sum(is_dataset_loaded(dataset) for dataset in datasets)
+        if loaded == len(datasets):
+            break
+        progress_bar = progress_bar or st.progress(0.0)
+        progress_bar.progress(
+            loaded / len(datasets),
+            text=f"Loading the latest views, {loaded} of {len(datasets)} ready",
+        )
+        time.sleep(0.5)
+    if progress_bar is not None:
+        progress_bar.empty()
@@ -0,0 +1,10 @@
+import pytest
+
+from connnections.local_drive import LocalDriveService
+from connnections.storage import DriveBackend
+
+
+@pytest.fixture
+def local_drive(tmp_path) -> DriveBackend:
+    """An empty LocalDriveService, drive folders are sub directories of tmp_path"""
+    return LocalDriveService(str(tmp_path))
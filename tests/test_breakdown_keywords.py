@@ -0,0 +1,83 @@
+import pandas as pd
+
+from data.breakdown_keywords import KeywordMemo, normalize_description
+from data.breakdown_transformation import (
+    add_missing_keywords,
+    backfill_breakdown_view_keywords,
+)
+from data.CONSTANTS import BREAKDOWN_VIEW_FOLDER
+from data.parquet_views import (
+    append_parquet_view_segment,
+    parquet_view_has_column,
+    read_parquet_view,
+)
+
+VIEW_NAME = "bus_breakdown_view.parquet"
+
+
+def make_memo() -> KeywordMemo:
+    # every description of the tests is memoized, nothing is extracted
+    return KeywordMemo({"flat tire": "flat tire", "wont start": "start"})
+
+
+def make_view_df(descriptions: list[str]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "description": descriptions,
+            "reportedAt": range(len(descriptions)),
+            "Bus #": ["1001"] * len(descriptions),
+        }
+    )
+
+
+def test_normalize_description_ignores_case_and_spacing():
+    assert normalize_description("  Flat   TIRE ") == "flat tire"
+
+
+def test_add_missing_keywords_fills_rows_without_keywords():
+    view_df = make_view_df(["Flat tire", "wont start"]).assign(keywords=["kept", None])
+
+    filled_df = add_missing_keywords(view_df, make_memo())
+
+    assert filled_df["keywords"].tolist() == ["kept", "start"]
+    assert view_df["keywords"].isna().sum() == 1
+
+
+def test_add_missing_keywords_adds_the_column():
+    filled_df = add_missing_keywords(make_view_df(["flat tire"]), make_memo())
+
+    assert filled_df["keywords"].tolist() == ["flat tire"]
+
+
+def test_backfill_rewrites_segments_without_keywords(local_drive, monkeypatch):
+    monkeypatch.setattr(
+        "data.breakdown_transformation.get_drive_service", lambda: local_drive
+    )
+    append_parquet_view_segment(
+        make_view_df(["flat tire"]),
+        VIEW_NAME,
+        BREAKDOWN_VIEW_FOLDER,
+        ["Bus #", "reportedAt"],
+        local_drive,
+    )
+    append_parquet_view_segment(
+        make_view_df(["wont start"]).assign(keywords=["start"]),
+        VIEW_NAME,
+        BREAKDOWN_VIEW_FOLDER,
+        ["Bus #", "reportedAt"],
+        local_drive,
+    )
+    assert not parquet_view_has_column(
+        VIEW_NAME, BREAKDOWN_VIEW_FOLDER, "keywords", local_drive
+    )
+
+    assert backfill_breakdown_view_keywords(VIEW_NAME, make_memo())
+
+    assert parquet_view_has_column(
+        VIEW_NAME, BREAKDOWN_VIEW_FOLDER, "keywords", local_drive
+    )
+    view_df = read_parquet_view(
+        VIEW_NAME, BREAKDOWN_VIEW_FOLDER, drive_service=local_drive
+    )
+    assert sorted(view_df["keywords"]) == ["flat tire", "start"]
+    assert not backfill_breakdown_view_keywords(VIEW_NAME, make_memo())
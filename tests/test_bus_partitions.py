@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from data.bus_partitions import BusPartitions
+
+
+def make_view_df(buses: list[str]) -> pd.DataFrame:
+    return pd.DataFrame({"data": np.arange(len(buses), dtype=np.int64), "Bus #": buses})
+
+
+def test_get_returns_the_rows_of_the_bus_in_their_order():
+    df = make_view_df(["b", "a", "b", "c", "a"])
+
+    partitions = BusPartitions(df)
+
+    assert partitions.buses == ["a", "b", "c"]
+    assert partitions.get("a")["data"].tolist() == [1, 4]
+    assert partitions.get("b")["data"].tolist() == [0, 2]
+    assert partitions.get("c")["data"].tolist() == [3]
+    assert len(partitions) == len(df)
+
+
+def test_get_of_an_unknown_bus_is_empty():
+    partitions = BusPartitions(make_view_df(["a", "b"]))
+
+    assert partitions.get("z").empty
+    assert partitions.get_slice("z") == slice(0, 0)
+
+
+def test_grouped_rows_are_referenced_instead_of_copied():
+    df = make_view_df(["a", "a", "b", "c"])
+    df["Bus #"] = df["Bus #"].astype("category")
+
+    partitions = BusPartitions(df)
+
+    assert np.shares_memory(partitions.df["data"].to_numpy(), df["data"].to_numpy())
+    assert partitions.get("b")["data"].tolist() == [2]
+
+
+def test_ungrouped_rows_are_sorted_with_categorical_buses():
+    partitions = BusPartitions(make_view_df(["b", "a"]))
+
+    assert isinstance(partitions.df["Bus #"].dtype, pd.CategoricalDtype)
+    assert partitions.df["Bus #"].tolist() == ["a", "b"]
+
+
+def test_shallow_copy_shares_the_offsets():
+    partitions = BusPartitions(make_view_df(["b", "a", "b"]))
+
+    partitions_copy = partitions.copy(deep=False)
+
+    assert partitions_copy.offsets is partitions.offsets
+    assert partitions_copy.get("b")["data"].tolist() == [0, 2]
@@ -0,0 +1,75 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from data.chunking import ChunkPlanner, ColumnBuffers, iter_planned_chunks
+
+
+def test_first_chunk_uses_the_initial_rows():
+    assert ChunkPlanner(initial_rows=123).next_chunksize() == 123
+
+
+def test_chunks_are_sized_from_the_memory_budget():
+    planner = ChunkPlanner(memory_budget_bytes=80_000, min_rows=1, max_rows=10**6)
+    chunk = pd.DataFrame({"value": np.zeros(1000, dtype=np.int64)})
+
+    planner.observe(chunk)
+
+    bytes_per_row = chunk.memory_usage(index=True, deep=True).sum() / len(chunk)
+    assert planner.next_chunksize() == int(80_000 // bytes_per_row)
+
+
+def test_chunk_sizes_are_bounded():
+    chunk = pd.DataFrame({"value": np.zeros(100, dtype=np.int64)})
+    small_planner = ChunkPlanner(memory_budget_bytes=1, min_rows=50)
+    large_planner = ChunkPlanner(memory_budget_bytes=10**12, max_rows=5000)
+
+    small_planner.observe(chunk)
+    large_planner.observe(chunk)
+
+    assert small_planner.next_chunksize() == 50
+    assert large_planner.next_chunksize() == 5000
+
+
+def test_empty_chunks_are_not_measured():
+    planner = ChunkPlanner(initial_rows=10)
+
+    planner.observe(pd.DataFrame({"value": []}))
+
+    assert planner.bytes_per_row is None
+    assert planner.next_chunksize() == 10
+
+
+def test_iter_planned_chunks_reads_every_row():
+    csv = "value,name\n" + "".join(f"{row},bus{row % 3}\n" for row in range(2500))
+    reader = pd.read_csv(io.StringIO(csv), iterator=True)
+    planner = ChunkPlanner(memory_budget_bytes=1, initial_rows=700, min_rows=400)
+
+    chunks = list(iter_planned_chunks(reader, planner))
+
+    assert [len(chunk) for chunk in chunks] == [700, 400, 400, 400, 400, 200]
+    assert pd.concat(chunks)["value"].tolist() == list(range(2500))
+
+
+def test_column_buffers_collect_chunks_in_order():
+    buffers = ColumnBuffers(capacity=2)
+    for start in range(0, 10, 3):
+        buffers.append(
+            pd.DataFrame(
+                {
+                    "value": pd.Series(range(start, min(start + 3, 10)), dtype="int8"),
+                    "bus": pd.Categorical(["a", "b", "c"][: min(3, 10 - start)]),
+                }
+            )
+        )
+    buffers.append(
+        pd.DataFrame({"value": pd.Series([1000], dtype="int16"), "bus": ["d"]})
+    )
+
+    df = buffers.to_dataframe()
+
+    assert df["value"].tolist() == [*range(10), 1000]
+    assert df["value"].dtype == np.int16
+    assert isinstance(df["bus"].dtype, pd.CategoricalDtype)
+    assert df["bus"].tolist()[-2:] == ["a", "d"]
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from data.downsampling import (
+    downsample_for_chart,
+    get_lttb_indices,
+    get_min_max_indices,
+)
+
+
+def make_series(n: int = 1000) -> tuple[np.ndarray, np.ndarray]:
+    x = np.arange(n, dtype=np.int64) * 60
+    y = np.sin(np.arange(n) / 25) * 100
+    return x, y
+
+
+def test_lttb_keeps_n_out_sorted_points_with_both_ends():
+    x, y = make_series()
+
+    indices = get_lttb_indices(x, y, 100)
+
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    x, y = make_series()
+    y[537] = 10_000
+
+    assert 537 in get_lttb_indices(x, y, 50)
+
+
+def test_lttb_keeps_every_point_when_there_are_few():
+    x, y = make_series(10)
+
+    assert get_lttb_indices(x, y, 20).tolist() == list(range(10))
+    assert get_lttb_indices(x, y, 2).tolist() == list(range(10))
+
+
+def test_min_max_keeps_the_extremes():
+    _, y = make_series()
+    y[10], y[900] = -1_000, 1_000
+
+    indices = get_min_max_indices(y, 40)
+
+    assert len(indices) <= 40
+    assert {10, 900} <= set(indices)
+
+
+def test_downsample_for_chart_keeps_flagged_rows_and_marker_rows():
+    x, y = make_series()
+    df = pd.DataFrame({"time": x, "value": y}).iloc[::-1]
+    keep = np.zeros(len(df), dtype=bool)
+    keep[df.index.get_indexer([123])] = True
+
+    chart_df = downsample_for_chart(
+        df, "time", "value", 50, keep=keep, marker_times=pd.Series([x[700] + 30])
+    )
+
+    assert chart_df["time"].is_monotonic_increasing
+    assert {123, 700, 701} <= set(chart_df.index)
+    assert len(chart_df) <= 50 + 3
+
+
+def test_downsample_for_chart_drops_rows_without_a_value():
+    df = pd.DataFrame({"time": [1, 2, 3], "value": [1.0, np.nan, 3.0]})
+
+    assert downsample_for_chart(df, "time", "value", 10)["time"].tolist() == [1, 3]
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from connnections.file_cache import DriveFileCache
+
+
+@pytest.fixture
+def file_cache(tmp_path) -> DriveFileCache:
+    return DriveFileCache(str(tmp_path), max_bytes=100)
+
+
+def read_entry(file_cache: DriveFileCache, key: str) -> bytes:
+    cached_file = file_cache.open(key)
+    assert cached_file is not None
+    body = cached_file.read()
+    cached_file.close()
+    return body
+
+
+def test_changed_files_miss_the_cache(file_cache):
+    key = file_cache.cache_key("file", {"md5Checksum": "a"})
+    file_cache.put(key, b"first")
+
+    assert read_entry(file_cache, key) == b"first"
+    assert file_cache.open(file_cache.cache_key("file", {"md5Checksum": "b"})) is None
+    # modifiedTime is only used by files without a checksum, ie google docs
+    assert file_cache.cache_key("file", {"modifiedTime": "t1"}) != (
+        file_cache.cache_key("file", {"modifiedTime": "t2"})
+    )
+
+
+def test_a_new_version_replaces_the_old_one(file_cache):
+    old_key = file_cache.cache_key("file", {"md5Checksum": "a"})
+    new_key = file_cache.cache_key("file", {"md5Checksum": "b"})
+    other_key = file_cache.cache_key("other", {"md5Checksum": "a"})
+    file_cache.put(old_key, b"old")
+    file_cache.put(other_key, b"other")
+
+    file_cache.put(new_key, b"new")
+
+    assert file_cache.open(old_key) is None
+    assert read_entry(file_cache, new_key) == b"new"
+    assert read_entry(file_cache, other_key) == b"other"
+
+
+def test_least_recently_read_entries_are_evicted(file_cache):
+    keys = [file_cache.cache_key(f"file{number}", {}) for number in range(3)]
+    for age, key in enumerate(keys[:2]):
+        file_cache.put(key, b"x" * 40)
+        os.utime(file_cache._path(key), (age, age))
+    read_entry(file_cache, keys[0])
+
+    file_cache.put(keys[2], b"x" * 40)
+
+    assert file_cache.open(keys[1]) is None
+    assert read_entry(file_cache, keys[0]) == b"x" * 40
+    assert read_entry(file_cache, keys[2]) == b"x" * 40
+
+
+def test_empty_files_are_cached(file_cache):
+    key = file_cache.cache_key("empty", {})
+    file_cache.put(key, b"")
+
+    assert read_entry(file_cache, key) == b""
+
+
+def test_entries_removed_by_another_instance_are_skipped(file_cache, monkeypatch):
+    old_key = file_cache.cache_key("file", {"md5Checksum": "a"})
+    file_cache.put(old_key, b"old")
+    listed_entries = list(os.scandir(file_cache.cache_dir))
+    # another instance sharing the directory removes the entry after it was listed
+    DriveFileCache(file_cache.cache_dir, 100).put(
+        file_cache.cache_key("file", {"md5Checksum": "b"}), b"new"
+    )
+    monkeypatch.setattr(
+        "connnections.file_cache.os.scandir", lambda path: iter(listed_entries)
+    )
+
+    file_cache.put(file_cache.cache_key("file", {"md5Checksum": "c"}), b"newer")
+    file_cache.evict()
+
+    assert (
+        read_entry(file_cache, file_cache.cache_key("file", {"md5Checksum": "c"}))
+        == b"newer"
+    )
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from data.ingestion_manifest import (
+    get_file_fingerprint,
+    get_unprocessed_raw_files,
+    load_ingestion_manifest,
+    save_ingestion_manifest,
+)
+
+
+def upload_raw_file(local_drive, name: str, contents: bytes, file_id: str = "") -> str:
+    return local_drive.upload_file(
+        filename=name, folder_id="raw", file=[contents], file_id=file_id
+    )
+
+
+def test_fingerprint_prefers_the_checksum():
+    assert (
+        get_file_fingerprint(
+            {"id": "1", "md5Checksum": "abc", "modifiedTime": "2023-06-01T00:00:00Z"}
+        )
+        == "abc"
+    )
+    assert (
+        get_file_fingerprint({"id": "1", "modifiedTime": "2023-06-01T00:00:00Z"})
+        == "2023-06-01T00:00:00Z"
+    )
+
+
+def test_only_new_and_changed_files_are_unprocessed(local_drive):
+    unchanged_id = upload_raw_file(local_drive, "unchanged.csv", b"a\n1\n")
+    changed_id = upload_raw_file(local_drive, "changed.csv", b"a\n2\n")
+    manifest = {
+        raw_file["id"]: get_file_fingerprint(raw_file)
+        for raw_file in get_unprocessed_raw_files("raw", {}, local_drive)
+    }
+    assert sorted(manifest) == sorted([unchanged_id, changed_id])
+
+    upload_raw_file(local_drive, "changed.csv", b"a\n2\n3\n", file_id=changed_id)
+    # the local drive fingerprints files by their modified time
+    changed_path = local_drive._get_path(changed_id)
+    modified_time = os.stat(changed_path).st_mtime + 1
+    os.utime(changed_path, (modified_time, modified_time))
+    new_id = upload_raw_file(local_drive, "new.csv", b"a\n4\n")
+
+    raw_files = get_unprocessed_raw_files("raw", manifest, local_drive)
+
+    assert [raw_file["id"] for raw_file in raw_files] == sorted([changed_id, new_id])
+
+
+def test_checksums_are_compared_when_drive_has_them(local_drive, monkeypatch):
+    raw_files = [
+        {"id": "2", "md5Checksum": "changed", "modifiedTime": "2023-06-01T00:00:00Z"},
+        {"id": "1", "md5Checksum": "same", "modifiedTime": "2023-06-02T00:00:00Z"},
+        {"id": "3", "md5Checksum": "new", "modifiedTime": "2023-06-01T00:00:00Z"},
+    ]
+    monkeypatch.setattr(
+        local_drive, "list_files_in_shared_drive_folder", lambda *_, **__: raw_files
+    )
+    # a new modified time with the same checksum is not a new version
+    manifest = {"1": "same", "2": "previous"}
+
+    unprocessed = get_unprocessed_raw_files("raw", manifest, local_drive)
+
+    assert [raw_file["id"] for raw_file in unprocessed] == ["2", "3"]
+
+
+def test_manifest_round_trip(local_drive):
+    assert load_ingestion_manifest("manifest.json", "manifests", local_drive) == (
+        None,
+        {},
+    )
+
+    manifest_id = save_ingestion_manifest(
+        "manifest.json", "manifests", {"b": "2", "a": "1"}, drive_service=local_drive
+    )
+    assert load_ingestion_manifest("manifest.json", "manifests", local_drive) == (
+        manifest_id,
+        {"a": "1", "b": "2"},
+    )
+
+    updated_id = save_ingestion_manifest(
+        "manifest.json",
+        "manifests",
+        {"a": "1", "b": "2", "c": "3"},
+        manifest_id,
+        local_drive,
+    )
+    assert updated_id == manifest_id
+    _, manifest = load_ingestion_manifest("manifest.json", "manifests", local_drive)
+    assert manifest == {"a": "1", "b": "2", "c": "3"}
+    assert len(local_drive.list_files_in_shared_drive_folder("manifests")) == 1
+
+
+def test_failed_manifest_upload_raises(local_drive, monkeypatch):
+    monkeypatch.setattr(local_drive, "upload_file", lambda **_: None)
+
+    with pytest.raises(ValueError, match="manifest.json"):
+        save_ingestion_manifest("manifest.json", "manifests", {}, None, local_drive)
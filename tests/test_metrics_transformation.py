@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.CONSTANTS import METRICS_FINALIZED_DATA_FOLDER, METRICS_SNAPSHOT_FOLDER
+from data.metrics_transformation import (
+    get_ids_from_json,
+    upload_metrics_view_data,
+    upload_metrics_view_segments,
+)
+from data.parquet_views import load_view_index, read_parquet_view
+from data.row_hash_index import RowHashIndex
+from data.view_snapshots import load_snapshot_index
+
+VIEW_NAME = "rpm_view_data.parquet"
+
+
+def make_partition(times: range) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "data": np.arange(len(times), dtype=np.int64),
+            "dateTime": np.array(times, dtype=np.int64),
+            "Bus #": pd.Categorical(["1001"] * len(times)),
+        }
+    )
+
+
+def test_partitions_are_uploaded_as_bounded_segments(local_drive, monkeypatch):
+    monkeypatch.setattr(
+        "data.metrics_transformation.get_drive_service", lambda: local_drive
+    )
+    partitions = [make_partition(range(start, start + 4)) for start in range(0, 20, 4)]
+
+    added_df = upload_metrics_view_segments(
+        iter(partitions), VIEW_NAME, RowHashIndex(), segment_rows=8
+    )
+
+    _, index = load_view_index(VIEW_NAME, METRICS_FINALIZED_DATA_FOLDER, local_drive)
+    assert [segment["rows"] for segment in index["segments"]] == [8, 8, 4]
+    assert sorted(added_df["dateTime"]) == list(range(20))
+
+
+def test_rows_already_in_the_view_are_not_uploaded_again(local_drive, monkeypatch):
+    monkeypatch.setattr(
+        "data.metrics_transformation.get_drive_service", lambda: local_drive
+    )
+    row_hash_index = RowHashIndex()
+    upload_metrics_view_segments(
+        [make_partition(range(4))], VIEW_NAME, row_hash_index, segment_rows=8
+    )
+
+    added_df = upload_metrics_view_segments(
+        [make_partition(range(4)), make_partition(range(4, 6))],
+        VIEW_NAME,
+        row_hash_index,
+        segment_rows=8,
+    )
+
+    assert sorted(added_df["dateTime"]) == [4, 5]
+    view_df = read_parquet_view(
+        VIEW_NAME, METRICS_FINALIZED_DATA_FOLDER, drive_service=local_drive
+    )
+    assert sorted(view_df["dateTime"]) == list(range(6))
+
+
+def test_overwrite_replaces_the_view(local_drive, monkeypatch):
+    monkeypatch.setattr(
+        "data.metrics_transformation.get_drive_service", lambda: local_drive
+    )
+    row_hash_index = RowHashIndex()
+    upload_metrics_view_segments(
+        [make_partition(range(4))], VIEW_NAME, row_hash_index, segment_rows=2
+    )
+
+    upload_metrics_view_segments(
+        [make_partition(range(2))],
+        VIEW_NAME,
+        row_hash_index,
+        overwrite=True,
+        segment_rows=2,
+    )
+
+    _, index = load_view_index(VIEW_NAME, METRICS_FINALIZED_DATA_FOLDER, local_drive)
+    assert [segment["rows"] for segment in index["segments"]] == [2]
+
+
+def test_failed_csv_view_upload_saves_no_snapshot(local_drive, monkeypatch):
+    monkeypatch.setattr(
+        "data.metrics_transformation.get_drive_service", lambda: local_drive
+    )
+    upload_file = local_drive.upload_file
+
+    def fail_csv_upload(**kwargs):
+        if kwargs["filename"].endswith(".csv"):
+            return None
+        return upload_file(**kwargs)
+
+    monkeypatch.setattr(local_drive, "upload_file", fail_csv_upload)
+
+    with pytest.raises(ValueError):
+        upload_metrics_view_data(
+            "", "rpm_view_data.csv", make_partition(range(4)), overwrite=True
+        )
+
+    _, index = load_snapshot_index(
+        "rpm_view_data", METRICS_SNAPSHOT_FOLDER, local_drive
+    )
+    assert index["snapshots"] == []
+
+
+def test_device_ids_are_decoded_by_the_pattern():
+    devices = pd.Series(["{'id': 'b1'}", '{"id":"b2"}', "{'id': 'b1'}"])
+
+    device_ids = get_ids_from_json(devices)
+
+    assert isinstance(device_ids.dtype, pd.CategoricalDtype)
+    assert device_ids.tolist() == ["b1", "b2", "b1"]
+
+
+def test_device_ids_the_pattern_misses_are_decoded_as_json():
+    devices = pd.Series(["{'id': 'b1', 'name': 'b1'}", "{'id': 12}"])
+
+    assert get_ids_from_json(devices).tolist() == ["b1", "12"]
+
+
+def test_malformed_devices_are_kept_as_is(capsys):
+    devices = pd.Series(["{'id': 'b1'}", "b2", "{'name': 'b3'}"])
+
+    assert get_ids_from_json(devices).tolist() == ["b1", "b2", "{'name': 'b3'}"]
+    assert "2 device values could not be decoded" in capsys.readouterr().out
@@ -0,0 +1,122 @@
+import pandas as pd
+
+from data.parquet_views import (
+    append_parquet_view_segment,
+    compact_parquet_view,
+    load_view_index,
+    read_parquet_view,
+    replace_parquet_view_segments,
+    upload_parquet_file,
+)
+
+
+def make_view_df(times: list[int]) -> pd.DataFrame:
+    return pd.DataFrame({"data": [time * 10 for time in times], "dateTime": times})
+
+
+def get_file_names(local_drive, folder_id: str) -> list[str]:
+    return sorted(
+        file["name"]
+        for file in local_drive.list_files_in_shared_drive_folder(folder_id)
+    )
+
+
+def test_append_lists_the_single_file_view_as_first_segment(local_drive):
+    upload_parquet_file(
+        make_view_df([1, 2]), "view.parquet", "views", ["dateTime"], local_drive
+    )
+
+    segment_id = append_parquet_view_segment(
+        make_view_df([3]), "view.parquet", "views", ["dateTime"], local_drive
+    )
+
+    _, index = load_view_index("view.parquet", "views", local_drive)
+    assert index is not None
+    assert [segment["rows"] for segment in index["segments"]] == [2, 1]
+    assert index["segments"][0]["name"] == "view.parquet"
+    assert index["segments"][1]["id"] == segment_id
+    view_df = read_parquet_view("view.parquet", "views", drive_service=local_drive)
+    assert view_df is not None
+    assert view_df["dateTime"].tolist() == [1, 2, 3]
+
+
+def test_append_without_rows_uploads_nothing(local_drive):
+    assert (
+        append_parquet_view_segment(
+            make_view_df([]), "view.parquet", "views", ["dateTime"], local_drive
+        )
+        is None
+    )
+    assert get_file_names(local_drive, "views") == []
+
+
+def test_reads_keep_overlapping_rows_until_compacted(local_drive):
+    for times in ([1, 2], [2, 3]):
+        append_parquet_view_segment(
+            make_view_df(times), "view.parquet", "views", ["dateTime"], local_drive
+        )
+
+    view_df = read_parquet_view("view.parquet", "views", drive_service=local_drive)
+    assert view_df is not None
+    assert view_df["dateTime"].tolist() == [1, 2, 2, 3]
+
+
+def test_replace_trashes_the_previous_segments(local_drive):
+    for times in ([1], [2]):
+        append_parquet_view_segment(
+            make_view_df(times), "view.parquet", "views", ["dateTime"], local_drive
+        )
+    _, previous_index = load_view_index("view.parquet", "views", local_drive)
+    assert previous_index is not None
+
+    segment_id = replace_parquet_view_segments(
+        make_view_df([5, 4]), "view.parquet", "views", ["dateTime"], local_drive
+    )
+
+    _, index = load_view_index("view.parquet", "views", local_drive)
+    assert index is not None
+    assert [segment["id"] for segment in index["segments"]] == [segment_id]
+    file_names = get_file_names(local_drive, "views")
+    assert len(file_names) == 2
+    assert "view.index.json" in file_names
+    for segment in previous_index["segments"]:
+        assert segment["name"] not in file_names
+    view_df = read_parquet_view("view.parquet", "views", drive_service=local_drive)
+    assert view_df is not None
+    assert view_df["dateTime"].tolist() == [4, 5]
+
+
+def test_compact_merges_segments_into_one_deduplicated_segment(local_drive):
+    for times in ([1, 2], [2, 3], [3, 4]):
+        append_parquet_view_segment(
+            make_view_df(times), "view.parquet", "views", ["dateTime"], local_drive
+        )
+
+    segment_id = compact_parquet_view(
+        "view.parquet", "views", ["dateTime"], drive_service=local_drive
+    )
+
+    _, index = load_view_index("view.parquet", "views", local_drive)
+    assert index is not None
+    assert len(index["segments"]) == 1
+    assert index["segments"][0]["id"] == segment_id
+    assert index["segments"][0]["rows"] == 4
+    view_df = read_parquet_view("view.parquet", "views", drive_service=local_drive)
+    assert view_df is not None
+    pd.testing.assert_frame_equal(view_df, make_view_df([1, 2, 3, 4]))
+
+
+def test_compact_skips_views_with_few_segments(local_drive):
+    append_parquet_view_segment(
+        make_view_df([1]), "view.parquet", "views", ["dateTime"], local_drive
+    )
+
+    assert (
+        compact_parquet_view(
+            "view.parquet", "views", ["dateTime"], drive_service=local_drive
+        )
+        is None
+    )
+    _, index = load_view_index("view.parquet", "views", local_drive)
+    assert index is not None
+    assert len(index["segments"]) == 1
@@ -0,0 +1,35 @@
+import pandas as pd
+
+from data.reference_data import GeotabMapping
+
+
+def make_mapping(devices: list[str], buses: list[str]) -> GeotabMapping:
+    return GeotabMapping(pd.DataFrame({"Geotab Device": devices, "Bus #": buses}))
+
+
+def test_get_buses_maps_devices_and_leaves_missing_ones_nan():
+    mapping = make_mapping(["g1", "g2"], ["1001", "1002"])
+
+    buses = mapping.get_buses(pd.Series(["g2", "g3", "g1", "g2"]))
+
+    assert buses.astype(object).where(buses.notna(), None).tolist() == [
+        "1002",
+        None,
+        "1001",
+        "1002",
+    ]
+
+
+def test_duplicated_devices_keep_their_first_bus():
+    mapping = make_mapping(["g1", "g1"], ["1001", "1002"])
+
+    assert mapping.get_buses(pd.Series(["g1"])).tolist() == ["1001"]
+
+
+def test_empty_mapping_maps_no_device():
+    mapping = make_mapping([], [])
+
+    buses = mapping.get_buses(pd.Series(["g1", "g2"]))
+
+    assert buses.isna().all()
+    assert len(buses) == 2
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.rollups import (
+    compute_breakdown_rollup,
+    compute_metric_rollup,
+    load_rollup,
+    merge_breakdown_rollups,
+    merge_metric_rollups,
+    update_rollups,
+)
+from data.timestamps import epoch_seconds_to_eastern
+
+ROLLUP_COLUMNS = ["Bus #", "estPeriod", "count", "min", "max", "sum", "sum_sq"]
+
+
+def make_metric_df(rows: int, seed: int) -> pd.DataFrame:
+    generator = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "data": generator.integers(0, 3000, rows),
+            # a few days of readings, so some periods span both frames
+            "dateTime": 1_672_531_200 + generator.integers(0, 3 * 86_400, rows),
+            "Bus #": generator.choice(["1001", "1002", "1003"], rows),
+        }
+    )
+
+
+def sort_rollup(rollup_df: pd.DataFrame) -> pd.DataFrame:
+    return (
+        rollup_df.astype({"Bus #": str})
+        .sort_values(["Bus #", "estPeriod"])
+        .reset_index(drop=True)
+    )
+
+
+def test_merged_metric_rollups_equal_the_rollup_of_all_rows():
+    first_df, second_df = make_metric_df(500, 1), make_metric_df(300, 2)
+
+    for period in ("hourly", "daily"):
+        merged_df = sort_rollup(
+            merge_metric_rollups(
+                [
+                    compute_metric_rollup(first_df, period),
+                    compute_metric_rollup(second_df, period),
+                ]
+            )
+        )
+        expected_df = sort_rollup(
+            compute_metric_rollup(pd.concat([first_df, second_df]), period)
+        )
+
+        pd.testing.assert_frame_equal(
+            merged_df[ROLLUP_COLUMNS], expected_df[ROLLUP_COLUMNS]
+        )
+        np.testing.assert_allclose(merged_df["mean"], expected_df["mean"])
+        np.testing.assert_allclose(merged_df["std"], expected_df["std"])
+
+
+def test_metric_rollup_std_matches_pandas():
+    metric_df = make_metric_df(400, 3)
+
+    rollup_df = sort_rollup(compute_metric_rollup(metric_df, "daily"))
+    expected = (
+        metric_df.assign(
+            estPeriod=epoch_seconds_to_eastern(metric_df["dateTime"]).dt.floor("D")
+        )
+        .groupby(["Bus #", "estPeriod"])["data"]
+        .std()
+    )
+
+    np.testing.assert_allclose(rollup_df["std"], expected.to_numpy())
+
+
+def test_merged_breakdown_rollups_equal_the_rollup_of_all_breakdowns():
+    first_df = pd.DataFrame(
+        # January 1st and February 1st at noon, US/Eastern
+        {"reportedAt": [1_672_592_400, 1_675_270_800], "Bus #": ["1001", "1002"]}
+    )
+    second_df = pd.DataFrame({"reportedAt": [1_672_617_600], "Bus #": ["1001"]})
+
+    merged_df = sort_rollup(
+        merge_breakdown_rollups(
+            [compute_breakdown_rollup(first_df), compute_breakdown_rollup(second_df)]
+        )
+    )
+
+    pd.testing.assert_frame_equal(
+        merged_df,
+        sort_rollup(compute_breakdown_rollup(pd.concat([first_df, second_df]))),
+    )
+    assert merged_df["count"].tolist() == [2, 1]
+
+
+def test_update_rollups_raises_when_the_upload_fails(local_drive, monkeypatch):
+    monkeypatch.setattr(local_drive, "upload_file", lambda **kwargs: None)
+
+    with pytest.raises(ValueError):
+        update_rollups(
+            "rpm_view_data.parquet",
+            "folder",
+            ("daily",),
+            make_metric_df(10, 4),
+            compute_metric_rollup,
+            merge_metric_rollups,
+            get_view_df=lambda: None,
+            overwrite=True,
+            drive_service=local_drive,
+        )
+
+
+def test_update_rollups_merges_the_added_rows(local_drive):
+    first_df, second_df = make_metric_df(50, 5), make_metric_df(20, 6)
+    for added_df, overwrite in [(first_df, True), (second_df, False)]:
+        update_rollups(
+            "rpm_view_data.parquet",
+            "folder",
+            ("daily",),
+            added_df,
+            compute_metric_rollup,
+            merge_metric_rollups,
+            get_view_df=lambda: None,
+            overwrite=overwrite,
+            drive_service=local_drive,
+        )
+
+    rollup_df = load_rollup("rpm_view_data.parquet", "folder", "daily", local_drive)
+
+    assert rollup_df is not None and rollup_df["count"].sum() == 70
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.row_hash_index import (
+    RowHashIndex,
+    get_canonical_row_hashes,
+    get_row_hash_index_name,
+    load_row_hash_index,
+    save_row_hash_index,
+)
+from data.utilities import find_file_id_by_name
+
+
+def make_view_df(times: list[int], buses: list[str]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "data": np.arange(len(times), dtype=np.int64) * 100,
+            "dateTime": np.array(times, dtype=np.int64),
+            "Bus #": buses,
+        }
+    )
+
+
+def test_drop_seen_rows_keeps_first_occurrence_in_order():
+    row_hash_index = RowHashIndex()
+    df = pd.DataFrame({"data": [3, 1, 3, 2], "Bus #": ["a", "b", "a", "c"]})
+
+    added_df = row_hash_index.drop_seen_rows(df)
+
+    assert added_df.index.tolist() == [0, 1, 3]
+    assert len(row_hash_index) == 3
+
+
+def test_drop_seen_rows_drops_rows_of_previous_runs():
+    row_hash_index = RowHashIndex()
+    first_run_df = make_view_df([1, 2, 3], ["a", "a", "b"])
+    row_hash_index.drop_seen_rows(first_run_df)
+
+    second_run_df = pd.concat([first_run_df.iloc[1:], make_view_df([4], ["c"])])
+    added_df = row_hash_index.drop_seen_rows(second_run_df)
+
+    assert added_df["dateTime"].tolist() == [4]
+    assert len(row_hash_index) == 4
+    assert row_hash_index.drop_seen_rows(second_run_df).empty
+
+
+def test_drop_seen_rows_after_clear_keeps_every_row():
+    row_hash_index = RowHashIndex()
+    df = make_view_df([1, 2], ["a", "b"])
+    row_hash_index.drop_seen_rows(df)
+
+    row_hash_index.clear()
+
+    assert len(row_hash_index.drop_seen_rows(df)) == 2
+
+
+def test_drop_seen_rows_only_hashes_the_identifying_columns():
+    row_hash_index = RowHashIndex()
+    df = pd.DataFrame({"description": ["flat tire"], "keywords": ["flat"]})
+    row_hash_index.drop_seen_rows(df, ["description"])
+
+    added_df = row_hash_index.drop_seen_rows(df.assign(keywords=""), ["description"])
+
+    assert added_df.empty
+
+
+def test_hashes_do_not_depend_on_downcast_dtypes():
+    df = make_view_df([1_700_000_000, 1_700_000_060], ["a", "b"])
+    downcast_df = df.astype({"data": np.int16, "dateTime": np.int32})
+
+    assert np.array_equal(
+        get_canonical_row_hashes(df), get_canonical_row_hashes(downcast_df)
+    )
+    assert np.array_equal(
+        get_canonical_row_hashes(df.astype({"data": np.float64})),
+        get_canonical_row_hashes(df.astype({"data": np.float32})),
+    )
+
+
+def test_hashes_do_not_depend_on_column_order():
+    df = make_view_df([1, 2], ["a", "b"])
+
+    assert np.array_equal(
+        get_canonical_row_hashes(df),
+        get_canonical_row_hashes(df[["Bus #", "dateTime", "data"]]),
+    )
+
+
+def test_hashes_differ_between_rows():
+    hashes = get_canonical_row_hashes(make_view_df([1, 2, 3], ["a", "a", "a"]))
+
+    assert len(np.unique(hashes)) == 3
+
+
+def test_load_row_hash_index_bootstraps_from_the_view(local_drive):
+    view_df = make_view_df([1, 2, 3], ["a", "b", "b"])
+
+    index_id, row_hash_index = load_row_hash_index(
+        "view.parquet", "folder", lambda: view_df, local_drive
+    )
+
+    assert index_id is None
+    assert len(row_hash_index) == 3
+    assert row_hash_index.drop_seen_rows(view_df).empty
+
+
+def test_load_row_hash_index_starts_empty_without_a_view(local_drive):
+    index_id, row_hash_index = load_row_hash_index(
+        "view.parquet", "folder", lambda: None, local_drive
+    )
+
+    assert index_id is None
+    assert len(row_hash_index) == 0
+
+
+def test_saved_row_hash_index_is_loaded_instead_of_the_view(local_drive):
+    view_df = make_view_df([1, 2], ["a", "b"])
+    _, row_hash_index = load_row_hash_index(
+        "view.parquet", "folder", lambda: view_df, local_drive
+    )
+    row_hash_index.drop_seen_rows(make_view_df([5], ["c"]))
+    saved_id = save_row_hash_index(
+        "view.parquet", "folder", row_hash_index, drive_service=local_drive
+    )
+
+    def get_view_df():
+        raise AssertionError("the view is only read when there is no index")
+
+    index_id, loaded_index = load_row_hash_index(
+        "view.parquet", "folder", get_view_df, local_drive
+    )
+
+    assert index_id == saved_id
+    assert np.array_equal(loaded_index.hashes, row_hash_index.hashes)
+    assert (
+        save_row_hash_index(
+            "view.parquet", "folder", loaded_index, index_id, local_drive
+        )
+        == index_id
+    )
+    assert (
+        find_file_id_by_name(
+            "folder", get_row_hash_index_name("view.parquet"), local_drive
+        )
+        == index_id
+    )
+
+
+def test_save_row_hash_index_raises_when_the_upload_fails(local_drive, monkeypatch):
+    monkeypatch.setattr(local_drive, "upload_file", lambda **kwargs: None)
+
+    with pytest.raises(ValueError):
+        save_row_hash_index("view.parquet", "folder", RowHashIndex(), None, local_drive)
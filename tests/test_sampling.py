@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from data.sampling import HashSample, get_sample_mask, sample_dataframe
+
+SAMPLE = HashSample(0.5, seed=1)
+
+
+def make_keys_df(rows: int = 1000) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Bus #": [str(1000 + row % 7) for row in range(rows)],
+            "dateTime": np.arange(rows, dtype=np.int64) + 1_600_000_000,
+        }
+    )
+
+
+def test_sample_keeps_about_the_fraction_of_rows():
+    mask = get_sample_mask(make_keys_df(), SAMPLE)
+
+    assert 400 < mask.sum() < 600
+
+
+def test_sample_is_the_same_for_float_keys_and_other_columns():
+    keys_df = make_keys_df()
+    float_keys_df = keys_df.assign(dateTime=keys_df["dateTime"].astype(float))
+
+    assert np.array_equal(
+        get_sample_mask(keys_df, SAMPLE),
+        get_sample_mask(
+            float_keys_df.assign(data=1)[["data", "dateTime", "Bus #"]], SAMPLE
+        ),
+    )
+
+
+def test_sample_does_not_depend_on_the_chunk_a_row_is_in():
+    keys_df = make_keys_df()
+
+    assert np.array_equal(
+        get_sample_mask(keys_df, SAMPLE),
+        np.concatenate(
+            [
+                get_sample_mask(keys_df.iloc[:300], SAMPLE),
+                get_sample_mask(keys_df.iloc[300:], SAMPLE),
+            ]
+        ),
+    )
+
+
+def test_seeds_pick_different_rows():
+    keys_df = make_keys_df()
+
+    assert not np.array_equal(
+        get_sample_mask(keys_df, SAMPLE), get_sample_mask(keys_df, HashSample(0.5, 2))
+    )
+
+
+def test_rows_missing_a_key_are_left_out():
+    keys_df = make_keys_df().astype({"dateTime": float})
+    keys_df.loc[[0, 5], "dateTime"] = np.nan
+
+    mask = get_sample_mask(keys_df, HashSample(0.999))
+
+    assert not mask[[0, 5]].any()
+    assert np.array_equal(
+        mask[1:5], get_sample_mask(make_keys_df().iloc[1:5], HashSample(0.999))
+    )
+
+
+def test_full_fraction_keeps_every_row():
+    keys_df = make_keys_df(10)
+
+    assert len(sample_dataframe(keys_df, HashSample(1))) == 10
@@ -0,0 +1,92 @@
+import pandas as pd
+import pytest
+
+from shared_datasets import SharedDataset
+
+
+@pytest.fixture(autouse=True)
+def copy_on_write():
+    # the dashboard entry points turn copy on write on, see serve.py
+    with pd.option_context("mode.copy_on_write", True):
+        yield
+
+
+class FakeView:
+    """A view whose version and rows can be changed, and whose reads can fail"""
+
+    def __init__(self):
+        self.version = "v1"
+        self.rows = [1, 2, 3]
+        self.failing = False
+        self.reads = 0
+
+    def get_version(self) -> str:
+        return self.version
+
+    def read(self) -> pd.DataFrame:
+        if self.failing:
+            raise OSError("drive is unavailable")
+        self.reads += 1
+        return pd.DataFrame({"data": self.rows})
+
+
+def make_datasets(view: FakeView) -> tuple[SharedDataset, SharedDataset]:
+    base = SharedDataset(view.read, view.get_version)
+
+    def load_doubled() -> pd.DataFrame:
+        return base().assign(data=lambda df: df["data"] * 2)
+
+    return base, SharedDataset(load_doubled, view.get_version)
+
+
+def test_loaded_once_and_shared():
+    view = FakeView()
+    base, _ = make_datasets(view)
+
+    df = base()
+    df["data"] = 0
+    df.loc[0, "data"] = 5
+
+    assert df["data"].tolist() == [5, 0, 0]
+    assert base()["data"].tolist() == [1, 2, 3]
+    assert view.reads == 1
+    assert base.is_loaded()
+
+
+def test_refresh_swaps_in_the_new_version():
+    view = FakeView()
+    base, derived = make_datasets(view)
+    derived()
+    view.version, view.rows = "v2", [4]
+
+    base.refresh(view.version)
+    derived.refresh(view.version)
+
+    assert base()["data"].tolist() == [4]
+    assert derived()["data"].tolist() == [8]
+
+
+def test_failed_refresh_keeps_the_loaded_version():
+    view = FakeView()
+    base, _ = make_datasets(view)
+    base()
+    view.version, view.failing = "v2", True
+
+    base.refresh(view.version)
+
+    assert base()["data"].tolist() == [1, 2, 3]
+
+
+def test_derived_dataset_of_a_failed_refresh_is_refreshed_again():
+    view = FakeView()
+    base, derived = make_datasets(view)
+    derived()
+    view.version, view.rows, view.failing = "v2", [4], True
+
+    base.refresh(view.version)
+    derived.refresh(view.version)
+    view.failing = False
+    base.refresh(view.version)
+    derived.refresh(view.version)
+
+    assert derived()["data"].tolist() == [8]
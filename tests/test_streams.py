@@ -0,0 +1,73 @@
+import gc
+import io
+import os
+
+import httplib2
+import pytest
+
+from connnections.file_cache import DriveFileCache
+from connnections.streams import DriveDownloadStream
+
+CONTENT = b"0123456789" * 10
+
+
+class FakeHttp:
+    """Serves the byte ranges of CONTENT like the drive get_media endpoint"""
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        start, end = map(int, headers["range"].split("=")[1].split("-"))
+        end = min(end, len(CONTENT) - 1)
+        response = httplib2.Response(
+            {
+                "status": 206,
+                "content-range": f"bytes {start}-{end}/{len(CONTENT)}",
+            }
+        )
+        return response, CONTENT[start : end + 1]
+
+
+class FakeRequest:
+    def __init__(self):
+        self.http = FakeHttp()
+        self.uri = "https://drive.test/file"
+        self.headers = {}
+
+
+@pytest.fixture
+def file_cache(tmp_path) -> DriveFileCache:
+    return DriveFileCache(str(tmp_path), 10**6)
+
+
+def open_stream(file_cache: DriveFileCache) -> DriveDownloadStream:
+    return DriveDownloadStream(
+        "file", FakeRequest(), 16, file_cache, "file-0123456789abcdef"
+    )
+
+
+def test_fully_read_download_is_committed_to_the_cache(file_cache):
+    with io.BufferedReader(open_stream(file_cache)) as stream:
+        assert stream.read() == CONTENT
+
+    cached_file = file_cache.open("file-0123456789abcdef")
+    assert cached_file is not None and cached_file.read() == CONTENT
+    cached_file.close()
+    assert not [
+        name for name in os.listdir(file_cache.cache_dir) if name.endswith(".tmp")
+    ]
+
+
+def test_partly_read_download_leaves_no_temporary_file(file_cache):
+    with io.BufferedReader(open_stream(file_cache), buffer_size=16) as stream:
+        stream.read(20)
+
+    assert os.listdir(file_cache.cache_dir) == []
+
+
+def test_abandoned_download_leaves_no_temporary_file(file_cache):
+    stream = open_stream(file_cache)
+    assert len(os.listdir(file_cache.cache_dir)) == 1
+
+    del stream
+    gc.collect()
+
+    assert os.listdir(file_cache.cache_dir) == []
@@ -0,0 +1,83 @@
+import pandas as pd
+import pytest
+
+from data.timestamps import (
+    epoch_seconds_to_eastern,
+    get_epoch_seconds,
+    to_epoch_seconds,
+    upgrade_legacy_breakdown_view,
+    upgrade_legacy_metric_view,
+)
+
+# 2023-01-01 05:00:00 UTC, midnight in US/Eastern
+NEW_YEAR = 1_672_549_200
+
+
+def test_to_epoch_seconds_ignores_the_timezone():
+    utc = pd.Series(pd.to_datetime(["2023-01-01 05:00:00"], utc=True))
+
+    assert to_epoch_seconds(utc).tolist() == [NEW_YEAR]
+    assert to_epoch_seconds(utc.dt.tz_convert("US/Eastern")).tolist() == [NEW_YEAR]
+
+
+def test_to_epoch_seconds_raises_on_nat():
+    datetimes = pd.Series(pd.to_datetime(["2023-01-01 05:00:00", None], utc=True))
+
+    with pytest.raises(ValueError):
+        to_epoch_seconds(datetimes)
+
+
+def test_epoch_seconds_round_trip_to_eastern_wall_clock_time():
+    assert epoch_seconds_to_eastern(pd.Series([NEW_YEAR])).tolist() == [
+        pd.Timestamp("2023-01-01 00:00:00")
+    ]
+
+
+def test_get_epoch_seconds_keeps_numbers():
+    assert get_epoch_seconds(pd.Series([NEW_YEAR, NEW_YEAR + 1.0])).tolist() == [
+        NEW_YEAR,
+        NEW_YEAR + 1,
+    ]
+
+
+def test_get_epoch_seconds_parses_legacy_strings_mixed_with_numbers():
+    timestamps = pd.Series(
+        ["2023-01-01 05:00:00+0000", str(NEW_YEAR + 60), "2023-01-01 00:00:01-0500"]
+    )
+
+    assert get_epoch_seconds(timestamps).tolist() == [
+        NEW_YEAR,
+        NEW_YEAR + 60,
+        NEW_YEAR + 1,
+    ]
+
+
+def test_get_epoch_seconds_parses_legacy_strings_of_other_formats():
+    timestamps = pd.Series(["2023-01-01T05:00:00Z", "2023-01-01 05:00:00+0000"])
+
+    assert get_epoch_seconds(timestamps).tolist() == [NEW_YEAR, NEW_YEAR]
+
+
+def test_upgrade_legacy_view_drops_the_display_column():
+    legacy_df = pd.DataFrame(
+        {
+            "data": [1],
+            "dateTime": ["2023-01-01 05:00:00+0000"],
+            "estDateTime": ["2023-01-01 00:00:00-0500"],
+            "Bus #": ["1001"],
+        }
+    )
+
+    view_df = upgrade_legacy_metric_view(legacy_df)
+
+    assert view_df.columns.tolist() == ["data", "dateTime", "Bus #"]
+    assert view_df["dateTime"].tolist() == [NEW_YEAR]
+    assert view_df["dateTime"].dtype == "int64"
+
+
+def test_upgrade_legacy_view_keeps_views_already_upgraded():
+    view_df = pd.DataFrame({"reportedAt": [NEW_YEAR], "Bus #": ["1001"]})
+
+    upgraded_df = upgrade_legacy_breakdown_view(view_df)
+
+    pd.testing.assert_frame_equal(upgraded_df, view_df)
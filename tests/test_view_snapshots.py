@@ -0,0 +1,116 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from data.view_snapshots import (
+    get_changed_rows,
+    load_snapshot_index,
+    restore_view_snapshot,
+    save_view_snapshot,
+)
+
+
+def make_view_df(times: list[int]) -> pd.DataFrame:
+    return pd.DataFrame({"data": [time * 10 for time in times], "dateTime": times})
+
+
+def test_restore_replays_the_deltas_on_the_base(local_drive):
+    base_df = make_view_df([1, 2, 3])
+    save_view_snapshot(
+        "view",
+        "snapshots",
+        base_df,
+        get_view_df=lambda: base_df,
+        full=True,
+        drive_service=local_drive,
+    )
+    view_df = make_view_df([2, 3, 4, 5])
+    added_df, removed_df = get_changed_rows(base_df, view_df)
+    save_view_snapshot(
+        "view", "snapshots", added_df, removed_df, drive_service=local_drive
+    )
+
+    restored_df = restore_view_snapshot("view", "snapshots", drive_service=local_drive)
+
+    _, index = load_snapshot_index("view", "snapshots", local_drive)
+    assert [snapshot["kind"] for snapshot in index["snapshots"]] == ["base", "delta"]
+    assert restored_df is not None
+    assert sorted(restored_df["dateTime"]) == [2, 3, 4, 5]
+    pd.testing.assert_frame_equal(
+        restored_df.sort_values("dateTime").reset_index(drop=True), view_df
+    )
+
+
+def test_restore_until_ignores_later_snapshots(local_drive):
+    base_df = make_view_df([1])
+    save_view_snapshot(
+        "view",
+        "snapshots",
+        base_df,
+        get_view_df=lambda: base_df,
+        full=True,
+        drive_service=local_drive,
+    )
+    _, index = load_snapshot_index("view", "snapshots", local_drive)
+    base_created = datetime.fromisoformat(index["snapshots"][0]["created"])
+    save_view_snapshot(
+        "view", "snapshots", make_view_df([2]), drive_service=local_drive
+    )
+
+    restored_df = restore_view_snapshot(
+        "view", "snapshots", until=base_created, drive_service=local_drive
+    )
+
+    assert restored_df is not None and restored_df["dateTime"].tolist() == [1]
+
+
+def test_first_snapshot_is_a_base_and_empty_changes_are_not_recorded(local_drive):
+    view_df = make_view_df([1, 2])
+
+    save_view_snapshot(
+        "view",
+        "snapshots",
+        view_df.iloc[1:],
+        get_view_df=lambda: view_df,
+        drive_service=local_drive,
+    )
+    assert (
+        save_view_snapshot(
+            "view", "snapshots", view_df.iloc[:0], drive_service=local_drive
+        )
+        is None
+    )
+
+    _, index = load_snapshot_index("view", "snapshots", local_drive)
+    assert [snapshot["kind"] for snapshot in index["snapshots"]] == ["base"]
+    assert index["snapshots"][0]["rows"] == 2
+
+
+def test_restore_without_a_base_returns_none(local_drive):
+    save_view_snapshot(
+        "view", "snapshots", make_view_df([1]), drive_service=local_drive
+    )
+
+    assert restore_view_snapshot("view", "snapshots", drive_service=local_drive) is None
+
+
+def test_failed_snapshot_index_upload_raises(local_drive, monkeypatch):
+    upload_file = local_drive.upload_file
+
+    def fail_index_upload(**kwargs):
+        if kwargs["filename"].endswith(".json"):
+            return None
+        return upload_file(**kwargs)
+
+    monkeypatch.setattr(local_drive, "upload_file", fail_index_upload)
+
+    with pytest.raises(ValueError):
+        save_view_snapshot(
+            "view",
+            "snapshots",
+            make_view_df([1]),
+            full=True,
+            get_view_df=lambda: make_view_df([1]),
+            drive_service=local_drive,
+        )
@@ -1,12 +1,22 @@
 import random
 
+import pandas as pd
 import streamlit as st
 
+from streamlit_utilities import DASHBOARD_WARMUP
+
 st.set_page_config(
     page_title="Hello",
     page_icon="👋",
 )
 
+# the datasets are shared by every session, see SharedDataset.  With copy on write a
+# frame derived from them only copies the columns it changes
+pd.set_option("mode.copy_on_write", True)
+# when the server was started with streamlit run rather than serve.py, the views are
+# loaded in the background from the first visit on
+DASHBOARD_WARMUP.start()
+
 st.write("# Welcome to the NYCSBUS Visualization platform! 👋")
 
 st.sidebar.success("Select a demo above.")